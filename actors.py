@@ -0,0 +1,427 @@
+"""
+The actors module contains the ActorStore class, which keeps the state of
+many riders and drivers in typed arrays, and the StoredRider and
+StoredDriver classes, which behave as Riders and Drivers but keep their
+attributes in an ActorStore.
+
+A stored actor is a thin view: it only knows its store and its index in
+it, and a driver the dispatcher it is registered with. The views share
+the behaviour of Rider and Driver through BaseRider and BaseDriver, which
+have no slots, so a view is smaller than a plain actor. Everything else is read from, and written to, the store's arrays, which
+take about 30 bytes per actor. Views can be made when an actor's events are
+made and dropped once they have run, so the store is what stays resident.
+Stored actors behave exactly like plain ones, so events never need to know
+which kind they were given.
+"""
+from array import array
+
+from driver import BaseDriver
+from location import intern_location
+from rider import BaseRider, WAITING, CANCELLED, SATISFIED
+
+# Rider statuses, in the order of their codes in ActorStore
+_STATUSES = (WAITING, CANCELLED, SATISFIED)
+_STATUS_CODES = {status: code for code, status in enumerate(_STATUSES)}
+
+# Driver idle states, in the order of their codes in ActorStore
+_IDLE_STATES = (None, True, False)
+
+# The value stored for a rider that has not made a request yet
+_NO_TIME = -1
+
+# The NumPy type matching each array typecode used in ActorStore
+_NUMPY_TYPES = {"b": "int8", "i": "int32", "q": "int64"}
+
+
+class ActorStore:
+    """ Typed array storage for riders and drivers.
+    Riders and drivers are numbered separately, from 0, in the order they
+    are added.
+    === Private Attributes ===
+    @type _rider_ids: list[str]
+        The identifier of each rider.
+    @type _rider_coordinates: array
+        The origin row, origin column, destination row and destination
+        column of each rider, four entries per rider.
+    @type _patience: array
+        The patience of each rider.
+    @type _status: array
+        The status code of each rider.
+    @type _initial: array
+        The request time of each rider, or _NO_TIME.
+    @type _driver_ids: list[str]
+        The identifier of each driver.
+    @type _driver_coordinates: array
+        The row and column of each driver, two entries per driver.
+    @type _speed: array
+        The speed of each driver.
+    @type _idle: array
+        The idle state code of each driver.
+    """
+
+    def __init__(self):
+        """ Initialize an empty ActorStore.
+        @type self: ActorStore
+        @rtype: None
+        """
+        self._rider_ids = []
+        self._rider_coordinates = array("i")
+        self._patience = array("i")
+        self._status = array("b")
+        self._initial = array("q")
+        self._driver_ids = []
+        self._driver_coordinates = array("i")
+        self._speed = array("i")
+        self._idle = array("b")
+
+    def __str__(self):
+        """ Return a string representation.
+        @type self: ActorStore
+        @rtype: str
+        >>> print(ActorStore())
+        ActorStore (0 drivers, 0 riders)
+        """
+        return "ActorStore ({} drivers, {} riders)".format(
+            len(self._driver_ids), len(self._rider_ids))
+
+    def add_rider(self, identifier, origin, destination, patience):
+        """ Add a waiting rider and return a view of it.
+        @type self: ActorStore
+        @type identifier: str
+        @type origin: Location
+        @type destination: Location
+        @type patience: int
+        @rtype: StoredRider
+        >>> from location import Location
+        >>> store = ActorStore()
+        >>> rider = store.add_rider("Jorge", Location(1, 1), Location(1, 2),
+        ...                         14)
+        >>> print(rider.destination, rider.status, rider.initial)
+        (1,2) waiting None
+        """
+        self._rider_ids.append(identifier)
+        self._rider_coordinates.extend(origin.location + destination.location)
+        self._patience.append(patience)
+        self._status.append(_STATUS_CODES[WAITING])
+        self._initial.append(_NO_TIME)
+        return StoredRider(self, len(self._rider_ids) - 1)
+
+    def add_driver(self, identifier, location, speed):
+        """ Add an unregistered driver and return a view of it.
+        @type self: ActorStore
+        @type identifier: str
+        @type location: Location
+        @type speed: int
+        @rtype: StoredDriver
+        >>> from location import Location
+        >>> store = ActorStore()
+        >>> driver = store.add_driver("Tom", Location(5, 6), 2)
+        >>> driver.get_travel_time(Location(2, 2))
+        4
+        >>> driver.start_drive(Location(5, 4))
+        1
+        >>> driver.is_idle
+        False
+        """
+        self._driver_ids.append(identifier)
+        self._driver_coordinates.extend(location.location)
+        self._speed.append(speed)
+        self._idle.append(0)
+        return StoredDriver(self, len(self._driver_ids) - 1)
+
+    def add_riders(self, identifiers, coordinates, patience):
+        """ Add waiting riders in bulk and return the number of the first.
+        Views of the new riders are made with StoredRider.
+        @type self: ActorStore
+        @type identifiers: list[str]
+        @type coordinates: list[int] | numpy.ndarray
+            The origin row, origin column, destination row and destination
+            column of each rider, four entries per rider.
+        @type patience: list[int] | numpy.ndarray
+        @rtype: int
+        >>> store = ActorStore()
+        >>> first = store.add_riders(["Jorge", "James"],
+        ...                          [1, 1, 1, 2, 2, 3, 4, 4], [14, 5])
+        >>> print(StoredRider(store, first + 1).destination)
+        (4,4)
+        """
+        first = len(self._rider_ids)
+        self._rider_ids.extend(identifiers)
+        extend_column(self._rider_coordinates, coordinates)
+        extend_column(self._patience, patience)
+        self._status.extend([_STATUS_CODES[WAITING]] * len(identifiers))
+        self._initial.extend([_NO_TIME] * len(identifiers))
+        return first
+
+    def add_drivers(self, identifiers, coordinates, speeds):
+        """ Add unregistered drivers in bulk and return the number of the
+        first. Views of the new drivers are made with StoredDriver.
+        @type self: ActorStore
+        @type identifiers: list[str]
+        @type coordinates: list[int] | numpy.ndarray
+            The row and column of each driver, two entries per driver.
+        @type speeds: list[int] | numpy.ndarray
+        @rtype: int
+        >>> store = ActorStore()
+        >>> first = store.add_drivers(["Tom"], [5, 6], [2])
+        >>> StoredDriver(store, first).speed
+        2
+        """
+        first = len(self._driver_ids)
+        self._driver_ids.extend(identifiers)
+        extend_column(self._driver_coordinates, coordinates)
+        extend_column(self._speed, speeds)
+        self._idle.extend([0] * len(identifiers))
+        return first
+
+    @classmethod
+    def from_columns(cls, rider_ids, rider_coordinates, patience,
+                     driver_ids, driver_coordinates, speeds):
+        """ Return a store of waiting riders and unregistered drivers built
+        from whole columns, laid out as in add_riders and add_drivers.
+        The columns that never change while a simulation runs are used as
+        given, without copying, so they may be read-only buffers such as
+        memoryviews. Such a store cannot have actors added to it.
+        @type rider_ids: list[str]
+        @type rider_coordinates: array | memoryview
+        @type patience: array | memoryview
+        @type driver_ids: list[str]
+        @type driver_coordinates: array | memoryview
+        @type speeds: array | memoryview
+        @rtype: ActorStore
+        >>> store = ActorStore.from_columns(
+        ...     ["Jorge"], array("i", [1, 1, 2, 2]), array("i", [5]),
+        ...     [], array("i"), array("i"))
+        >>> print(store)
+        ActorStore (0 drivers, 1 riders)
+        """
+        store = cls()
+        store._rider_ids = rider_ids
+        store._rider_coordinates = rider_coordinates
+        store._patience = patience
+        store._status = array("b", [_STATUS_CODES[WAITING]]) * len(rider_ids)
+        store._initial = array("q", [_NO_TIME]) * len(rider_ids)
+        store._driver_ids = driver_ids
+        # Drivers move, so their coordinates must be a writable copy
+        store._driver_coordinates = array("i", driver_coordinates)
+        store._speed = speeds
+        store._idle = array("b", [0]) * len(driver_ids)
+        return store
+
+    def columns(self):
+        """ Return the columns describing the riders and drivers, in the
+        order taken by from_columns. Driver coordinates are the drivers'
+        current locations. Rider statuses and request times, and driver
+        states, are not included.
+        @type self: ActorStore
+        @rtype: tuple
+        """
+        return (self._rider_ids, self._rider_coordinates, self._patience,
+                self._driver_ids, self._driver_coordinates, self._speed)
+
+
+def extend_column(column, values):
+    """ Append <values> to the typed array <column>. NumPy arrays are
+    copied in as raw memory rather than one value at a time.
+    @type column: array
+    @type values: list[int] | numpy.ndarray
+    @rtype: None
+    """
+    if hasattr(values, "astype"):
+        column.frombytes(values.astype(_NUMPY_TYPES[column.typecode])
+                         .tobytes())
+    else:
+        column.extend(values)
+
+
+class StoredRider(BaseRider):
+    """ A Rider whose attributes are kept in an ActorStore.
+    === Private Attributes ===
+    @type _store: ActorStore
+        The store holding this rider.
+    @type _index: int
+        This rider's number in the store.
+    """
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index):
+        """ Initialize a view of rider number <index> in <store>.
+        @type self: StoredRider
+        @type store: ActorStore
+        @type index: int
+        @rtype: None
+        """
+        self._store, self._index = store, index
+
+    def __reduce__(self):
+        """ Return how to pickle <self>: as a view of the same rider of the
+        pickled store.
+        @type self: StoredRider
+        @rtype: tuple
+        >>> import pickle
+        >>> from location import Location
+        >>> store = ActorStore()
+        >>> rider = store.add_rider("Jorge", Location(1, 1), Location(2, 2), 5)
+        >>> print(pickle.loads(pickle.dumps(rider)).destination)
+        (2,2)
+        """
+        return StoredRider, (self._store, self._index)
+
+    @property
+    def id(self):
+        """ Return the rider's identifier.
+        @type self: StoredRider
+        @rtype: str
+        """
+        return self._store._rider_ids[self._index]
+
+    @property
+    def origin(self):
+        """ Return the rider's origin.
+        @type self: StoredRider
+        @rtype: Location
+        """
+        coordinates = self._store._rider_coordinates
+        return intern_location(coordinates[4 * self._index],
+                               coordinates[4 * self._index + 1])
+
+    @property
+    def destination(self):
+        """ Return the rider's destination.
+        @type self: StoredRider
+        @rtype: Location
+        """
+        coordinates = self._store._rider_coordinates
+        return intern_location(coordinates[4 * self._index + 2],
+                               coordinates[4 * self._index + 3])
+
+    @property
+    def patience(self):
+        """ Return the rider's patience.
+        @type self: StoredRider
+        @rtype: int
+        """
+        return self._store._patience[self._index]
+
+    @property
+    def status(self):
+        """ Return the rider's status.
+        @type self: StoredRider
+        @rtype: str
+        """
+        return _STATUSES[self._store._status[self._index]]
+
+    @status.setter
+    def status(self, value):
+        """ Set the rider's status.
+        @type self: StoredRider
+        @type value: str
+        @rtype: None
+        """
+        self._store._status[self._index] = _STATUS_CODES[value]
+
+    @property
+    def initial(self):
+        """ Return the time of the rider's request, or None.
+        @type self: StoredRider
+        @rtype: int | None
+        """
+        initial = self._store._initial[self._index]
+        return None if initial == _NO_TIME else initial
+
+    @initial.setter
+    def initial(self, value):
+        """ Set the time of the rider's request.
+        @type self: StoredRider
+        @type value: int | None
+        @rtype: None
+        """
+        self._store._initial[self._index] = \
+            _NO_TIME if value is None else value
+
+
+class StoredDriver(BaseDriver):
+    """ A Driver whose attributes are kept in an ActorStore.
+    The dispatcher a driver registers with is kept on the view itself.
+    === Private Attributes ===
+    @type _store: ActorStore
+        The store holding this driver.
+    @type _index: int
+        This driver's number in the store.
+    @type _dispatcher: Dispatcher | None
+        The dispatcher the driver is registered with.
+    """
+    __slots__ = ("_store", "_index", "_dispatcher")
+
+    def __init__(self, store, index):
+        """ Initialize a view of driver number <index> in <store>.
+        @type self: StoredDriver
+        @type store: ActorStore
+        @type index: int
+        @rtype: None
+        """
+        self._store, self._index = store, index
+        self._dispatcher = None
+
+    def __reduce__(self):
+        """ Return how to pickle <self>: as a view of the same driver of
+        the pickled store, registered with the same dispatcher.
+        @type self: StoredDriver
+        @rtype: tuple
+        """
+        return (StoredDriver, (self._store, self._index),
+                (None, {"_dispatcher": self._dispatcher}))
+
+    @property
+    def id(self):
+        """ Return the driver's identifier.
+        @type self: StoredDriver
+        @rtype: str
+        """
+        return self._store._driver_ids[self._index]
+
+    @property
+    def location(self):
+        """ Return the driver's current location.
+        @type self: StoredDriver
+        @rtype: Location
+        """
+        coordinates = self._store._driver_coordinates
+        return intern_location(coordinates[2 * self._index],
+                               coordinates[2 * self._index + 1])
+
+    @location.setter
+    def location(self, value):
+        """ Set the driver's current location.
+        @type self: StoredDriver
+        @type value: Location
+        @rtype: None
+        """
+        coordinates = self._store._driver_coordinates
+        coordinates[2 * self._index], coordinates[2 * self._index + 1] = \
+            value.location
+
+    @property
+    def speed(self):
+        """ Return the driver's speed.
+        @type self: StoredDriver
+        @rtype: int
+        """
+        return self._store._speed[self._index]
+
+    @property
+    def _is_idle(self):
+        """ Return the value behind is_idle.
+        @type self: StoredDriver
+        @rtype: bool | None
+        """
+        return _IDLE_STATES[self._store._idle[self._index]]
+
+    @_is_idle.setter
+    def _is_idle(self, value):
+        """ Set the value behind is_idle.
+        @type self: StoredDriver
+        @type value: bool | None
+        @rtype: None
+        """
+        self._store._idle[self._index] = _IDLE_STATES.index(value)
@@ -0,0 +1,461 @@
+"""
+The benchmark module times the parts of the simulation that its running
+time depends on, on synthetic traces of growing size, so that the results
+of two commits can be compared.
+
+Each benchmark is given a size n and the text trace of n requests that a
+Workload of that size generates (see workload_for), and times:
+    queue: adding n Events with random timestamps to a PriorityQueue, then
+        removing them all. An operation is an add or a remove.
+    hold: the hold model on a PriorityQueue of n Events: each remove is
+        followed by an add a short random time after the removed event, as
+        in a simulation. An operation is a remove and an add.
+    bucket: the hold model on a BucketQueue.
+    dispatch: Dispatcher.request_driver for n // 2 riders, with a fleet of
+        n idle drivers. An operation is a request.
+    parse: create_event_list on the trace. An operation is a request read.
+    report: Monitor.report, after the trace has been simulated with a
+        Monitor. An operation is an event of the simulation.
+    run: Simulation.run on the trace, streamed from the file. An operation
+        is an event done.
+    compact: Simulation.run with the compact engine on the trace, parsed
+        with parse_trace beforehand and streamed. An operation is an event
+        done.
+    run_bucket: Simulation.run as in run, with a BucketQueue for the events.
+    run_timers: Simulation.run as in run, with a TimerQueue for the events.
+        Cancellations of riders who were picked up are not done, so there
+        are fewer operations.
+
+Every measurement runs in a fresh process, so that its peak resident set
+size is its own. The results record, for each benchmark and size, the time
+taken, the number of operations, the operations per second and the peak
+resident set size in bytes, and for each benchmark its scaling exponent:
+the slope of the least squares fit of log(time) against log(size), which
+is 1 for a benchmark whose cost per operation does not grow with size.
+
+Results are saved as JSON, together with the commit they were measured at,
+and compare_results lists how the rates changed between two result files.
+=== Constants ===
+@type BENCHMARKS: tuple[str]
+    The names of the benchmarks, in the order they are run.
+@type DEFAULT_SIZES: tuple[int]
+    The sizes the benchmarks are run at by default.
+"""
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from math import log
+from multiprocessing import get_context
+
+from container import PriorityQueue, BucketQueue
+from dispatcher import Dispatcher
+from driver import Driver
+from event import Event, create_event_list, iter_events
+from eventlog import EventLog
+from location import Location
+from monitor import Monitor
+from rider import Rider
+from simulation import Simulation
+from timers import TimerQueue
+from traces import parse_trace
+from workload import Workload, write_text
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCHMARKS = ("queue", "hold", "bucket", "dispatch", "parse", "report",
+              "run", "run_bucket", "run_timers", "compact")
+DEFAULT_SIZES = (10 ** 3, 10 ** 4, 10 ** 5)
+
+# The side of the grid the benchmarks' actors are placed on
+_GRID = 100
+
+
+def workload_for(size):
+    """ Return the Workload that generates the trace of a benchmark of
+    <size>: steady demand of one rider per time unit, served by one driver
+    for every 20 requests.
+    @type size: int
+    @rtype: (Workload, int)
+        The workload, and the duration that gives <size> requests on
+        average.
+    >>> workload, duration = workload_for(1000)
+    >>> workload.fleet_size + workload.expected_riders(duration)
+    1000.0
+    """
+    fleet_size = max(1, size // 20)
+    workload = Workload(rows=_GRID, columns=_GRID, fleet_size=fleet_size,
+                        rate=1.0, profile=(1.0,), seed=size)
+    return workload, max(0, size - fleet_size)
+
+
+def run_benchmark(name, size, filename):
+    """ Run the benchmark <name> of <size> on the text trace <filename> in
+    this process, and return the time it took, in seconds, and the number
+    of operations done.
+    @type name: str
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    >>> seconds, operations = run_benchmark("queue", 100, "events.txt")
+    >>> operations
+    200
+    """
+    if name not in BENCHMARKS:
+        raise ValueError("Unknown benchmark: {}".format(name))
+    return globals()["_bench_" + name](size, filename)
+
+
+def measure(name, size, filename, isolate=True):
+    """ Return the measurement of the benchmark <name> of <size> on the
+    text trace <filename>.
+    @type name: str
+    @type size: int
+    @type filename: str
+    @type isolate: bool
+        If True, the benchmark runs in a fresh process, and the peak
+        resident set size is its own. Otherwise it runs in this process,
+        and the peak is that of this process so far.
+    @rtype: dict[str, object]
+    >>> result = measure("dispatch", 100, "events.txt", isolate=False)
+    >>> result["benchmark"], result["size"], result["operations"]
+    ('dispatch', 100, 50)
+    """
+    if isolate:
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) \
+                as executor:
+            return executor.submit(measure, name, size, filename,
+                                   False).result()
+    seconds, operations = run_benchmark(name, size, filename)
+    return {"benchmark": name, "size": size, "seconds": seconds,
+            "operations": operations,
+            "rate": operations / seconds if seconds > 0 else None,
+            "peak_rss": _peak_rss()}
+
+
+def run_suite(sizes=DEFAULT_SIZES, benchmarks=BENCHMARKS, directory=None,
+              isolate=True):
+    """ Run <benchmarks> at each of <sizes> and return the results.
+    @type sizes: list[int]
+    @type benchmarks: list[str]
+    @type directory: str | None
+        Where the traces are generated. A temporary directory is used, and
+        removed afterwards, if none is given.
+    @type isolate: bool
+        If True, each measurement runs in a fresh process.
+    @rtype: dict[str, object]
+    >>> results = run_suite([100, 400], ["queue", "run"], isolate=False)
+    >>> [(row["benchmark"], row["size"]) for row in results["results"]]
+    [('queue', 100), ('queue', 400), ('run', 100), ('run', 400)]
+    >>> sorted(results["exponents"])
+    ['queue', 'run']
+    """
+    if directory is None:
+        with tempfile.TemporaryDirectory() as directory:
+            return run_suite(sizes, benchmarks, directory, isolate)
+    traces = {}
+    for size in sizes:
+        traces[size] = os.path.join(directory, "bench_{}.txt".format(size))
+        workload, duration = workload_for(size)
+        write_text(workload, duration, traces[size])
+    rows = [measure(name, size, traces[size], isolate)
+            for name in benchmarks for size in sizes]
+    exponents = {}
+    for name in benchmarks:
+        points = [(row["size"], row["seconds"]) for row in rows
+                  if row["benchmark"] == name]
+        exponents[name] = scaling_exponent(points)
+    return {"commit": _commit(), "python": platform.python_version(),
+            "platform": platform.platform(), "results": rows,
+            "exponents": exponents}
+
+
+def scaling_exponent(points):
+    """ Return the slope of the least squares line through the points
+    (log(size), log(seconds)) of <points>, or None if there are not two
+    sizes with a positive time to fit.
+    @type points: list[(int, float)]
+    @rtype: float | None
+    >>> round(scaling_exponent([(10, 0.5), (100, 50.0), (1000, 5000.0)]), 6)
+    2.0
+    >>> scaling_exponent([(10, 1.0)]) is None
+    True
+    """
+    logs = [(log(size), log(seconds)) for size, seconds in points
+            if size > 0 and seconds > 0]
+    if len(set(x for x, _ in logs)) < 2:
+        return None
+    mean_x = sum(x for x, _ in logs) / len(logs)
+    mean_y = sum(y for _, y in logs) / len(logs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in logs) / \
+        sum((x - mean_x) ** 2 for x, _ in logs)
+
+
+def save_results(results, filename):
+    """ Save <results> to the JSON file <filename>.
+    @type results: dict[str, object]
+    @type filename: str
+    @rtype: None
+    """
+    with open(filename, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def compare_results(old_filename, new_filename):
+    """ Return, for every benchmark and size measured in both of the JSON
+    results files, the ratio of the new rate to the old one, so that
+    values below 1 are slowdowns.
+    @type old_filename: str
+    @type new_filename: str
+    @rtype: list[(str, int, float)]
+    >>> import os, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> old = {"results": [{"benchmark": "run", "size": 10, "rate": 4.0}]}
+    >>> new = {"results": [{"benchmark": "run", "size": 10, "rate": 3.0}]}
+    >>> save_results(old, os.path.join(directory, "old.json"))
+    >>> save_results(new, os.path.join(directory, "new.json"))
+    >>> compare_results(os.path.join(directory, "old.json"),
+    ...                 os.path.join(directory, "new.json"))
+    [('run', 10, 0.75)]
+    """
+    rates = []
+    for filename in (old_filename, new_filename):
+        with open(filename) as file:
+            rates.append({(row["benchmark"], row["size"]): row["rate"]
+                          for row in json.load(file)["results"]})
+    old, new = rates
+    return [(name, size, new[name, size] / old[name, size])
+            for name, size in new
+            if (name, size) in old and old[name, size] and new[name, size]]
+
+
+class _CountLog(EventLog):
+    """ An event log that only counts the events done.
+    === Attributes ===
+    @type count: int
+        The number of events logged.
+    """
+
+    def __init__(self):
+        """ Initialize a _CountLog.
+        @type self: _CountLog
+        @rtype: None
+        """
+        self.count = 0
+
+    def log(self, event):
+        """ Count <event>.
+        @type self: _CountLog
+        @type event: Event
+        @rtype: None
+        """
+        self.count += 1
+
+
+def _bench_queue(size, filename):
+    """ Time adding <size> Events to a PriorityQueue and removing them.
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    """
+    rng = random.Random(size)
+    events = [Event(rng.randrange(size)) for _ in range(size)]
+    queue = PriorityQueue()
+    start = time.perf_counter()
+    for event in events:
+        queue.add(event)
+    while not queue.is_empty():
+        queue.remove()
+    return time.perf_counter() - start, 2 * size
+
+
+def _bench_hold(size, filename):
+    """ Time the hold model on a PriorityQueue of <size> Events.
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    """
+    return _hold(PriorityQueue(), size)
+
+
+def _bench_bucket(size, filename):
+    """ Time the hold model on a BucketQueue of <size> Events.
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    """
+    return _hold(BucketQueue(), size)
+
+
+def _hold(queue, size):
+    """ Time <size> holds on <queue> filled with <size> Events.
+    @type queue: Container
+    @type size: int
+    @rtype: (float, int)
+    """
+    rng = random.Random(size)
+    for _ in range(size):
+        queue.add(Event(rng.randrange(100)))
+    delays = [int(rng.expovariate(0.05)) for _ in range(size)]
+    start = time.perf_counter()
+    for delay in delays:
+        queue.add(Event(queue.remove().timestamp + delay))
+    return time.perf_counter() - start, size
+
+
+def _bench_dispatch(size, filename):
+    """ Time rider requests to a Dispatcher with a fleet of <size> idle
+    drivers.
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    """
+    rng = random.Random(size)
+
+    def location():
+        return Location(rng.randint(1, _GRID), rng.randint(1, _GRID))
+    dispatcher = Dispatcher()
+    for number in range(size):
+        dispatcher.request_rider(Driver("D{}".format(number), location(), 1))
+    riders = [Rider("R{}".format(number), location(), location(), 10)
+              for number in range(size // 2)]
+    start = time.perf_counter()
+    for rider in riders:
+        dispatcher.request_driver(rider)
+    return time.perf_counter() - start, len(riders)
+
+
+def _bench_parse(size, filename):
+    """ Time create_event_list on <filename>.
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    """
+    start = time.perf_counter()
+    events = create_event_list(filename)
+    return time.perf_counter() - start, len(events)
+
+
+def _bench_report(size, filename):
+    """ Time Monitor.report after simulating <filename>.
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    """
+    monitor = Monitor()
+    log = _CountLog()
+    Simulation(event_log=log, monitor=monitor).run(iter_events(filename),
+                                                   stream=True)
+    start = time.perf_counter()
+    monitor.report()
+    return time.perf_counter() - start, log.count
+
+
+def _bench_run(size, filename):
+    """ Time Simulation.run on <filename>.
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    """
+    log = _CountLog()
+    simulation = Simulation(event_log=log)
+    start = time.perf_counter()
+    simulation.run(iter_events(filename), stream=True)
+    return time.perf_counter() - start, log.count
+
+
+def _bench_run_bucket(size, filename):
+    """ Time Simulation.run with a BucketQueue on <filename>.
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    """
+    log = _CountLog()
+    simulation = Simulation(event_log=log, event_queue=BucketQueue())
+    start = time.perf_counter()
+    simulation.run(iter_events(filename), stream=True)
+    return time.perf_counter() - start, log.count
+
+
+def _bench_run_timers(size, filename):
+    """ Time Simulation.run with a TimerQueue on <filename>.
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    """
+    log = _CountLog()
+    simulation = Simulation(event_log=log, event_queue=TimerQueue())
+    start = time.perf_counter()
+    simulation.run(iter_events(filename), stream=True)
+    return time.perf_counter() - start, log.count
+
+
+def _bench_compact(size, filename):
+    """ Time Simulation.run with the compact engine on <filename>.
+    @type size: int
+    @type filename: str
+    @rtype: (float, int)
+    """
+    trace = parse_trace(filename)
+    log = _CountLog()
+    simulation = Simulation(event_log=log, compact=True)
+    start = time.perf_counter()
+    simulation.run(trace, stream=True)
+    return time.perf_counter() - start, log.count
+
+
+def _peak_rss():
+    """ Return the peak resident set size of this process, in bytes, or
+    None where it cannot be measured.
+    @rtype: int | None
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _commit():
+    """ Return the git commit of the working tree, or None if it is not
+    known.
+    @rtype: str | None
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    # python benchmark.py OUTPUT.json [SIZE...]
+    # python benchmark.py compare OLD.json NEW.json
+    if len(sys.argv) == 4 and sys.argv[1] == "compare":
+        for name, size, ratio in compare_results(sys.argv[2], sys.argv[3]):
+            print("{:10} {:>10} {:8.3f}x".format(name, size, ratio))
+    else:
+        suite = run_suite([int(size) for size in sys.argv[2:]]
+                          or DEFAULT_SIZES)
+        save_results(suite, sys.argv[1])
+        for row in suite["results"]:
+            rate, peak_rss = row["rate"], row["peak_rss"]
+            print("{:10} {:>10} {:10.3f}s {:>14}/s {:>14}B".format(
+                row["benchmark"], row["size"], row["seconds"],
+                "-" if rate is None else "{:,.0f}".format(rate),
+                "-" if peak_rss is None else "{:,}".format(peak_rss)))
+        for name, exponent in suite["exponents"].items():
+            print("{:10} exponent {}".format(
+                name, "-" if exponent is None else round(exponent, 3)))
@@ -0,0 +1,184 @@
+"""
+The checkpoint module saves the state of a running Simulation, so that it
+can be resumed later, or so that several "what if" runs can carry on from
+the same warmed-up state.
+
+A checkpoint holds the event queue, the dispatcher with its drivers and
+waiting riders, every rider and driver, the monitor's records and how far
+the simulation has read its input. It is the simulation pickled and
+compressed with zlib, after the magic bytes b"RSCHECK1". The event log,
+profiler and checkpointer of the simulation are not saved, and are given
+again when it is resumed.
+
+A resumed simulation is run on the same input events as the original. It
+skips the ones the original had already taken, and then does exactly what
+the original would have done, so its report is identical.
+
+Monitors that write to a file, such as a WindowedMonitor, and actors
+stored in the memory-mapped columns of a binary trace cannot be saved.
+"""
+import os
+import pickle
+import zlib
+
+from eventlog import PrintLog
+
+_MAGIC = b"RSCHECK1"
+
+
+class Checkpointer:
+    """ Saves checkpoints of a simulation as it runs, every so many events
+    or units of simulated time.
+    === Attributes ===
+    @type filename: str
+        Where checkpoints are saved. It is formatted with the keywords
+        timestamp, the time of the last event done, and events, the number
+        of events done, so that a name like "run-{timestamp}.ckpt" keeps
+        every checkpoint. Otherwise each checkpoint replaces the last one.
+    @type every_events: int | None
+        Save a checkpoint every <every_events> events done.
+    @type every_time: int | None
+        Save a checkpoint once the simulation passes each multiple of
+        <every_time>.
+    @type saved: list[str]
+        The files saved so far, in order.
+    === Private Attributes ===
+    @type _done: int
+        The number of events done since this checkpointer started.
+    @type _next_time: int | None
+        The time after which the next timed checkpoint is saved.
+    """
+
+    def __init__(self, filename, every_events=None, every_time=None):
+        """ Initialize a Checkpointer.
+        @type self: Checkpointer
+        @type filename: str
+        @type every_events: int | None
+        @type every_time: int | None
+        @rtype: None
+        """
+        self.filename = filename
+        self.every_events = every_events
+        self.every_time = every_time
+        self.saved = []
+        self._done = 0
+        self._next_time = None
+
+    def event_done(self, simulation, timestamp):
+        """ Record that <simulation> has done an event at <timestamp>, and
+        save a checkpoint if one is due.
+        @type self: Checkpointer
+        @type simulation: Simulation
+        @type timestamp: int
+        @rtype: None
+        """
+        self._done += 1
+        due = self.every_events is not None and \
+            self._done % self.every_events == 0
+        if self.every_time is not None:
+            if self._next_time is None:
+                self._next_time = self._after(timestamp)
+            elif timestamp >= self._next_time:
+                self._next_time = self._after(timestamp)
+                due = True
+        if due:
+            filename = self.filename.format(timestamp=timestamp,
+                                            events=self._done)
+            save_checkpoint(simulation, filename)
+            self.saved.append(filename)
+
+    def _after(self, timestamp):
+        """ Return the first multiple of every_time after <timestamp>.
+        @type self: Checkpointer
+        @type timestamp: int
+        @rtype: int
+        """
+        return (timestamp // self.every_time + 1) * self.every_time
+
+
+def snapshot(simulation):
+    """ Return the checkpoint of <simulation>, as bytes.
+    @type simulation: Simulation
+    @rtype: bytes
+    """
+    return _MAGIC + zlib.compress(
+        pickle.dumps(simulation, pickle.HIGHEST_PROTOCOL))
+
+
+def restore(data, event_log=None, profiler=None, checkpoints=None):
+    """ Return the Simulation saved in the checkpoint <data>. Each call
+    returns a separate copy.
+    @type data: bytes
+    @type event_log: EventLog | None
+        Where the resumed simulation records its events. They are printed
+        if no log is given.
+    @type profiler: Profiler | None
+        What the resumed simulation does its events through, if anything.
+    @type checkpoints: Checkpointer | None
+        What saves checkpoints of the resumed simulation, if anything.
+    @rtype: Simulation
+    >>> from event import create_event_list
+    >>> from eventlog import NullLog
+    >>> from simulation import Simulation
+    >>> data = snapshot(Simulation(event_log=NullLog()))
+    >>> first = restore(data, NullLog())
+    >>> second = restore(data, NullLog())
+    >>> first.run(create_event_list("events.txt")) == \\
+    ...     second.run(create_event_list("events.txt"))
+    True
+    """
+    if not data.startswith(_MAGIC):
+        raise ValueError("Not a simulation checkpoint")
+    simulation = pickle.loads(zlib.decompress(data[len(_MAGIC):]))
+    simulation._event_log = PrintLog() if event_log is None else event_log
+    simulation._profiler = profiler
+    simulation._checkpoints = checkpoints
+    return simulation
+
+
+def save_checkpoint(simulation, filename):
+    """ Save the checkpoint of <simulation> to <filename>.
+    The file is written under another name first, so a crash while saving
+    leaves the previous checkpoint in place.
+    @type simulation: Simulation
+    @type filename: str
+    @rtype: None
+    """
+    partial = filename + ".partial"
+    with open(partial, "wb") as file:
+        file.write(snapshot(simulation))
+    os.replace(partial, filename)
+
+
+def load_checkpoint(filename, event_log=None, profiler=None,
+                    checkpoints=None):
+    """ Return the Simulation saved in the checkpoint <filename>.
+    @type filename: str
+    @type event_log: EventLog | None
+    @type profiler: Profiler | None
+    @type checkpoints: Checkpointer | None
+    @rtype: Simulation
+    >>> import os, tempfile
+    >>> from event import iter_events
+    >>> from eventlog import NullLog
+    >>> from simulation import Simulation
+    >>> from workload import Workload, write_text
+    >>> directory = tempfile.mkdtemp()
+    >>> trace = os.path.join(directory, "trace.txt")
+    >>> write_text(Workload(fleet_size=30, rate=0.5), 2000, trace)
+    838
+    >>> whole = Simulation(event_log=NullLog()).run(iter_events(trace),
+    ...                                              stream=True)
+    >>> checkpoints = Checkpointer(os.path.join(directory, "{timestamp}"),
+    ...                            every_time=500)
+    >>> simulation = Simulation(event_log=NullLog(), checkpoints=checkpoints)
+    >>> simulation.run(iter_events(trace), stream=True) == whole
+    True
+    >>> [os.path.basename(name) for name in checkpoints.saved]
+    ['500', '1000', '1501', '2000']
+    >>> resumed = load_checkpoint(checkpoints.saved[1], NullLog())
+    >>> resumed.run(iter_events(trace), stream=True) == whole
+    True
+    """
+    with open(filename, "rb") as file:
+        return restore(file.read(), event_log, profiler, checkpoints)
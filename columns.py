@@ -0,0 +1,55 @@
+"""
+The columns module converts the typed columns of the binary file formats,
+binary traces and saved road networks, to and from bytes. The formats are
+little-endian. On a big-endian machine, columns are byte-swapped as they
+are written and read, so the files are the same on every machine.
+"""
+import sys
+from array import array
+
+# The typecode of an array with items of each size, to swap bytes with
+_SWAP_TYPES = {2: "H", 4: "I", 8: "Q"}
+
+
+def column_bytes(column):
+    """ Return the items of <column> as little-endian bytes.
+    @type column: array | memoryview | numpy.ndarray | bytes
+    @rtype: bytes
+    >>> column_bytes(array("i", [1, 256]))
+    b'\\x01\\x00\\x00\\x00\\x00\\x01\\x00\\x00'
+    """
+    view = memoryview(column)
+    if sys.byteorder == "little" or view.itemsize == 1:
+        return view.tobytes()
+    swapped = array(_SWAP_TYPES[view.itemsize], view.tobytes())
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def read_column(data, typecode):
+    """ Return the little-endian <data> as an array of type <typecode>.
+    @type data: bytes
+    @type typecode: str
+    @rtype: array
+    >>> read_column(b'\\x01\\x00\\x00\\x00\\x00\\x01\\x00\\x00', "i")
+    array('i', [1, 256])
+    """
+    column = array(typecode, data)
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column
+
+
+def view_column(buffer, typecode):
+    """ Return the little-endian <buffer> as a column of type <typecode>:
+    a view of <buffer> itself where this machine is little-endian, and a
+    byte-swapped copy where it is not.
+    @type buffer: memoryview
+    @type typecode: str
+    @rtype: memoryview | array
+    >>> list(view_column(memoryview(b'\\x01\\x00\\x00\\x00'), "i"))
+    [1]
+    """
+    if sys.byteorder == "little":
+        return buffer.cast(typecode)
+    return read_column(buffer.tobytes(), typecode)
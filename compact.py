@@ -0,0 +1,86 @@
+"""
+The compact module runs a simulation without Event objects.
+
+Each scheduled event is a plain tuple (timestamp, seq, kind, rider,
+driver), which the heap compares natively: by timestamp, then by seq, the
+order it was scheduled in, so ties are broken in FIFO order just as in a
+PriorityQueue of Events. seq is unique, so the comparison never looks
+further. The kind is the Event class of the event, and the rider and
+driver are the actors it is about, or None. The requests of the trace are
+taken from its columns in time order, and their actors are only made when
+they are reached.
+
+Each event is done by the happen() of its Event class, the same code
+that its do() runs, in the same order, so the report is the same. Event
+objects are only made for the event log, when it records anything.
+"""
+from heapq import heappop, heappush
+from itertools import count
+
+from actors import StoredRider, StoredDriver
+from event import RiderRequest, DriverRequest, make_event
+from traces import RIDER_REQUEST
+
+
+def run_compact(trace, dispatcher, monitor, log=None, stream=False):
+    """ Do the events of <trace> and every event they lead to, with
+    <dispatcher> and <monitor>.
+    @type trace: Trace
+    @type dispatcher: Dispatcher
+    @type monitor: Monitor
+    @type log: (Event) -> None | None
+        Called with every event done, if given.
+    @type stream: bool
+        If True, the requests of <trace> must be sorted by timestamp, and
+        are done in file order. Otherwise they are sorted first.
+    @rtype: None
+    >>> from dispatcher import Dispatcher
+    >>> from monitor import RunningMonitor
+    >>> from traces import parse_trace
+    >>> monitor = RunningMonitor()
+    >>> run_compact(parse_trace("events_small.txt"), Dispatcher(), monitor,
+    ...             lambda event: print(event))
+    1 -- Dan: Request a driver
+    10 -- Arnold: Request a rider
+    12 -- Arnold: Pickup Dan
+    16 -- Dan: Cancel request
+    17 -- Arnold: Drop off Dan
+    17 -- Arnold: Request a rider
+    >>> monitor.report()["rider_wait_time"]
+    11.0
+    """
+    store = trace.store
+    timestamps, kinds, actors = trace.timestamps, trace.kinds, trace.actors
+    total = len(timestamps)
+    # Requests at the same time are done in file order, just as they are
+    # queued in a PriorityQueue
+    order = range(total) if stream else \
+        sorted(range(total), key=timestamps.__getitem__)
+    heap = []
+    seq = count()
+
+    def spawn(heap, timestamp, kind, rider, driver):
+        heappush(heap, (timestamp, next(seq), kind, rider, driver))
+    taken = 0
+    while taken < total or heap:
+        # A request goes before spawned events at the same time
+        if taken < total and (not heap or
+                              timestamps[order[taken]] <= heap[0][0]):
+            request = order[taken]
+            timestamp = timestamps[request]
+            taken += 1
+            if taken < total and timestamps[order[taken]] < timestamp:
+                raise ValueError("Streamed events must be sorted by "
+                                 "timestamp")
+            if kinds[request] == RIDER_REQUEST:
+                kind = RiderRequest
+                rider, driver = StoredRider(store, actors[request]), None
+            else:
+                kind = DriverRequest
+                rider, driver = None, StoredDriver(store, actors[request])
+        else:
+            timestamp, _, kind, rider, driver = heappop(heap)
+        kind.happen(timestamp, rider, driver, dispatcher, monitor, spawn,
+                    heap)
+        if log is not None:
+            log(make_event(timestamp, kind, rider, driver))
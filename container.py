@@ -1,3 +1,8 @@
+from collections import deque
+from heapq import heapify, heappop, heappush
+from operator import attrgetter
+
+
 class Container:
     """ A container that holds objects.
     This is an abstract class.  Only child classes should be instantiated.
@@ -26,6 +31,45 @@ class Container:
         raise NotImplementedError("Implemented in a subclass")
 
 
+class _Entry:
+    """ A slot in a PriorityQueue heap.
+    === Attributes ===
+    @type item: object
+        The stored item.
+    @type seq: int
+        The insertion sequence number, used to break ties in FIFO order.
+    @type alive: bool
+        False once the item has been removed with remove_particular. Dead
+        entries stay in the heap until they are popped or compacted away.
+    """
+    __slots__ = ("item", "seq", "alive")
+
+    def __init__(self, item, seq):
+        """ Initialize a live _Entry.
+        @type self: _Entry
+        @type item: object
+        @type seq: int
+        @rtype: None
+        """
+        self.item, self.seq, self.alive = item, seq, True
+
+    def __lt__(self, other):
+        """ Return True iff this entry should be removed before <other>.
+        @type self: _Entry
+        @type other: _Entry
+        @rtype: bool
+        >>> _Entry(3, 1) < _Entry(3, 2)
+        True
+        >>> _Entry(4, 0) < _Entry(3, 1)
+        False
+        """
+        if self.item < other.item:
+            return True
+        if other.item < self.item:
+            return False
+        return self.seq < other.seq
+
+
 class PriorityQueue(Container):
     """ A queue of items that operates in priority order.
 
@@ -40,20 +84,43 @@ class PriorityQueue(Container):
     If x < y, then x has a *HIGHER* priority than y.
 
     All objects in the container must be of the same type.
+
+    The queue is a binary heap, so add and remove are O(log n). Membership
+    (contains, remove_particular) is by identity and goes through an index.
+    remove_particular does not touch the heap: it marks the entry dead in
+    O(1), and dead entries are skipped when they reach the top. Once more
+    than <compact_ratio> of the heap is dead, the heap is rebuilt from the
+    live entries.
      === Private Attributes ===
-     @type _items: list
-         The items stored in the priority queue.
+     @type _heap: list[_Entry]
+         The entries stored in the priority queue, in heap order. Some of
+         them may be dead.
+     @type _index: dict[int, list[_Entry]]
+         Maps id(item) to the live entries holding that item.
+     @type _counter: int
+         The sequence number given to the next added item.
+     @type _dead: int
+         The number of dead entries in _heap.
+     @type _compact_ratio: float
+         The fraction of dead entries that triggers a compaction.
      === Representation Invariants ===
-     _items is a sorted list, where the first item in the queue is the
-     item with the highest priority.
+     _heap is a binary min-heap on _Entry ordering.
+     _heap[0], if any, is alive.
+     _dead is the number of entries e in _heap with not e.alive.
      """
 
-    def __init__(self):
+    def __init__(self, compact_ratio=0.5):
         """ Initialize an empty PriorityQueue.
         @type self: PriorityQueue
+        @type compact_ratio: float
+            Precondition: 0 < compact_ratio <= 1
         @rtype: None
         """
-        self._items = []
+        self._heap = []
+        self._index = {}
+        self._counter = 0
+        self._dead = 0
+        self._compact_ratio = compact_ratio
 
     def __str__(self):
         """ Return a user-friendly str representation of PriorityQueue <self>
@@ -66,19 +133,9 @@ class PriorityQueue(Container):
         >>> print(a)
         [2, 8, 9]
         """
-        # Start a string ret that will have all
-        # necessary components appended to it
-        ret = "["
-        # As long as there is another element in self._items,
-        # append its string representation to ret
-        for i in range(len(self._items)):
-            ret = ret + str(self._items[i]) + ", "
-        # Finishing touch on ret to close the brackets
-        ret = ret[0:len(ret)-2] + "]"
-        # If self._items was empty, modify ret
-        if ret == "]":
-            ret = "None"
-        return ret
+        if self.is_empty():
+            return "None"
+        return "[" + ", ".join(str(item) for item in self.items) + "]"
 
     def contains(self, item):
         """ Return if PriorityQueue <self> contains <item>
@@ -92,7 +149,7 @@ class PriorityQueue(Container):
         >>> a.contains(7)
         True
         """
-        return item in self._items
+        return id(item) in self._index
 
     def first_element(self):
         """ Return the first element in the PriorityQueue <self>
@@ -106,19 +163,33 @@ class PriorityQueue(Container):
         >>> a.first_element()
         2
         """
-        return self._items[0]
+        return self._heap[0].item
 
     def remove_particular(self, particular):
-        """ Return particular element from PriorityQueue <self>
+        """ Remove every occurrence of <particular> from PriorityQueue <self>
         @type self: PriorityQueue
         @type particular: Object
         @rtype: None
+        >>> a = PriorityQueue()
+        >>> for x in [5, 1, 4, 2]:
+        ...     a.add(x)
+        >>> a.remove_particular(1)
+        >>> a.remove_particular(6)
+        >>> print(a)
+        [2, 4, 5]
+        >>> len(a)
+        3
         """
-        counter = 0
-        while counter < len(self._items):
-            if self._items[counter] == particular:
-                self._items.pop(counter)
-            counter += 1
+        entries = self._index.pop(id(particular), None)
+        if entries is None:
+            return
+        for entry in entries:
+            entry.alive = False
+        self._dead += len(entries)
+        if self._dead > self._compact_ratio * len(self._heap):
+            self._compact()
+        else:
+            self._drop_dead_top()
 
     def remove(self):
         """ Remove and return the next item from this PriorityQueue.
@@ -139,7 +210,14 @@ class PriorityQueue(Container):
         >>> pq.remove()
         'yellow'
         """
-        return self._items.pop(0)
+        entry = heappop(self._heap)
+        entries = self._index[id(entry.item)]
+        if len(entries) == 1:
+            del self._index[id(entry.item)]
+        else:
+            entries.remove(entry)
+        self._drop_dead_top()
+        return entry.item
 
     def is_empty(self):
         """ Return true iff this PriorityQueue is empty.
@@ -152,7 +230,7 @@ class PriorityQueue(Container):
         >>> pq.is_empty()
         False
         """
-        return len(self._items) == 0
+        return len(self._heap) == 0
 
     def __len__(self):
         """ Return length of <self>
@@ -167,7 +245,7 @@ class PriorityQueue(Container):
         >>> len(pg)
         3
         """
-        return len(self._items)
+        return len(self._heap) - self._dead
 
     def add(self, item):
         """ Add <item> to this PriorityQueue.
@@ -179,29 +257,22 @@ class PriorityQueue(Container):
         >>> pq.add("blue")
         >>> pq.add("red")
         >>> pq.add("green")
-        >>> pq._items
+        >>> pq.items
         ['blue', 'green', 'red', 'yellow']
         """
-        flag = True
-        # If item is the only element, it can be appended
-        if len(self._items) == 0:
-            self._items.append(item)
+        entry = _Entry(item, self._counter)
+        self._counter += 1
+        heappush(self._heap, entry)
+        entries = self._index.get(id(item))
+        if entries is None:
+            self._index[id(item)] = [entry]
         else:
-            i = 0
-            # Determine the correct position for item and add it
-            for i in range(len(self._items) - 1, -1, -1):
-                if item < self._items[i]:
-                    pass
-                elif flag:
-                    self._items = self._items[:i + 1] + [item] + self._items[
-                                                                 i + 1:]
-                    flag = False
-            if flag:
-                self._items = self._items[:i] + [item] + self._items[i:]
+            entries.append(entry)
 
     @property
     def items(self):
-        """ Return self._items
+        """ Return the items of <self> in priority order.
+        This sorts a copy of the heap, so it is O(n log n).
         @type self: PriorityQueue
         @rtype: list
         >>> ls = PriorityQueue()
@@ -213,8 +284,434 @@ class PriorityQueue(Container):
         >>> ls.items
         [1, 3, 8]
         """
-        return self._items
-        
+        return [entry.item for entry in sorted(self._heap) if entry.alive]
+
+    def __getstate__(self):
+        """ Return the state of <self> to pickle.
+        The index is keyed by id, which does not survive pickling, so it is
+        left out and rebuilt by __setstate__.
+        @type self: PriorityQueue
+        @rtype: dict[str, object]
+        >>> import pickle
+        >>> pq = PriorityQueue()
+        >>> for x in [5, 1, 4]:
+        ...     pq.add(x)
+        >>> copy = pickle.loads(pickle.dumps(pq))
+        >>> copy.remove_particular(copy.first_element())
+        >>> copy.items
+        [4, 5]
+        """
+        state = self.__dict__.copy()
+        del state["_index"]
+        return state
+
+    def __setstate__(self, state):
+        """ Restore <self> from the pickled <state>.
+        @type self: PriorityQueue
+        @type state: dict[str, object]
+        @rtype: None
+        """
+        self.__dict__.update(state)
+        self._index = {}
+        live = [entry for entry in self._heap if entry.alive]
+        # Entries are indexed in the order they were added
+        live.sort(key=lambda entry: entry.seq)
+        for entry in live:
+            self._index.setdefault(id(entry.item), []).append(entry)
+
+    def _drop_dead_top(self):
+        """ Pop dead entries off the top of the heap.
+        @type self: PriorityQueue
+        @rtype: None
+        """
+        heap = self._heap
+        while heap and not heap[0].alive:
+            heappop(heap)
+            self._dead -= 1
+
+    def _compact(self):
+        """ Rebuild the heap from its live entries.
+        @type self: PriorityQueue
+        @rtype: None
+        >>> pq = PriorityQueue(compact_ratio=0.5)
+        >>> for x in range(4):
+        ...     pq.add(x)
+        >>> pq.remove_particular(2)
+        >>> pq.remove_particular(3)
+        >>> len(pq._heap)
+        4
+        >>> pq.remove_particular(1)
+        >>> len(pq._heap)
+        1
+        """
+        self._heap = [entry for entry in self._heap if entry.alive]
+        heapify(self._heap)
+        self._dead = 0
+
+
+class Queue(Container):
+    """ A first-in-first-out queue of items.
+
+    Membership (contains) is by identity and goes through an index, so it
+    does not scan the queue.
+    === Private Attributes ===
+    @type _items: deque
+        The items stored in the queue, oldest first.
+    @type _index: dict[int, int]
+        Maps id(item) to the number of times item is in the queue.
+    """
+
+    def __init__(self):
+        """ Initialize an empty Queue.
+        @type self: Queue
+        @rtype: None
+        """
+        self._items = deque()
+        self._index = {}
+
+    def __str__(self):
+        """ Return a user-friendly str representation of Queue <self>
+        @type self: Queue
+        @rtype: str
+        >>> a = Queue()
+        >>> print(a)
+        None
+        >>> a.add(8)
+        >>> a.add(2)
+        >>> print(a)
+        [8, 2]
+        """
+        if self.is_empty():
+            return "None"
+        return "[" + ", ".join(str(item) for item in self._items) + "]"
+
+    def contains(self, item):
+        """ Return if Queue <self> contains <item>
+        @type self: Queue
+        @type item: Object
+        @rtype: bool
+        >>> a = Queue()
+        >>> a.add(7)
+        >>> a.contains(4)
+        False
+        >>> a.contains(7)
+        True
+        """
+        return id(item) in self._index
+
+    def first_element(self):
+        """ Return the first element in the Queue <self>
+        @type self: Queue
+        @rtype: object
+        >>> a = Queue()
+        >>> a.add(9)
+        >>> a.add(2)
+        >>> a.first_element()
+        9
+        """
+        return self._items[0]
+
+    def add(self, item):
+        """ Add <item> to the back of this Queue.
+        @type self: Queue
+        @type item: object
+        @rtype: None
+        """
+        self._items.append(item)
+        self._index[id(item)] = self._index.get(id(item), 0) + 1
+
+    def remove(self):
+        """ Remove and return the oldest item from this Queue.
+        Precondition: <self> should not be empty.
+        @type self: Queue
+        @rtype: object
+        >>> q = Queue()
+        >>> q.add("red")
+        >>> q.add("blue")
+        >>> q.remove()
+        'red'
+        >>> q.remove()
+        'blue'
+        """
+        item = self._items.popleft()
+        if self._index[id(item)] == 1:
+            del self._index[id(item)]
+        else:
+            self._index[id(item)] -= 1
+        return item
+
+    def remove_particular(self, particular):
+        """ Remove every occurrence of <particular> from this Queue.
+        Items are matched by identity, not equality.
+        @type self: Queue
+        @type particular: object
+        @rtype: None
+        >>> q = Queue()
+        >>> for colour in ["red", "blue", "red"]:
+        ...     q.add(colour)
+        >>> q.remove_particular(q.first_element())
+        >>> q.items
+        ['blue']
+        """
+        if self._index.pop(id(particular), None) is not None:
+            self._items = deque(item for item in self._items
+                                if item is not particular)
+
+    def is_empty(self):
+        """ Return true iff this Queue is empty.
+        @type self: Queue
+        @rtype: bool
+        >>> q = Queue()
+        >>> q.is_empty()
+        True
+        >>> q.add("thing")
+        >>> q.is_empty()
+        False
+        """
+        return len(self._items) == 0
+
+    def __len__(self):
+        """ Return length of <self>
+        @type self: Queue
+        @rtype: int
+        """
+        return len(self._items)
+
+    @property
+    def items(self):
+        """ Return the items of <self>, oldest first.
+        @type self: Queue
+        @rtype: list
+        >>> q = Queue()
+        >>> q.add(3)
+        >>> q.add(1)
+        >>> q.items
+        [3, 1]
+        """
+        return list(self._items)
+
+    def __getstate__(self):
+        """ Return the state of <self> to pickle, without the index,
+        which is keyed by id.
+        @type self: Queue
+        @rtype: dict[str, object]
+        >>> import pickle
+        >>> q = Queue()
+        >>> q.add([3])
+        >>> copy = pickle.loads(pickle.dumps(q))
+        >>> copy.contains(copy.first_element())
+        True
+        """
+        return {"_items": self._items}
+
+    def __setstate__(self, state):
+        """ Restore <self> from the pickled <state>.
+        @type self: Queue
+        @type state: dict[str, object]
+        @rtype: None
+        """
+        self._items = state["_items"]
+        self._index = {}
+        for item in self._items:
+            self._index[id(item)] = self._index.get(id(item), 0) + 1
+
+
+class BucketQueue(Container):
+    """ A queue of items with integer times, removed earliest time first.
+
+    Ties are resolved in FIFO order, as in a PriorityQueue of Events. It is
+    meant for events: times are non-negative integers, and items are
+    mostly added a little after the time of the last item removed.
+
+    Items due within <horizon> time units of the last item removed are kept
+    in a circular array of buckets, one per time unit, so add is O(1) and
+    remove is O(1) amortised over the time units the queue moves through.
+    Items due later wait in an overflow heap, and are moved into their
+    buckets as the queue's time reaches them. Items added before the first
+    removal also wait in the heap.
+
+    Adding an item earlier than the last item removed is allowed, but moves
+    every bucketed item back to the heap, so it is O(n).
+     === Private Attributes ===
+     @type _key: (object) -> int
+         Returns the time of an item.
+     @type _horizon: int
+         The number of buckets.
+     @type _buckets: list[deque]
+         The items due at each time t of the window, in bucket t % horizon,
+         oldest first.
+     @type _now: int | None
+         The start of the window of bucketed times, which is the time of
+         the last item removed, or None before the first removal.
+     @type _head: int | None
+         The time of the earliest bucketed item, if known.
+     @type _near: int
+         The number of bucketed items.
+     @type _far: list[(int, int, object)]
+         The time, sequence number and item of each item in the heap.
+     @type _counter: int
+         The sequence number given to the next item added to the heap.
+     === Representation Invariants ===
+     Every bucketed item is due in [_now, _now + _horizon).
+     Every item in _far is due at or after _now + _horizon, unless _now
+     is None.
+     """
+
+    def __init__(self, horizon=1024, key=attrgetter("timestamp")):
+        """ Initialize an empty BucketQueue.
+        @type self: BucketQueue
+        @type horizon: int
+            Precondition: horizon > 0
+        @type key: (object) -> int
+            Returns the time of an item.
+        @rtype: None
+        """
+        self._key = key
+        self._horizon = horizon
+        self._buckets = [deque() for _ in range(horizon)]
+        self._now = None
+        self._head = None
+        self._near = 0
+        self._far = []
+        self._counter = 0
+
+    def __len__(self):
+        """ Return the number of items in <self>.
+        @type self: BucketQueue
+        @rtype: int
+        """
+        return self._near + len(self._far)
+
+    def is_empty(self):
+        """ Return True iff <self> is empty.
+        @type self: BucketQueue
+        @rtype: bool
+        """
+        return self._near == 0 and not self._far
+
+    def add(self, item):
+        """ Add <item> to <self>.
+        @type self: BucketQueue
+        @type item: object
+        @rtype: None
+        >>> from event import Event
+        >>> bq = BucketQueue(horizon=4)
+        >>> for time in [9, 2, 2, 30]:
+        ...     bq.add(Event(time))
+        >>> bq.remove().timestamp
+        2
+        >>> bq.add(Event(3))
+        >>> bq.add(Event(1))
+        >>> [bq.remove().timestamp for _ in range(len(bq))]
+        [1, 2, 3, 9, 30]
+        """
+        time = self._key(item)
+        now = self._now
+        if now is None or time >= now + self._horizon:
+            heappush(self._far, (time, self._counter, item))
+            self._counter += 1
+        elif time >= now:
+            self._buckets[time % self._horizon].append(item)
+            self._near += 1
+            if self._head is not None and time < self._head:
+                self._head = time
+        else:
+            self._unbucket()
+            heappush(self._far, (time, self._counter, item))
+            self._counter += 1
+
+    def first_element(self):
+        """ Return the next item to be removed from <self>, without removing
+        it.
+        Precondition: <self> is not empty.
+        @type self: BucketQueue
+        @rtype: object
+        """
+        if self._near == 0:
+            return self._far[0][2]
+        return self._buckets[self._find_head() % self._horizon][0]
+
+    def remove(self):
+        """ Remove and return the next item of <self>.
+        Items due at the same time come out in the order they were added.
+        Precondition: <self> is not empty.
+        @type self: BucketQueue
+        @rtype: object
+        >>> from event import Event
+        >>> bq = BucketQueue(horizon=8)
+        >>> first, second = Event(5), Event(5)
+        >>> for event in [Event(70), first, Event(6), second]:
+        ...     bq.add(event)
+        >>> bq.remove() is first, bq.remove() is second
+        (True, True)
+        >>> bq.add(Event(100))
+        >>> [bq.remove().timestamp for _ in range(len(bq))]
+        [6, 70, 100]
+        """
+        if self._near == 0:
+            # Start the window at the earliest item in the heap
+            self._now = self._far[0][0]
+            self._head = None
+            self._pull()
+        time = self._find_head()
+        bucket = self._buckets[time % self._horizon]
+        item = bucket.popleft()
+        self._near -= 1
+        if not bucket:
+            self._head = None
+        if time != self._now:
+            self._now = time
+            self._pull()
+        return item
+
+    def _find_head(self):
+        """ Return the time of the earliest bucketed item.
+        Precondition: some item is bucketed.
+        @type self: BucketQueue
+        @rtype: int
+        """
+        if self._head is None:
+            time = self._now
+            buckets, horizon = self._buckets, self._horizon
+            while not buckets[time % horizon]:
+                time += 1
+            self._head = time
+        return self._head
+
+    def _pull(self):
+        """ Move the items of the heap that are due in the window into their
+        buckets.
+        @type self: BucketQueue
+        @rtype: None
+        """
+        far, end = self._far, self._now + self._horizon
+        while far and far[0][0] < end:
+            time, _, item = heappop(far)
+            self._buckets[time % self._horizon].append(item)
+            self._near += 1
+            if self._head is not None and time < self._head:
+                self._head = time
+
+    def _unbucket(self):
+        """ Move every bucketed item back to the heap, keeping their order,
+        and forget the window.
+        @type self: BucketQueue
+        @rtype: None
+        """
+        if self._near > 0:
+            time = self._find_head()
+            end = self._now + self._horizon
+            while time < end:
+                for item in self._buckets[time % self._horizon]:
+                    heappush(self._far, (time, self._counter, item))
+                    self._counter += 1
+                self._buckets[time % self._horizon].clear()
+                time += 1
+        self._now = None
+        self._head = None
+        self._near = 0
+
+
 if __name__ == '__main__':
     import doctest
-    doctest.mod()
+    doctest.testmod()
@@ -1,6 +1,9 @@
 from driver import Driver
 from rider import Rider
-from container import PriorityQueue
+from location import Location
+from container import PriorityQueue, Queue
+from spatial import DriverGrid
+from matching import travel_times, hungarian, greedy
 
 
 class Dispatcher:
@@ -17,20 +20,58 @@ class Dispatcher:
     the dispatcher does nothing. Once a driver requests a rider, the driver
     is registered with the dispatcher, and will be used to fulfill future
     rider requests.
+
+    If the dispatcher has a batch window, requests are not matched one at a
+    time. Riders wait and idle drivers stay idle until the next multiple of
+    the batch window, when dispatch_batch matches them all at once. Small
+    batches get a minimum total travel time assignment, and batches with
+    more than <exact_limit> rider-driver pairs are matched greedily.
     === Attributes ===
-    @type driver_list: PriorityQueue
-        A prioritized record of all registered drivers
+    @type driver_list: Queue
+        A record of all registered drivers, in registration order
     @type rider_list: PriorityQueue
         A prioritized record of all registered riders
+    === Private Attributes ===
+    @type _grid: DriverGrid
+        A spatial index of the idle registered drivers, used to find the
+        idle driver closest to a rider.
+    @type _busy: dict[int, Driver]
+        The busy registered drivers, keyed by id(driver).
+    @type _ranks: dict[int, int]
+        Maps id(driver) to the order in which the driver registered.
+    @type _next_rank: int
+        The rank of the next driver to register.
+    @type _batch_window: int | None
+        The time between batches, or None to match requests one at a time.
+    @type _exact_limit: int
+        The largest batch, in rider-driver pairs, that is matched exactly.
+    @type _next_batch: int | None
+        The time of the next scheduled batch, if one is scheduled.
     """
 
-    def __init__(self):
+    def __init__(self, cell_size=8, batch_window=None, exact_limit=10000):
         """ Initialize a Dispatcher.
         @type self: Dispatcher
+        @type cell_size: int
+            The cell size of the spatial index over the drivers.
+        @type batch_window: int | None
+            The time between batches, or None to match requests one at a
+            time.
+            Precondition: batch_window is None or batch_window > 0
+        @type exact_limit: int
+            The largest batch, in rider-driver pairs, that is matched
+            exactly.
         @rtype: None
         """
-        self.driver_list = PriorityQueue()
+        self.driver_list = Queue()
         self.rider_list = PriorityQueue()
+        self._grid = DriverGrid(cell_size)
+        self._busy = {}
+        self._ranks = {}
+        self._next_rank = 0
+        self._batch_window = batch_window
+        self._exact_limit = exact_limit
+        self._next_batch = None
 
     def __str__(self):
         """ Return a string representation.
@@ -46,6 +87,38 @@ class Dispatcher:
         return "List of available drivers: {}\nList of available" \
                " riders: {}".format(self.driver_list, self.rider_list)
 
+    def __getstate__(self):
+        """ Return the state of <self> to pickle, with the drivers listed
+        instead of keyed by id, which does not survive pickling.
+        @type self: Dispatcher
+        @rtype: dict[str, object]
+        >>> import pickle
+        >>> a = Dispatcher()
+        >>> a.request_rider(Driver("Tom", Location(1, 1), 1))
+        >>> copy = pickle.loads(pickle.dumps(a))
+        >>> tom = copy.request_driver(Rider("Jorge", Location(1, 2),
+        ...                                 Location(3, 3), 5))
+        >>> _ = tom.start_drive(Location(1, 2))
+        >>> copy.idle_count(), copy.busy_count()
+        (0, 1)
+        """
+        state = self.__dict__.copy()
+        drivers = {id(driver): driver for driver in self.driver_list.items}
+        state["_busy"] = list(self._busy.values())
+        state["_ranks"] = [(drivers[key], rank)
+                           for key, rank in self._ranks.items()]
+        return state
+
+    def __setstate__(self, state):
+        """ Restore <self> from the pickled <state>.
+        @type self: Dispatcher
+        @type state: dict[str, object]
+        @rtype: None
+        """
+        self.__dict__.update(state)
+        self._busy = {id(driver): driver for driver in state["_busy"]}
+        self._ranks = {id(driver): rank for driver, rank in state["_ranks"]}
+
     def request_driver(self, rider):
         """ Return a driver for the rider, or None if no driver is available.
         Add the rider to the waiting list if there is no available driver.
@@ -55,22 +128,15 @@ class Dispatcher:
         """
         # Docstring examples have been omitted since a memory address
         # location is returned.
-        if self.driver_list.is_empty():
-            if not self.rider_list.contains(rider):
-                self.rider_list.add(rider)
-            return None
+        # Find the idle driver who can pick up rider the fastest; ties go
+        # to the driver who registered first
+        if self._batch_window is None:
+            driver = self._grid.nearest(rider.origin)
         else:
-            # Find the driver who can pick up rider the fastest
-            i = 0
-            driver = self.driver_list.first_element()
-            curr_time = driver.get_travel_time(rider.origin)
-            while i < len(self.driver_list):
-                if self.driver_list.items[i].get_travel_time(rider.origin) \
-                        < curr_time:
-                    driver = self.driver_list.items[i]
-                    curr_time = driver.get_travel_time(rider.origin)
-                i += 1
-            return driver
+            driver = None
+        if driver is None and not self.rider_list.contains(rider):
+            self.rider_list.add(rider)
+        return driver
 
     def request_rider(self, driver):
         """ Return a rider for the driver, or None if no rider is available.
@@ -82,11 +148,46 @@ class Dispatcher:
         # Docstring examples have been omitted since a memory address
         # location is returned.
         if not self.driver_list.contains(driver):
-            self.driver_list.items.append(driver)
-        if not self.rider_list.is_empty():
-            return self.rider_list.first_element()
+            self.add_driver(driver)
+        # Take the rider off the waiting list so that no other driver is
+        # sent to them as well
+        if self._batch_window is None and not self.rider_list.is_empty():
+            return self.rider_list.remove()
         return None
 
+    def add_driver(self, driver):
+        """ Register driver for future rider requests, without it asking for
+        a rider now.
+        @type self: Dispatcher
+        @type driver: Driver
+        @rtype: None
+        """
+        self.driver_list.add(driver)
+        # Ranks only grow, so they still give registration order after
+        # drivers are released
+        self._ranks[id(driver)] = self._next_rank
+        self._next_rank += 1
+        driver.register(self)
+
+    def release_driver(self, driver):
+        """ Forget the registered driver, which will no longer be used to
+        fulfill rider requests. The driver keeps its state.
+        @type self: Dispatcher
+        @type driver: Driver
+        @rtype: None
+        >>> a = Dispatcher()
+        >>> tom = Driver("Tom", Location(1, 1), 1)
+        >>> a.request_rider(tom)
+        >>> a.release_driver(tom)
+        >>> a.idle_count(), tom.is_idle
+        (0, True)
+        """
+        self.driver_list.remove_particular(driver)
+        self._grid.remove(driver)
+        self._busy.pop(id(driver), None)
+        del self._ranks[id(driver)]
+        driver.register(None)
+
     def cancel_ride(self, rider):
         """ Cancel the ride for rider.
         @type self: Dispatcher
@@ -94,3 +195,127 @@ class Dispatcher:
         @rtype: None
         """
         self.rider_list.remove_particular(rider)
+
+    def next_batch(self, timestamp):
+        """ Return the time of a batch that needs to be scheduled after a
+        request at <timestamp>, or None if no batch needs to be scheduled.
+        A batch is needed when riders are waiting, a driver is idle and no
+        batch is scheduled yet.
+        @type self: Dispatcher
+        @type timestamp: int
+        @rtype: int | None
+        >>> a = Dispatcher(batch_window=5)
+        >>> a.request_rider(Driver("Tom", Location(1, 1), 1))
+        >>> a.request_driver(Rider("Jorge", Location(1, 1), Location(1, 2), 9))
+        >>> a.next_batch(7)
+        10
+        >>> print(a.next_batch(8))
+        None
+        """
+        if self._batch_window is None or self._next_batch is not None or \
+                self.rider_list.is_empty() or len(self._grid) == 0:
+            return None
+        self._next_batch = (timestamp // self._batch_window + 1) * \
+            self._batch_window
+        return self._next_batch
+
+    def dispatch_batch(self):
+        """ Match the waiting riders to the idle drivers, take the matched
+        riders off the waiting list and return the (rider, driver) pairs.
+        Every returned driver must be sent to its rider.
+        @type self: Dispatcher
+        @rtype: list[tuple[Rider, Driver]]
+        >>> a = Dispatcher(batch_window=5)
+        >>> a.request_rider(Driver("Tom", Location(1, 1), 1))
+        >>> a.request_rider(Driver("Carl", Location(4, 4), 1))
+        >>> a.request_driver(Rider("Jorge", Location(1, 2), Location(1, 1), 9))
+        >>> a.request_driver(Rider("James", Location(2, 1), Location(1, 1), 5))
+        >>> [(str(r), str(d)) for r, d in a.dispatch_batch()]
+        [('James', 'Tom'), ('Jorge', 'Carl')]
+        """
+        self._next_batch = None
+        riders = self.rider_list.items
+        if len(riders) * len(self._grid) <= self._exact_limit:
+            drivers = self._grid.drivers()
+            pairs = [(riders[i], drivers[j]) for i, j in
+                     hungarian(travel_times(riders, drivers))]
+        else:
+            pairs = greedy(riders, self._grid)
+        for rider, _ in pairs:
+            self.rider_list.remove_particular(rider)
+        return pairs
+
+    def move_driver(self, driver, location):
+        """ Record that driver has moved to location.
+        @type self: Dispatcher
+        @type driver: Driver
+        @type location: Location
+        @rtype: None
+        """
+        driver.location = location
+        if self._grid.contains(driver):
+            self._grid.move(driver, location)
+
+    def driver_status_changed(self, driver):
+        """ Move a registered driver between the idle and busy drivers,
+        according to driver.is_idle.
+        @type self: Dispatcher
+        @type driver: Driver
+        @rtype: None
+        """
+        if driver.is_idle:
+            self._busy.pop(id(driver), None)
+            if not self._grid.contains(driver):
+                self._grid.add(driver, self._ranks[id(driver)])
+        else:
+            self._grid.remove(driver)
+            self._busy[id(driver)] = driver
+
+    def idle_drivers(self):
+        """ Return the idle registered drivers, in registration order.
+        @type self: Dispatcher
+        @rtype: list[Driver]
+        """
+        return self._grid.drivers()
+
+    def idle_count(self):
+        """ Return the number of idle registered drivers.
+        @type self: Dispatcher
+        @rtype: int
+        >>> a = Dispatcher()
+        >>> a.request_rider(Driver("Tom", Location(1, 1), 1))
+        >>> a.idle_count()
+        1
+        """
+        return len(self._grid)
+
+    def busy_count(self):
+        """ Return the number of busy registered drivers.
+        @type self: Dispatcher
+        @rtype: int
+        >>> a = Dispatcher()
+        >>> jorge = Rider("Jorge", Location(1, 1), Location(1, 2), 14)
+        >>> a.request_driver(jorge)
+        >>> tom = Driver("Tom", Location(1, 1), 1)
+        >>> a.request_rider(tom).id
+        'Jorge'
+        >>> tom.start_drive(Location(1, 1))
+        0
+        >>> a.busy_count()
+        1
+        """
+        return len(self._busy)
+
+    def utilisation(self):
+        """ Return the fraction of registered drivers that are busy, or 0.0
+        if no driver has registered.
+        @type self: Dispatcher
+        @rtype: float
+        >>> a = Dispatcher()
+        >>> a.utilisation()
+        0.0
+        """
+        total = len(self._grid) + len(self._busy)
+        if total == 0:
+            return 0.0
+        return len(self._busy) / total
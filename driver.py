@@ -1,9 +1,11 @@
-from location import Location, manhattan_distance
+from location import Location, travel_distance
 from rider import Rider, SATISFIED
 
 
-class Driver:
+class BaseDriver:
     """ A driver for a ride-sharing service.
+    This class has no slots, so that a subclass decides how the attributes
+    are kept: Driver keeps them on the object.
     === Attributes ===
     @type id: str
         A unique identifier for the driver.
@@ -11,22 +13,19 @@ class Driver:
         The current location of the driver.
     @type is_idle: bool
         A property that is True if the driver is idle and False otherwise.
+        It is None until the driver registers with a dispatcher.
+    === Private Attributes ===
+    @type _is_idle: bool | None
+        The value behind is_idle.
+    @type _dispatcher: Dispatcher | None
+        The dispatcher this driver is registered with, which is told
+        whenever the driver becomes idle or busy.
     """
-
-    def __init__(self, identifier, location, speed):
-        """ Initialize a Driver.
-        @type self: Driver
-        @type identifier: str
-        @type location: Location
-        @type speed: int
-        @rtype: None
-        """
-        self.id, self.location, self.speed, self.is_idle = identifier, \
-            location, speed, None
+    __slots__ = ()
 
     def __str__(self):
         """ Return a string representation.
-        @type self: Driver
+        @type self: BaseDriver
         @rtype: str
         >>> a = Driver("Tom", Location(5,6), 2)
         >>> print(a)
@@ -36,7 +35,7 @@ class Driver:
 
     def __eq__(self, other):
         """ Return True if self equals other, and false otherwise.
-        @type self: Driver
+        @type self: BaseDriver
         @rtype: bool
         >>> first = Driver("Tom", Location(5,6), 2)
         >>> second = Driver("Tom", Location(2,2), 6)
@@ -50,10 +49,50 @@ class Driver:
         return self.id == other.id and self.location == other.location and \
             self.speed == other.speed
 
+    @property
+    def is_idle(self):
+        """ Return True if the driver is idle and False otherwise.
+        @type self: BaseDriver
+        @rtype: bool | None
+        >>> a = Driver("Tom", Location(5,6), 2)
+        >>> print(a.is_idle)
+        None
+        >>> a.end_drive()
+        >>> a.is_idle
+        True
+        """
+        return self._is_idle
+
+    @is_idle.setter
+    def is_idle(self, value):
+        """ Set whether the driver is idle, and tell the dispatcher.
+        @type self: BaseDriver
+        @type value: bool
+        @rtype: None
+        """
+        self._is_idle = value
+        if self._dispatcher is not None:
+            self._dispatcher.driver_status_changed(self)
+
+    def register(self, dispatcher):
+        """ Register with dispatcher, or unregister if dispatcher is None.
+        A driver that has not been given work yet becomes idle.
+        @type self: BaseDriver
+        @type dispatcher: Dispatcher | None
+        @rtype: None
+        """
+        self._dispatcher = dispatcher
+        if dispatcher is None:
+            return
+        if self._is_idle is None:
+            self.is_idle = True
+        else:
+            dispatcher.driver_status_changed(self)
+
     def get_travel_time(self, destination):
         """ Return the time it will take to arrive at the destination,
         rounded to the nearest integer.
-        @type self: Driver
+        @type self: BaseDriver
         @type destination: Location
         @rtype: int
         >>> a = Driver("Tom", Location(5,6), 2)
@@ -63,12 +102,12 @@ class Driver:
         1
         """
         # Time is distance divided by speed
-        return round(manhattan_distance(self.location, destination) /
+        return round(travel_distance(self.location, destination) /
                      self.speed)
 
     def start_drive(self, location):
         """ Start driving to the location and return the time the drive will take.
-        @type self: Driver
+        @type self: BaseDriver
         @type location: Location
         @rtype: int
         >>> a = Driver("Tom", Location(5,6), 2)
@@ -81,14 +120,14 @@ class Driver:
     def end_drive(self):
         """ End the drive and arrive at the destination.
         Precondition: self.destination is not None.
-        @type self: Driver
+        @type self: BaseDriver
         @rtype: None
         """
         self.is_idle = True
 
     def start_ride(self, rider):
         """ Start a ride and return the time the ride will take.
-        @type self: Driver
+        @type self: BaseDriver
         @type rider: Rider
         @rtype: int
         >>> a = Driver("Tom", Location(5,6), 2)
@@ -104,8 +143,25 @@ class Driver:
         """ End the current ride, and arrive at the rider's destination.
         Precondition: The driver has a rider.
         Precondition: self.destination is not None.
-        @type self: Driver
+        @type self: BaseDriver
         @rtype: None
         """
         self.is_idle = True
         # rider status is not changed
+
+
+class Driver(BaseDriver):
+    """ A driver whose attributes are kept on the object.
+    """
+    __slots__ = ("id", "location", "speed", "_is_idle", "_dispatcher")
+
+    def __init__(self, identifier, location, speed):
+        """ Initialize a Driver.
+        @type self: Driver
+        @type identifier: str
+        @type location: Location
+        @type speed: int
+        @rtype: None
+        """
+        self.id, self.location, self.speed = identifier, location, speed
+        self._is_idle, self._dispatcher = None, None
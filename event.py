@@ -2,11 +2,14 @@
 This file should contain all of the classes necessary to model the different
 kinds of events in the simulation.
 """
+from inspect import signature
+
 from rider import Rider, WAITING, CANCELLED, SATISFIED
 from dispatcher import Dispatcher
 from driver import Driver
 from location import deserialize_location
-from monitor import Monitor, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+from monitor import Monitor, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF, \
+    MATCH
 
 
 class Event:
@@ -14,15 +17,25 @@ class Event:
     Events have an ordering that is based on the event timestamp: Events with
     older timestamps are less than those with newer timestamps.
     This class is abstract; subclasses must implement do().
+    The events of this module do so through happen(), which does an event
+    given only its timestamp and actors, so that run_compact does events
+    without making Event objects for them. happen() spawns each new event
+    by calling spawn(target, timestamp, kind, rider, driver), where kind is
+    the Event class of the new event.
     You may, if you wish, change the API of this class to add
     extra public methods or attributes. Make sure that anything
     you add makes sense for ALL events, and not just a particular
     event type.
     Document any such changes carefully!
+    Events are slotted to keep them small, so a subclass that adds
+    attributes must list them in __slots__.
+    A subclass whose do() takes no schedule and returns its new events
+    still works: its do() is wrapped to schedule the events it returns.
     === Attributes ===
     @type timestamp: int
         A timestamp for this event.
     """
+    __slots__ = ("timestamp",)
 
     def __init__(self, timestamp):
         """ Initialize an Event with a given timestamp.
@@ -137,21 +150,44 @@ class Event:
         """
         raise NotImplementedError("Implemented in a subclass")
 
-    def do(self, dispatcher, monitor):
+    def __init_subclass__(cls, **kwargs):
+        """ Wrap the do() of subclass <cls>, if it takes no schedule.
+        @type cls: type
+        @rtype: None
+        >>> class Echo(Event):
+        ...     __slots__ = ()
+        ...     def do(self, dispatcher, monitor):
+        ...         return [Event(self.timestamp + 1)]
+        >>> scheduled = []
+        >>> Echo(3).do(None, None, scheduled.append)
+        >>> [event.timestamp for event in scheduled]
+        [4]
+        >>> [event.timestamp for event in Echo(5).do(None, None)]
+        [6]
+        """
+        super().__init_subclass__(**kwargs)
+        do = cls.__dict__.get("do")
+        if do is not None and "schedule" not in signature(do).parameters:
+            cls.do = _scheduling(do)
+
+    def do(self, dispatcher, monitor, schedule=None):
         """ Do this Event.
         Update the state of the simulation, using the dispatcher, and any
         attributes according to the meaning of the event.
         Notify the monitor of any activities that have occurred during the
         event.
-        Return a list of new events spawned by this event (making sure the
-        timestamps are correct).
+        Pass each new event spawned by this event (making sure the
+        timestamps are correct) to <schedule>, in order, or return a list
+        of them if no <schedule> is given.
         Note: the "business logic" of what actually happens should not be
         handled in any Event classes.
 
         @type self: Event
         @type dispatcher: Dispatcher
         @type monitor: Monitor
-        @rtype: list[Event]
+        @type schedule: (Event) -> None | None
+            Called with each new event, such as the add of the event queue.
+        @rtype: list[Event] | None
         """
         raise NotImplementedError("Implemented in a subclass")
 
@@ -162,6 +198,7 @@ class RiderRequest(Event):
     @type rider: Rider
         The rider.
     """
+    __slots__ = ("rider",)
 
     def __init__(self, timestamp, rider):
         """ Initialize a RiderRequest event.
@@ -175,33 +212,56 @@ class RiderRequest(Event):
         super().__init__(timestamp)
         self.rider = rider
 
-    def do(self, dispatcher, monitor):
+    def do(self, dispatcher, monitor, schedule=None):
         """ Assign the rider to a driver or add the rider to a waiting list.
         If the rider is assigned to a driver, the driver starts driving to
         the rider.
-        Return a Cancellation event. If the rider is assigned to a driver,
-        also return a Pickup event.
+        Schedule a Cancellation event. If the rider is assigned to a
+        driver, also schedule a Pickup event.
         @type self: RiderRequest
         @type dispatcher: Dispatcher
         @type monitor: Monitor
-        @rtype: list[Event]
+        @type schedule: (Event) -> None | None
+        @rtype: list[Event] | None
         """
         # Docstring examples have been omitted since a memory address
         # location is returned.
-        self.rider.initial = self.timestamp
+        events = None
+        if schedule is None:
+            events = []
+            schedule = events.append
+        self.happen(self.timestamp, self.rider, None, dispatcher, monitor,
+                    _schedule_event, schedule)
+        return events
+
+    @staticmethod
+    def happen(timestamp, rider, driver, dispatcher, monitor, spawn,
+               target):
+        """ Do a RiderRequest by <rider> at <timestamp>, as do() does,
+        spawning the new events.
+        @type timestamp: int
+        @type rider: Rider
+        @type driver: None
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @type spawn: (object, int, type, Rider | None, Driver | None) ->
+            None
+        @type target: object
+        @rtype: None
+        """
+        rider.initial = timestamp
         # Notify the monitor
-        monitor.notify(self.timestamp, RIDER, REQUEST,
-                       self.rider.id, self.rider.origin)
-        # Begin keeping track of the consequences of the current event
-        events = []
-        driver = dispatcher.request_driver(self.rider)
+        monitor.notify(timestamp, RIDER, REQUEST, rider.id, rider.origin)
+        driver = dispatcher.request_driver(rider)
         if driver is not None:
-            travel_time = driver.start_drive(self.rider.origin)
-            events.append(Pickup(self.timestamp + travel_time, self.rider,
-                                 driver))
-        events.append(Cancellation(self.timestamp + self.rider.patience,
-                                   self.rider))
-        return events
+            monitor.notify(timestamp, DRIVER, MATCH, driver.id,
+                           driver.location)
+            travel_time = driver.start_drive(rider.origin)
+            spawn(target, timestamp + travel_time, Pickup, rider, driver)
+        batch_time = dispatcher.next_batch(timestamp)
+        if batch_time is not None:
+            spawn(target, batch_time, Dispatch, None, None)
+        spawn(target, timestamp + rider.patience, Cancellation, rider, None)
 
     def __str__(self):
         """ Return a string representation of this event.
@@ -220,6 +280,7 @@ class DriverRequest(Event):
     @type driver: Driver
         The driver.
     """
+    __slots__ = ("driver",)
 
     def __init__(self, timestamp, driver):
         """ Initialize a DriverRequest event.
@@ -233,33 +294,57 @@ class DriverRequest(Event):
         super().__init__(timestamp)
         self.driver = driver
 
-    def do(self, dispatcher, monitor):
+    def do(self, dispatcher, monitor, schedule=None):
         """ Register the driver, if this is the first request, and
         assign a rider to the driver, if one is available.
-        If a rider is available, return a Pickup event.
+        If a rider is available, schedule a Pickup event.
         @type self: DriverRequest
         @type dispatcher: Dispatcher
         @type monitor: Monitor
-        @rtype: list[Event]
+        @type schedule: (Event) -> None | None
+        @rtype: list[Event] | None
         """
         # Docstring examples have been omitted since a memory address
         # location is returned.
-        
+        events = None
+        if schedule is None:
+            events = []
+            schedule = events.append
+        self.happen(self.timestamp, None, self.driver, dispatcher, monitor,
+                    _schedule_event, schedule)
+        return events
+
+    @staticmethod
+    def happen(timestamp, rider, driver, dispatcher, monitor, spawn,
+               target):
+        """ Do a DriverRequest by <driver> at <timestamp>, as do() does,
+        spawning the new events.
+        @type timestamp: int
+        @type rider: None
+        @type driver: Driver
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @type spawn: (object, int, type, Rider | None, Driver | None) ->
+            None
+        @type target: object
+        @rtype: None
+        """
         # Notify the monitor about the request.
-        monitor.notify(self.timestamp, DRIVER, REQUEST,
-                       self.driver.id, self.driver.location)
-                       
+        monitor.notify(timestamp, DRIVER, REQUEST, driver.id,
+                       driver.location)
         # Request a rider from the dispatcher.
         # If there is one available, the driver starts driving towards the
-        # rider, and the method returns a Pickup event for when the driver
+        # rider, and the method schedules a Pickup event for when the driver
         # arrives at the riders location.
-        events = []
-        rider = dispatcher.request_rider(self.driver)
+        rider = dispatcher.request_rider(driver)
         if rider is not None:
-            travel_time = self.driver.start_drive(rider.origin)
-            events.append(Pickup(self.timestamp + travel_time, rider,
-                                 self.driver))
-        return events
+            monitor.notify(timestamp, DRIVER, MATCH, driver.id,
+                           driver.location)
+            travel_time = driver.start_drive(rider.origin)
+            spawn(target, timestamp + travel_time, Pickup, rider, driver)
+        batch_time = dispatcher.next_batch(timestamp)
+        if batch_time is not None:
+            spawn(target, batch_time, Dispatch, None, None)
 
     def __str__(self):
         """ Return a string representation of this event.
@@ -278,6 +363,7 @@ class Cancellation(Event):
     @type rider: Rider
         The rider
     """
+    __slots__ = ("rider",)
 
     def __init__(self, timestamp, rider):
         """ Initialize a Cancellation event
@@ -291,20 +377,42 @@ class Cancellation(Event):
         super().__init__(timestamp)
         self.rider = rider
 
-    def do(self, dispatcher, monitor):
+    def do(self, dispatcher, monitor, schedule=None):
         """ Cancels the request from a waiting rider
         @type self: Cancellation
         @type dispatcher: Dispatcher
         @type monitor: Monitor
+        @type schedule: (Event) -> None | None
+        @rtype: list[Event] | None
+        """
+        events = None
+        if schedule is None:
+            events = []
+            schedule = events.append
+        self.happen(self.timestamp, self.rider, None, dispatcher, monitor,
+                    _schedule_event, schedule)
+        return events
+
+    @staticmethod
+    def happen(timestamp, rider, driver, dispatcher, monitor, spawn,
+               target):
+        """ Do a Cancellation by <rider> at <timestamp>, as do() does.
+        @type timestamp: int
+        @type rider: Rider
+        @type driver: None
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @type spawn: (object, int, type, Rider | None, Driver | None) ->
+            None
+        @type target: object
         @rtype: None
         """
         # Notify the monitor
-        monitor.notify(self.timestamp, RIDER, CANCEL, self.rider.id,
-                       self.rider.origin)
+        monitor.notify(timestamp, RIDER, CANCEL, rider.id, rider.origin)
         # Change the rider status
-        if self.rider.status is WAITING:
-            self.rider.status = CANCELLED
-            dispatcher.cancel_ride(self.rider)
+        if rider.status is WAITING:
+            rider.status = CANCELLED
+            dispatcher.cancel_ride(rider)
 
     def __str__(self):
         """ Return a string representation of this event.
@@ -325,6 +433,7 @@ class Pickup(Event):
     @type driver: Driver
         The driver
     """
+    __slots__ = ("rider", "driver")
 
     def __init__(self, timestamp, rider, driver):
         """ Initialize a Pickup event
@@ -339,35 +448,52 @@ class Pickup(Event):
         self.rider = rider
         self.driver = driver
 
-    def do(self, dispatcher, monitor):
+    def do(self, dispatcher, monitor, schedule=None):
         """ Driver picks up a rider
         @type self: Pickup
         @type dispatcher: Dispatcher
         @type monitor: Monitor
-        @rtype: list[Event]
+        @type schedule: (Event) -> None | None
+        @rtype: list[Event] | None
         """
         # Docstring examples have been omitted since a memory address
         # location is returned.
-        
-        # Begin keeping track of the consequences of this event
-        events = []
-        self.driver.location = self.rider.origin
-        if self.rider.initial + self.rider.patience > self.timestamp:
-            monitor.notify(self.timestamp, DRIVER, PICKUP, self.driver.id,
-                           self.driver.location)
-            monitor.notify(self.timestamp, RIDER, PICKUP, self.rider.id,
-                           self.rider.origin)
-
-            travel_time = self.driver.start_ride(self.rider)
-            # This might change after Dropoff is implemented
-            events.append(Dropoff(self.timestamp + travel_time, self.rider,
-                                  self.driver))
-        else:
-            self.driver.end_ride()
-            events.append(Cancellation(self.timestamp, self.rider))
-            events.append(DriverRequest(self.timestamp, self.driver))
+        events = None
+        if schedule is None:
+            events = []
+            schedule = events.append
+        self.happen(self.timestamp, self.rider, self.driver, dispatcher,
+                    monitor, _schedule_event, schedule)
         return events
 
+    @staticmethod
+    def happen(timestamp, rider, driver, dispatcher, monitor, spawn,
+               target):
+        """ Do a Pickup of <rider> by <driver> at <timestamp>, as do()
+        does, spawning the new events.
+        @type timestamp: int
+        @type rider: Rider
+        @type driver: Driver
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @type spawn: (object, int, type, Rider | None, Driver | None) ->
+            None
+        @type target: object
+        @rtype: None
+        """
+        dispatcher.move_driver(driver, rider.origin)
+        if rider.initial + rider.patience > timestamp:
+            monitor.notify(timestamp, DRIVER, PICKUP, driver.id,
+                           driver.location)
+            monitor.notify(timestamp, RIDER, PICKUP, rider.id, rider.origin)
+
+            travel_time = driver.start_ride(rider)
+            spawn(target, timestamp + travel_time, Dropoff, rider, driver)
+        else:
+            driver.end_ride()
+            spawn(target, timestamp, Cancellation, rider, None)
+            spawn(target, timestamp, DriverRequest, None, driver)
+
     def __str__(self):
         """ Return a string representation of this event.
         @type self: Pickup
@@ -389,6 +515,7 @@ class Dropoff(Event):
     @type driver: Driver
         The driver
     """
+    __slots__ = ("rider", "driver")
 
     def __init__(self, timestamp, rider, driver):
         """ Initialize a Dropoff event
@@ -403,24 +530,45 @@ class Dropoff(Event):
         self.rider = rider
         self.driver = driver
 
-    def do(self, dispatcher, monitor):
+    def do(self, dispatcher, monitor, schedule=None):
         """ Driver drops off a rider
         @type self: Dropoff
         @type dispatcher: Dispatcher
         @type monitor: Monitor
+        @type schedule: (Event) -> None | None
+        @rtype: list[Event] | None
+        """
+        events = None
+        if schedule is None:
+            events = []
+            schedule = events.append
+        self.happen(self.timestamp, self.rider, self.driver, dispatcher,
+                    monitor, _schedule_event, schedule)
+        return events
+
+    @staticmethod
+    def happen(timestamp, rider, driver, dispatcher, monitor, spawn,
+               target):
+        """ Do a Dropoff of <rider> by <driver> at <timestamp>, as do()
+        does, spawning the new events.
+        @type timestamp: int
+        @type rider: Rider
+        @type driver: Driver
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @type spawn: (object, int, type, Rider | None, Driver | None) ->
+            None
+        @type target: object
         @rtype: None
         """
-        self.driver.location = self.rider.destination
+        dispatcher.move_driver(driver, rider.destination)
         # Notify the monitor
-        monitor.notify(self.timestamp, DRIVER, DROPOFF, self.driver.id,
-                       self.rider.destination)
-        # Begin keeping track of the consequences of this event
-        events = []
-        self.driver.end_ride()
-        self.rider.status = SATISFIED
-        dispatcher.rider_list.remove_particular(self.rider)
-        events.append(DriverRequest(self.timestamp, self.driver))
-        return events
+        monitor.notify(timestamp, DRIVER, DROPOFF, driver.id,
+                       rider.destination)
+        driver.end_ride()
+        rider.status = SATISFIED
+        dispatcher.rider_list.remove_particular(rider)
+        spawn(target, timestamp, DriverRequest, None, driver)
 
     def __str__(self):
         """ Return a string representation of this event.
@@ -435,18 +583,140 @@ class Dropoff(Event):
                                               self.rider)
 
 
-def create_event_list(filename):
+class Dispatch(Event):
+    """ The dispatcher matches a batch of waiting riders to idle drivers.
+    Only used when the dispatcher has a batch window.
+    """
+    __slots__ = ()
+
+    def do(self, dispatcher, monitor, schedule=None):
+        """ Send every matched driver to their rider.
+        Schedule a Pickup event for each match.
+        @type self: Dispatch
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @type schedule: (Event) -> None | None
+        @rtype: list[Event] | None
+        """
+        events = None
+        if schedule is None:
+            events = []
+            schedule = events.append
+        self.happen(self.timestamp, None, None, dispatcher, monitor,
+                    _schedule_event, schedule)
+        return events
+
+    @staticmethod
+    def happen(timestamp, rider, driver, dispatcher, monitor, spawn,
+               target):
+        """ Do a Dispatch at <timestamp>, as do() does, spawning the new
+        events.
+        @type timestamp: int
+        @type rider: None
+        @type driver: None
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @type spawn: (object, int, type, Rider | None, Driver | None) ->
+            None
+        @type target: object
+        @rtype: None
+        """
+        for rider, driver in dispatcher.dispatch_batch():
+            monitor.notify(timestamp, DRIVER, MATCH, driver.id,
+                           driver.location)
+            travel_time = driver.start_drive(rider.origin)
+            spawn(target, timestamp + travel_time, Pickup, rider, driver)
+
+    def __str__(self):
+        """ Return a string representation of this event.
+        @type self: Dispatch
+        @rtype: str
+        >>> print(Dispatch(10))
+        10 -- Dispatcher: Match a batch
+        """
+        return "{} -- Dispatcher: Match a batch".format(self.timestamp)
+
+
+def make_event(timestamp, kind, rider, driver):
+    """ Return the Event of class <kind> at <timestamp>, for <rider> and
+    <driver>.
+    @type timestamp: int
+    @type kind: type
+    @type rider: Rider | None
+    @type driver: Driver | None
+    @rtype: Event
+    >>> print(make_event(4, DriverRequest, None, Driver("Tom", (5,6), 2)))
+    4 -- Tom: Request a rider
+    """
+    if kind is Pickup or kind is Dropoff:
+        return kind(timestamp, rider, driver)
+    if kind is DriverRequest:
+        return kind(timestamp, driver)
+    if kind is Dispatch:
+        return kind(timestamp)
+    return kind(timestamp, rider)
+
+
+def _schedule_event(schedule, timestamp, kind, rider, driver):
+    """ Pass the Event of class <kind> at <timestamp>, for <rider> and
+    <driver>, to <schedule>. This is how the events of do() spawn events.
+    @type schedule: (Event) -> None
+    @type timestamp: int
+    @type kind: type
+    @type rider: Rider | None
+    @type driver: Driver | None
+    @rtype: None
+    """
+    schedule(make_event(timestamp, kind, rider, driver))
+
+
+def _scheduling(do):
+    """ Return a do() that schedules the events returned by the do() of an
+    Event subclass written to return them, <do>.
+    @type do: (Event, Dispatcher, Monitor) -> list[Event] | None
+    @rtype: (Event, Dispatcher, Monitor, (Event) -> None | None) ->
+        list[Event] | None
+    """
+    def scheduling_do(self, dispatcher, monitor, schedule=None):
+        events = do(self, dispatcher, monitor)
+        if schedule is None:
+            return events
+        for event in events or ():
+            schedule(event)
+    scheduling_do.__doc__ = do.__doc__
+    return scheduling_do
+
+
+def create_event_list(filename, store=None):
     """ Return a list of Events based on raw list of events in <filename>.
     Precondition: the file stored at <filename> is in the format specified
     by the assignment handout.
     @type filename: str
         The name of a file that contains the list of events.
+    @type store: ActorStore | None
+        If given, the riders and drivers are kept in <store> instead of in
+        their own objects.
     @rtype: list[Event]
     """
     # Docstring examples have been omitted since a memory address
     # location is returned/requires user input <filename>
-    
-    events = []
+    return list(iter_events(filename, store))
+
+
+def iter_events(filename, store=None):
+    """ Yield the Events in <filename> one at a time, reading the file only
+    as far as the events asked for so far.
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout.
+    @type filename: str
+        The name of a file that contains the list of events.
+    @type store: ActorStore | None
+        If given, the riders and drivers are kept in <store> instead of in
+        their own objects.
+    @rtype: generator
+    >>> [str(event) for event in iter_events("events_small.txt")]
+    ['1 -- Dan: Request a driver', '10 -- Arnold: Request a rider']
+    """
     # Open the file
     with open(filename, "r") as file:
         for line in file:
@@ -471,13 +741,19 @@ def create_event_list(filename):
                 origin = deserialize_location(tokens[3])
                 destination = deserialize_location(tokens[4])
                 patience = int(tokens[5])
-                event = RiderRequest(timestamp, Rider(actor_id, origin,
-                                                      destination, patience))
+                if store is None:
+                    rider = Rider(actor_id, origin, destination, patience)
+                else:
+                    rider = store.add_rider(actor_id, origin, destination,
+                                            patience)
+                event = RiderRequest(timestamp, rider)
             elif event_type == "DriverRequest":
                 actor_id = tokens[2]
                 location = deserialize_location(tokens[3])
                 speed = int(tokens[4])
-                event = DriverRequest(timestamp, Driver(actor_id, location,
-                                                        speed))
-            events.append(event)
-    return events
+                if store is None:
+                    driver = Driver(actor_id, location, speed)
+                else:
+                    driver = store.add_driver(actor_id, location, speed)
+                event = DriverRequest(timestamp, driver)
+            yield event
@@ -0,0 +1,320 @@
+"""
+The eventlog module contains the event logs a Simulation can write the
+events it has done to.
+
+PrintLog prints every event as it happens, which is what a simulation does
+by default. NullLog throws events away. RingLog keeps only the most recent
+events, and only formats them when asked. BufferedFileLog and ThreadedLog
+write to a file in large batches, ThreadedLog from a background thread.
+"""
+import sys
+from collections import deque
+from queue import Queue
+from threading import Thread
+
+
+class EventLog:
+    """ A record of the events done in a simulation.
+    This is an abstract class.  Only child classes should be instantiated.
+    === Attributes ===
+    @type enabled: bool
+        False if logging an event does nothing, so the simulation does not
+        need to call log at all.
+    """
+    enabled = True
+
+    def log(self, event):
+        """ Record that <event> has been done.
+        @type self: EventLog
+        @type event: Event
+        @rtype: None
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def flush(self):
+        """ Write out any events that are still buffered.
+        @type self: EventLog
+        @rtype: None
+        """
+        pass
+
+    def close(self):
+        """ Flush <self> and release anything it holds open.
+        @type self: EventLog
+        @rtype: None
+        """
+        self.flush()
+
+
+class PrintLog(EventLog):
+    """ An event log that prints every event as it is logged.
+    === Private Attributes ===
+    @type _file: file | None
+        Where to print, or None for standard output.
+    """
+
+    def __init__(self, file=None):
+        """ Initialize a PrintLog that prints to <file>, or to standard
+        output if no file is given.
+        @type self: PrintLog
+        @type file: file | None
+        @rtype: None
+        """
+        self._file = file
+
+    def log(self, event):
+        """ Print <event>.
+        @type self: PrintLog
+        @type event: Event
+        @rtype: None
+        >>> from event import Dispatch
+        >>> PrintLog().log(Dispatch(3))
+        3 -- Dispatcher: Match a batch
+        """
+        print(event, file=self._file or sys.stdout)
+
+
+class NullLog(EventLog):
+    """ An event log that discards every event.
+    """
+    enabled = False
+
+    def log(self, event):
+        """ Discard <event>.
+        @type self: NullLog
+        @type event: Event
+        @rtype: None
+        """
+        pass
+
+
+class RingLog(EventLog):
+    """ An event log that keeps the most recent events in memory.
+    Events are only formatted when lines() is called.
+    === Private Attributes ===
+    @type _events: deque[Event]
+        The most recent events, oldest first.
+    """
+
+    def __init__(self, capacity=1000):
+        """ Initialize a RingLog that keeps the last <capacity> events.
+        @type self: RingLog
+        @type capacity: int
+        @rtype: None
+        """
+        self._events = deque(maxlen=capacity)
+
+    def log(self, event):
+        """ Keep <event>, forgetting the oldest event if the log is full.
+        @type self: RingLog
+        @type event: Event
+        @rtype: None
+        """
+        self._events.append(event)
+
+    def lines(self):
+        """ Return the kept events as strings, oldest first.
+        @type self: RingLog
+        @rtype: list[str]
+        >>> from event import Dispatch
+        >>> ring = RingLog(2)
+        >>> for time in range(3):
+        ...     ring.log(Dispatch(time))
+        >>> ring.lines()
+        ['1 -- Dispatcher: Match a batch', '2 -- Dispatcher: Match a batch']
+        """
+        return [str(event) for event in self._events]
+
+
+class BufferedFileLog(EventLog):
+    """ An event log that writes events to a file in large batches.
+    === Private Attributes ===
+    @type _file: file
+        The file written to.
+    @type _owns_file: bool
+        True if the log opened _file, and so must close it.
+    @type _buffer: list[str]
+        The formatted events not yet written.
+    @type _batch_size: int
+        The number of events written at a time.
+    """
+
+    def __init__(self, file, batch_size=65536):
+        """ Initialize a BufferedFileLog writing to <file>, which is either
+        an open text file or the name of a file to create.
+        @type self: BufferedFileLog
+        @type file: file | str
+        @type batch_size: int
+        @rtype: None
+        """
+        self._owns_file = isinstance(file, str)
+        self._file = open(file, "w") if self._owns_file else file
+        self._buffer = []
+        self._batch_size = batch_size
+
+    def log(self, event):
+        """ Buffer <event>, writing the buffer out once it is full.
+        @type self: BufferedFileLog
+        @type event: Event
+        @rtype: None
+        """
+        self._buffer.append(str(event))
+        if len(self._buffer) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Write out the buffered events.
+        @type self: BufferedFileLog
+        @rtype: None
+        >>> import io
+        >>> from event import Dispatch
+        >>> out = io.StringIO()
+        >>> log = BufferedFileLog(out, batch_size=10)
+        >>> log.log(Dispatch(3))
+        >>> out.getvalue()
+        ''
+        >>> log.flush()
+        >>> out.getvalue()
+        '3 -- Dispatcher: Match a batch\\n'
+        """
+        if self._buffer:
+            # Drop the events even if the write fails, rather than write
+            # them twice when it is tried again
+            lines, self._buffer = self._buffer, []
+            lines.append("")
+            self._file.write("\n".join(lines))
+        self._file.flush()
+
+    def close(self):
+        """ Flush <self>, and close its file if it opened it.
+        @type self: BufferedFileLog
+        @rtype: None
+        """
+        try:
+            self.flush()
+        finally:
+            if self._owns_file:
+                self._file.close()
+
+
+class ThreadedLog(EventLog):
+    """ An event log that formats and writes events to a file in a
+    background thread, so the simulation only hands events over.
+    Events are handed over in batches to keep the cost per event low.
+    If writing fails, the error is raised again by the next call to log,
+    flush or close.
+    === Private Attributes ===
+    @type _writer: BufferedFileLog
+        The log the background thread writes through.
+    @type _queue: Queue
+        Batches of events waiting for the background thread, and None once
+        the log is closed.
+    @type _batch: list[Event]
+        The events not handed over yet.
+    @type _batch_size: int
+        The number of events handed over at a time.
+    @type _thread: Thread
+        The background thread.
+    @type _error: Exception | None
+        The error the background thread failed to write with, if any.
+    """
+
+    def __init__(self, file, batch_size=4096):
+        """ Initialize a ThreadedLog writing to <file>, which is either an
+        open text file or the name of a file to create.
+        @type self: ThreadedLog
+        @type file: file | str
+        @type batch_size: int
+        @rtype: None
+        """
+        self._writer = BufferedFileLog(file)
+        # Bound the queue so a slow disk slows the simulation down instead
+        # of piling events up in memory
+        self._queue = Queue(maxsize=64)
+        self._batch = []
+        self._batch_size = batch_size
+        self._error = None
+        self._thread = Thread(target=self._write_batches, daemon=True)
+        self._thread.start()
+
+    def log(self, event):
+        """ Hand <event> over to the background thread.
+        @type self: ThreadedLog
+        @type event: Event
+        @rtype: None
+        """
+        if self._error is not None:
+            raise self._error
+        self._batch.append(event)
+        if len(self._batch) >= self._batch_size:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def flush(self):
+        """ Hand over the remaining events and wait until every event handed
+        over so far has been written.
+        @type self: ThreadedLog
+        @rtype: None
+        >>> import io
+        >>> from event import Dispatch
+        >>> out = io.StringIO()
+        >>> log = ThreadedLog(out)
+        >>> log.log(Dispatch(3))
+        >>> log.flush()
+        >>> out.getvalue()
+        '3 -- Dispatcher: Match a batch\\n'
+        >>> log.close()
+        """
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """ Flush <self>, stop the background thread, and close the file if
+        the log opened it.
+        @type self: ThreadedLog
+        @rtype: None
+        >>> import io
+        >>> from event import Dispatch
+        >>> class FullFile(io.StringIO):
+        ...     def write(self, text):
+        ...         raise OSError("disk full")
+        >>> log = ThreadedLog(FullFile())
+        >>> log.log(Dispatch(3))
+        >>> log.close()
+        Traceback (most recent call last):
+        ...
+        OSError: disk full
+        """
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+            self._writer.close()
+
+    def _write_batches(self):
+        """ Write the batches handed over, until the log is closed.
+        Run in the background thread.
+        @type self: ThreadedLog
+        @rtype: None
+        """
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                self._queue.task_done()
+                return
+            try:
+                # Once writing has failed, drop the rest so that nothing
+                # waiting on the queue blocks
+                if self._error is None:
+                    for event in batch:
+                        self._writer.log(event)
+                    self._writer.flush()
+            except Exception as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
@@ -1,10 +1,49 @@
+"""
+The location module contains the Location class and functions for
+computing Manhattan distances between locations.
+
+Drivers, the dispatcher and the monitors measure how far apart two
+locations are with travel_distance. That is the Manhattan distance, unless
+a road network has been set with set_road_network, in which case it is the
+length of the shortest route along its roads (see the roads module). Road
+routes are never shorter than the Manhattan distance, so the Manhattan
+distance is still a lower bound on how far apart locations are.
+
+The batch distance functions work on contiguous int32 coordinate arrays
+when NumPy is installed and there are at least BATCH_THRESHOLD distances
+to compute. Smaller batches, or every batch without NumPy, fall back to
+manhattan_distance.
+=== Constants ===
+@type BATCH_THRESHOLD: int
+    The smallest number of distances that is computed with NumPy.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BATCH_THRESHOLD = 64
+
+# The Locations handed out by intern_location, keyed by (row, column)
+_interned = {}
+
+# The road network travel distances are measured along, or None to measure
+# them on the open grid
+_road_network = None
+
+
 class Location:
     """ An object representing an object's grid location.
     Location is defined as a row number and a column number.
+    Locations are never changed once created, so equal locations can be
+    shared (see intern_location).
     === Attributes ===
     @type location: tuple
         i.e. (row, column)
     """
+    __slots__ = ("location",)
+
     def __init__(self, row, column):
         """ Initialize a location.
         @type self: Location
@@ -41,6 +80,15 @@ class Location:
         return self.location[0] == other.location[0] and self.location[1] ==\
             other.location[1]
 
+    def __hash__(self):
+        """ Return a hash value, so that equal locations hash the same.
+        @type self: Location
+        @rtype: int
+        >>> hash(Location(2,2)) == hash(Location(2,2))
+        True
+        """
+        return hash(self.location)
+
 
 def manhattan_distance(origin, destination):
     """ Return the Manhattan distance between the origin and the destination.
@@ -55,6 +103,124 @@ def manhattan_distance(origin, destination):
         origin.location[1] - destination.location[1])
 
 
+def travel_distance(origin, destination):
+    """ Return the distance a driver travels from the origin to the
+    destination: along the roads of the road network, if one is set, and
+    otherwise the Manhattan distance.
+    @type origin: Location
+    @type destination: Location
+    @rtype: int
+    >>> travel_distance(Location(2,2), Location(5,6))
+    7
+    """
+    if _road_network is None:
+        return abs(origin.location[0] - destination.location[0]) + abs(
+            origin.location[1] - destination.location[1])
+    return _road_network.distance(origin, destination)
+
+
+def set_road_network(network):
+    """ Measure travel distances along the roads of <network> from now on,
+    or on the open grid if it is None. Return the road network set before.
+    @type network: RoadNetwork | None
+    @rtype: RoadNetwork | None
+    """
+    global _road_network
+    previous, _road_network = _road_network, network
+    return previous
+
+
+def road_network():
+    """ Return the road network travel distances are measured along, or
+    None if they are measured on the open grid.
+    @rtype: RoadNetwork | None
+    >>> print(road_network())
+    None
+    """
+    return _road_network
+
+
+def as_coordinates(locations):
+    """ Return the coordinates of <locations> as a contiguous N x 2 int32
+    array.
+    Precondition: NumPy is installed.
+    @type locations: list[Location] | numpy.ndarray
+    @rtype: numpy.ndarray
+    """
+    if isinstance(locations, np.ndarray):
+        return np.ascontiguousarray(locations, dtype=np.int32)
+    return np.array([location.location for location in locations],
+                    dtype=np.int32).reshape(-1, 2)
+
+
+def manhattan_distances(origin, destinations):
+    """ Return the Manhattan distances from <origin> to each destination.
+    @type origin: Location
+    @type destinations: list[Location]
+    @rtype: list[int] | numpy.ndarray
+    >>> manhattan_distances(Location(2,2), [Location(5,6), Location(2,1)])
+    [7, 1]
+    """
+    if np is None or len(destinations) < BATCH_THRESHOLD:
+        return [manhattan_distance(origin, destination)
+                for destination in destinations]
+    coordinates = as_coordinates(destinations)
+    return np.abs(coordinates - np.array(origin.location, dtype=np.int32)) \
+        .sum(axis=1)
+
+
+def pairwise_manhattan_distances(origins, destinations):
+    """ Return the matrix of Manhattan distances from every origin (rows) to
+    every destination (columns).
+    @type origins: list[Location]
+    @type destinations: list[Location]
+    @rtype: list[list[int]] | numpy.ndarray
+    >>> pairwise_manhattan_distances([Location(1,1), Location(3,3)],
+    ...                              [Location(1,2), Location(0,0)])
+    [[1, 2], [3, 6]]
+    """
+    if np is None or len(origins) * len(destinations) < BATCH_THRESHOLD:
+        return [[manhattan_distance(origin, destination)
+                 for destination in destinations] for origin in origins]
+    return np.abs(as_coordinates(origins)[:, None, :] -
+                  as_coordinates(destinations)[None, :, :]).sum(axis=2)
+
+
+def total_distance(origins, destinations):
+    """ Return the sum of the Manhattan distances from each origin to the
+    destination at the same position.
+    Precondition: len(origins) == len(destinations)
+    @type origins: list[Location]
+    @type destinations: list[Location]
+    @rtype: int
+    >>> total_distance([Location(1,1), Location(3,3)],
+    ...                [Location(1,2), Location(0,0)])
+    7
+    """
+    if np is None or len(origins) < BATCH_THRESHOLD:
+        return sum(manhattan_distance(origin, destination)
+                   for origin, destination in zip(origins, destinations))
+    return int(np.abs(as_coordinates(origins) - as_coordinates(destinations))
+               .sum(dtype=np.int64))
+
+
+def total_travel_distance(origins, destinations):
+    """ Return the sum of the travel distances from each origin to the
+    destination at the same position.
+    Precondition: len(origins) == len(destinations)
+    @type origins: list[Location]
+    @type destinations: list[Location]
+    @rtype: int
+    >>> total_travel_distance([Location(1,1), Location(3,3)],
+    ...                       [Location(1,2), Location(0,0)])
+    7
+    """
+    if _road_network is None:
+        return total_distance(origins, destinations)
+    return sum(_road_network.distance(origin, destination)
+               for origin, destination in zip(origins, destinations))
+
+
 def deserialize_location(location_str):
     """ Deserialize a location.
     @type location_str: str
@@ -65,4 +231,20 @@ def deserialize_location(location_str):
     (5,6)
     """
     location_list = location_str.split(',')
-    return Location(int(location_list[0]), int(location_list[1]))
+    return intern_location(int(location_list[0]), int(location_list[1]))
+
+
+def intern_location(row, column):
+    """ Return the shared Location for (row, column), creating it the first
+    time it is asked for.
+    @type row: int
+    @type column: int
+    @rtype: Location
+    >>> intern_location(5, 6) is intern_location(5, 6)
+    True
+    """
+    location = _interned.get((row, column))
+    if location is None:
+        location = Location(row, column)
+        _interned[(row, column)] = location
+    return location
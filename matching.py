@@ -0,0 +1,128 @@
+"""
+The matching module solves the assignment of waiting riders to idle
+drivers when the dispatcher matches them in batches.
+
+The cost of sending a driver to a rider is the driver's travel time to the
+rider. When NumPy is installed and the batch is large enough, the whole
+cost matrix is computed in one vectorised pass over the coordinates;
+otherwise, or when travel is measured along a road network, it is built
+with Driver.get_travel_time.
+"""
+
+from location import BATCH_THRESHOLD, pairwise_manhattan_distances, \
+    road_network
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def travel_times(riders, drivers):
+    """ Return the matrix of travel times from every driver to every rider.
+    Row i is riders[i] and column j is drivers[j].
+    @type riders: list[Rider]
+    @type drivers: list[Driver]
+    @rtype: list[list[int]]
+    >>> from driver import Driver
+    >>> from rider import Rider
+    >>> from location import Location
+    >>> riders = [Rider("Jorge", Location(1, 1), Location(2, 2), 5)]
+    >>> drivers = [Driver("Tom", Location(1, 4), 1),
+    ...            Driver("Carl", Location(5, 5), 2)]
+    >>> travel_times(riders, drivers)
+    [[3, 4]]
+    """
+    if np is None or len(riders) * len(drivers) < BATCH_THRESHOLD or \
+            road_network() is not None:
+        return [[driver.get_travel_time(rider.origin) for driver in drivers]
+                for rider in riders]
+    distances = pairwise_manhattan_distances(
+        [rider.origin for rider in riders],
+        [driver.location for driver in drivers])
+    speeds = np.array([driver.speed for driver in drivers],
+                      dtype=np.float64)
+    # np.rint rounds halves to even, like round() in get_travel_time
+    return np.rint(distances / speeds[None, :]).astype(np.int64).tolist()
+
+
+def hungarian(cost):
+    """ Return a minimum total cost assignment of rows to columns of <cost>
+    as a list of (row, column) pairs, sorted by row.
+    Every row is assigned if there are at least as many columns as rows,
+    and every column is assigned otherwise.
+    @type cost: list[list[int]]
+    @rtype: list[tuple[int, int]]
+    >>> hungarian([[4, 1, 3], [2, 0, 5], [3, 2, 2]])
+    [(0, 1), (1, 0), (2, 2)]
+    >>> hungarian([[1], [0]])
+    [(1, 0)]
+    >>> hungarian([])
+    []
+    """
+    if not cost or not cost[0]:
+        return []
+    if len(cost) > len(cost[0]):
+        transposed = [list(column) for column in zip(*cost)]
+        return sorted((row, column) for column, row in hungarian(transposed))
+    n, m = len(cost), len(cost[0])
+    inf = float("inf")
+    # Potentials and matching, 1-indexed, with column 0 as a sentinel.
+    # match[j] is the row assigned to column j, or 0.
+    u = [0] * (n + 1)
+    v = [0] * (m + 1)
+    match = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        min_slack = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            row = cost[i0 - 1]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    slack = row[j - 1] - u[i0] - v[j]
+                    if slack < min_slack[j]:
+                        min_slack[j] = slack
+                        way[j] = j0
+                    if min_slack[j] < delta:
+                        delta = min_slack[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_slack[j] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        # Flip the augmenting path
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    return sorted((match[j] - 1, j - 1) for j in range(1, m + 1) if match[j])
+
+
+def greedy(riders, grid):
+    """ Match riders, in order, to the closest driver in <grid> that has not
+    been matched yet, and return the (rider, driver) pairs.
+    Matched drivers are removed from <grid>.
+    @type riders: list[Rider]
+    @type grid: DriverGrid
+    @rtype: list[tuple[Rider, Driver]]
+    """
+    pairs = []
+    for rider in riders:
+        driver = grid.nearest(rider.origin)
+        if driver is None:
+            break
+        grid.remove(driver)
+        pairs.append((rider, driver))
+    return pairs
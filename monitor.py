@@ -1,5 +1,14 @@
+import csv
+from array import array
+
 from location import Location
-from location import manhattan_distance
+from location import travel_distance, total_travel_distance
+from sketch import LogHistogram
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 """
 The Monitor module contains the Monitor class, the Activity class,
@@ -7,7 +16,9 @@ and a collection of constants. Together the elements of the module
 help keep a record of activities that have occurred.
 Activities fall into two categories: Rider activities and Driver
 activities. Each activity also has a description, which is one of
-request, cancel, pickup, or dropoff.
+request, cancel, pickup, or dropoff, or match, for a driver sent to a
+rider. A driver is matched where it already is, so a match does not add
+to the distance driven.
 === Constants ===
 @type RIDER: str
     A constant used for the Rider activity category.
@@ -21,6 +32,20 @@ request, cancel, pickup, or dropoff.
     A constant used for the pickup activity description.
 @type DROPOFF: str
     A constant used for the dropoff activity description.
+@type MATCH: str
+    A constant used for the match activity description.
+@type PERCENTILES: tuple[int]
+    The percentiles a RunningMonitor reports.
+@type WINDOW_COLUMNS: tuple[str]
+    The columns of the time series a WindowedMonitor writes.
+
+A Monitor keeps every activity, and works its statistics out from them
+when asked for a report. A RunningMonitor gives the same report, but
+updates its statistics as it is notified and forgets activities once they
+no longer matter, so it suits long simulations. It can also report
+percentiles of wait times, driver idle times and trip distances. A
+WindowedMonitor also writes its statistics for each window of simulated
+time to a file.
 """
 
 RIDER = "rider"
@@ -30,6 +55,19 @@ REQUEST = "request"
 CANCEL = "cancel"
 PICKUP = "pickup"
 DROPOFF = "dropoff"
+MATCH = "match"
+
+PERCENTILES = (50, 95, 99)
+
+WINDOW_COLUMNS = ("window_start", "rider_requests", "driver_requests",
+                  "cancellations", "pickups", "dropoffs", "riders_waited",
+                  "rider_wait_time", "driver_total_distance",
+                  "driver_ride_distance", "driver_utilisation")
+
+# The column of WINDOW_COLUMNS counting each kind of activity
+_COUNTED_COLUMNS = {(RIDER, REQUEST): 1, (DRIVER, REQUEST): 2,
+                    (RIDER, CANCEL): 3, (DRIVER, PICKUP): 4,
+                    (DRIVER, DROPOFF): 5}
 
 
 class Activity:
@@ -99,7 +137,7 @@ class Monitor:
             The time of the activity.
         @type category: DRIVER | RIDER
             The category for the activity.
-        @type description: REQUEST | CANCEL | PICKUP | DROP_OFF
+        @type description: REQUEST | CANCEL | PICKUP | DROP_OFF | MATCH
             A description of the activity.
         @type identifier: str
             The identifier for the actor.
@@ -167,15 +205,14 @@ class Monitor:
         >>> a._average_ride_distance()
         4.0
         """
-        total_distance = 0.0
+        distance = 0.0
         for activities in self._activities[DRIVER].values():
-            initial = activities[0].location
-            # Add up all the distances traveled by drivers
-            for z in activities:
-                total_distance += manhattan_distance(initial, z.location)
-                initial = z.location
+            locations = [z.location for z in activities]
+            # Add up all the distances traveled by drivers, leg by leg
+            distance += total_travel_distance(locations[:-1],
+                                              locations[1:])
         # Divide the total distance by the number of drivers
-        return total_distance / len(self._activities[DRIVER])
+        return distance / len(self._activities[DRIVER])
 
     def _average_ride_distance(self):
         """ Return the average distance drivers have driven on rides.
@@ -187,14 +224,479 @@ class Monitor:
         >>> a._average_ride_distance()
         4.0
         """
-        total_distance = 0
+        pickups, dropoffs = [], []
         for activities in self._activities[DRIVER].values():
-            # Add up all the distances from Pickups to Dropoffs
+            # Collect every ride, from Pickup to Dropoff
             for z in activities:
                 # if z.description == DROPOFF -> holder.description == PICKUP
                 if z.description == DROPOFF:
-                    total_distance += manhattan_distance(holder.location,
-                                                         z.location)
+                    pickups.append(holder.location)
+                    dropoffs.append(z.location)
                 holder = z
         # Divide the total distance by the number of drivers
-        return total_distance / len(self._activities[DRIVER])
+        return total_travel_distance(pickups, dropoffs) / \
+            len(self._activities[DRIVER])
+
+
+class RunningMonitor(Monitor):
+    """ A monitor that keeps running totals instead of a record of every
+    activity, so it only remembers riders that are still waiting and the
+    last location of each driver, and reports in constant time.
+    Its report is the same as that of a Monitor notified of the same
+    activities. If asked to, it also reports percentiles of:
+    - rider wait times, under rider_wait_time_p50 and so on,
+    - driver idle times, from a driver's request until it is matched to a
+      rider, under driver_idle_time_p50 and so on,
+    - trip distances, from pickup to dropoff, under trip_distance_p50 and
+      so on.
+    These are kept in LogHistograms, so they are within 1 / SUB_BUCKETS of
+    the exact percentiles.
+    === Private Attributes ===
+    @type _requested: dict[str, int]
+        The request time of each rider that has not yet been picked up or
+        cancelled, by identifier.
+    @type _last_locations: dict[str, Location]
+        The location of each driver's latest activity, by identifier.
+    @type _idle_since: dict[str, int]
+        The request time of each driver that has not yet picked up a rider
+        since its latest request, by identifier.
+    @type _riders: int
+        The number of riders that have requested a driver.
+    @type _wait_time: int
+        The total wait time of riders that have been picked up or have
+        cancelled.
+    @type _waited: int
+        The number of riders that have been picked up or have cancelled.
+    @type _total_distance: int
+        The total distance driven by drivers.
+    @type _ride_distance: int
+        The total distance driven by drivers on rides.
+    @type _histograms: dict[str, LogHistogram] | None
+        The histogram of each statistic whose percentiles are reported, or
+        None if percentiles are not reported.
+    """
+
+    def __init__(self, percentiles=False):
+        """ Initialize a RunningMonitor.
+        @type self: RunningMonitor
+        @type percentiles: bool
+            Whether to report percentiles as well as averages.
+        @rtype: None
+        """
+        self._requested = {}
+        self._last_locations = {}
+        self._idle_since = {}
+        self._riders = 0
+        self._wait_time = 0
+        self._waited = 0
+        self._total_distance = 0
+        self._ride_distance = 0
+        self._histograms = None
+        if percentiles:
+            self._histograms = {"rider_wait_time": LogHistogram(),
+                                "driver_idle_time": LogHistogram(),
+                                "trip_distance": LogHistogram()}
+
+    def __str__(self):
+        """ Return a string representation.
+        @type self: RunningMonitor
+        @rtype: str
+        >>> print(RunningMonitor())
+        Monitor (0 drivers, 0 riders)
+        """
+        return "Monitor ({} drivers, {} riders)".format(
+            len(self._last_locations), self._riders)
+
+    def notify(self, timestamp, category, description, identifier, location):
+        """ Notify the monitor of the activity.
+        @type self: RunningMonitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROP_OFF | MATCH
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+        """
+        histograms = self._histograms
+        if category == RIDER:
+            if description == REQUEST:
+                self._requested[identifier] = timestamp
+                self._riders += 1
+            elif identifier in self._requested:
+                # Only the first activity after the request ends the wait
+                wait_time = timestamp - self._requested.pop(identifier)
+                self._wait_time += wait_time
+                self._waited += 1
+                if histograms is not None:
+                    histograms["rider_wait_time"].add(wait_time)
+        elif description == MATCH:
+            # The driver has not moved, so only its idle time ends
+            if histograms is not None and identifier in self._idle_since:
+                histograms["driver_idle_time"].add(
+                    timestamp - self._idle_since.pop(identifier))
+        else:
+            last = self._last_locations.get(identifier)
+            if last is not None:
+                distance = travel_distance(last, location)
+                self._total_distance += distance
+                # A driver's activity before a dropoff is always the pickup
+                if description == DROPOFF:
+                    self._ride_distance += distance
+                    if histograms is not None:
+                        histograms["trip_distance"].add(distance)
+            self._last_locations[identifier] = location
+            if histograms is not None and description == REQUEST:
+                self._idle_since[identifier] = timestamp
+
+    def report(self):
+        """ Return a report of the activities that have occurred.
+        @type self: RunningMonitor
+        @rtype: dict[str, object]
+        >>> a = RunningMonitor()
+        >>> a.notify(0, RIDER, REQUEST, "Jorge", Location(2,2))
+        >>> a.notify(5, RIDER, CANCEL, "Jorge", Location(2,2))
+        >>> a.notify(0, DRIVER, PICKUP, "Tom", Location(2,2))
+        >>> a.notify(2, DRIVER, DROPOFF, "Tom", Location(4,4))
+        >>> a.notify(3, DRIVER, PICKUP, "Tom", Location(4,5))
+        >>> a.notify(6, DRIVER, DROPOFF, "Tom", Location(8,7))
+        >>> a.report() == {'rider_wait_time': 5.0,
+        ...                'driver_total_distance': 11.0,
+        ...                'driver_ride_distance': 10.0}
+        True
+        >>> a = RunningMonitor(percentiles=True)
+        >>> a.notify(0, DRIVER, REQUEST, "Tom", Location(2,2))
+        >>> a.notify(0, RIDER, REQUEST, "Jorge", Location(2,5))
+        >>> a.notify(1, DRIVER, MATCH, "Tom", Location(2,2))
+        >>> a.notify(4, DRIVER, PICKUP, "Tom", Location(2,5))
+        >>> a.notify(4, RIDER, PICKUP, "Jorge", Location(2,5))
+        >>> a.notify(9, DRIVER, DROPOFF, "Tom", Location(6,6))
+        >>> report = a.report()
+        >>> report["driver_idle_time_p50"], report["trip_distance_p99"]
+        (1, 5)
+        """
+        drivers = len(self._last_locations)
+        report = {"rider_wait_time": self._wait_time / self._waited,
+                  "driver_total_distance": self._total_distance / drivers,
+                  "driver_ride_distance": self._ride_distance / drivers}
+        if self._histograms is not None:
+            for name, histogram in self._histograms.items():
+                for percentile in PERCENTILES:
+                    report["{}_p{}".format(name, percentile)] = \
+                        histogram.quantile(percentile / 100)
+        return report
+
+    def driver_state(self, identifier):
+        """ Return what <self> remembers about the driver <identifier>, so
+        that another RunningMonitor can carry on following the driver.
+        @type self: RunningMonitor
+        @type identifier: str
+        @rtype: tuple[Location | None, int | None]
+        """
+        return (self._last_locations.get(identifier),
+                self._idle_since.get(identifier))
+
+    def restore_driver(self, identifier, state):
+        """ Carry on following the driver <identifier> from <state>, which
+        was returned by driver_state.
+        @type self: RunningMonitor
+        @type identifier: str
+        @type state: tuple[Location | None, int | None]
+        @rtype: None
+        >>> a, b = RunningMonitor(), RunningMonitor()
+        >>> a.notify(0, DRIVER, REQUEST, "Tom", Location(2,2))
+        >>> b.restore_driver("Tom", a.driver_state("Tom"))
+        >>> a.forget_driver("Tom")
+        >>> b.notify(3, DRIVER, PICKUP, "Tom", Location(2,5))
+        >>> print(a, b, sep=", ")
+        Monitor (0 drivers, 0 riders), Monitor (1 drivers, 0 riders)
+        >>> b._total_distance
+        3
+        """
+        location, idle_since = state
+        if location is not None:
+            self._last_locations[identifier] = location
+        if idle_since is not None:
+            self._idle_since[identifier] = idle_since
+
+    def forget_driver(self, identifier):
+        """ Stop following the driver <identifier>, which another
+        RunningMonitor is following from now on.
+        @type self: RunningMonitor
+        @type identifier: str
+        @rtype: None
+        """
+        self._last_locations.pop(identifier, None)
+        self._idle_since.pop(identifier, None)
+
+    def merge(self, other):
+        """ Add the activities <other> was notified of to <self>, as if
+        <self> had been notified of them too. Both monitors must report
+        percentiles, or neither.
+        This is how the statistics of separate simulations are combined.
+        @type self: RunningMonitor
+        @type other: RunningMonitor
+        @rtype: None
+        >>> a, b = RunningMonitor(), RunningMonitor()
+        >>> a.notify(0, RIDER, REQUEST, "Jorge", Location(2,2))
+        >>> a.notify(5, RIDER, CANCEL, "Jorge", Location(2,2))
+        >>> b.notify(0, RIDER, REQUEST, "James", Location(2,2))
+        >>> b.notify(2, RIDER, PICKUP, "James", Location(2,2))
+        >>> b.notify(2, DRIVER, PICKUP, "Tom", Location(2,2))
+        >>> a.merge(b)
+        >>> print(a)
+        Monitor (1 drivers, 2 riders)
+        >>> a.report()["rider_wait_time"]
+        3.5
+        """
+        if (self._histograms is None) != (other._histograms is None):
+            raise ValueError("Cannot merge monitors that report different "
+                             "statistics")
+        self._requested.update(other._requested)
+        self._last_locations.update(other._last_locations)
+        self._idle_since.update(other._idle_since)
+        self._riders += other._riders
+        self._wait_time += other._wait_time
+        self._waited += other._waited
+        self._total_distance += other._total_distance
+        self._ride_distance += other._ride_distance
+        if self._histograms is not None:
+            for name, histogram in self._histograms.items():
+                histogram.merge(other._histograms[name])
+
+
+class WindowedMonitor(RunningMonitor):
+    """ A RunningMonitor that also keeps its statistics separately for each
+    window of simulated time, and writes them to a file as a time series.
+    Each window is a row with the columns in WINDOW_COLUMNS:
+    - window_start: the time the window starts at,
+    - rider_requests, driver_requests, cancellations, pickups, dropoffs:
+      the number of activities of each kind in the window,
+    - riders_waited: the number of riders whose wait ended in the window,
+    - rider_wait_time: their average wait time, or empty (NaN in an NPZ
+      file) if there were none,
+    - driver_total_distance, driver_ride_distance: the distance all drivers
+      drove, and drove on rides, up to activities in the window,
+    - driver_utilisation: the fraction of the window drivers were busy,
+      from being matched to a rider until their next request, weighted by
+      time and counting each driver from its first request, or empty (NaN
+      in an NPZ file) if no driver had requested yet. The last window only
+      counts up to the last activity.
+    A CSV file is written every few windows as the simulation passes them.
+    An NPZ file, which needs NumPy, is only written when the monitor is
+    closed, so every window is kept in memory until then.
+    Either way, close must be called once the simulation has finished, or
+    the monitor used in a with statement. Closing it again does nothing.
+    Activities must be notified in time order, as a simulation does.
+    === Private Attributes ===
+    @type _window: int
+        The length of a window.
+    @type _window_end: int
+        The time the current window ends at.
+    @type _filename: str
+        The file the time series is written to.
+    @type _csv: bool
+        True if the file is a CSV file, and False if it is an NPZ file.
+    @type _rows: list[array]
+        The rows of the windows not yet written, one array per column, and
+        a last array of the time drivers had requested in each window.
+        driver_utilisation holds the time drivers were busy until the rows
+        are written. The arrays are allocated once and reused.
+    @type _row: int
+        The row of the current window in _rows.
+    @type _blocks: list[list[array]]
+        For an NPZ file, copies of _rows each time it filled up.
+    @type _busy: dict[str, bool]
+        Whether each driver that has requested is busy.
+    @type _busy_count: int
+        The number of busy drivers.
+    @type _since: int
+        The time the busy time of drivers has been counted up to.
+    @type _file: file | None
+        For a CSV file, the open file.
+    @type _closed: bool
+        True once the monitor has been closed.
+    """
+
+    def __init__(self, window, filename, percentiles=False, block=256):
+        """ Initialize a WindowedMonitor that writes a time series with
+        windows of length <window> to <filename>, an NPZ file if its name
+        ends in .npz and a CSV file otherwise.
+        @type self: WindowedMonitor
+        @type window: int
+        @type filename: str
+        @type percentiles: bool
+            Whether to report percentiles as well as averages.
+        @type block: int
+            The number of windows kept in memory before they are written
+            out to a CSV file. An NPZ file copies them aside instead, until
+            it is written when the monitor is closed.
+        @rtype: None
+        """
+        super().__init__(percentiles)
+        self._window = window
+        self._window_end = window
+        self._filename = filename
+        self._csv = not filename.endswith(".npz")
+        if not self._csv and np is None:
+            raise ImportError("Writing an NPZ file needs NumPy")
+        self._rows = [array("q", bytes(8 * block))
+                      for _ in range(len(WINDOW_COLUMNS) + 1)]
+        self._row = 0
+        self._blocks = []
+        self._busy = {}
+        self._busy_count = 0
+        self._since = 0
+        self._file = None
+        self._closed = False
+        if self._csv:
+            self._file = open(filename, "w", newline="")
+            csv.writer(self._file).writerow(WINDOW_COLUMNS)
+
+    def __enter__(self):
+        """ Return <self>, to be closed at the end of a with statement.
+        @type self: WindowedMonitor
+        @rtype: WindowedMonitor
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """ Close <self> at the end of a with statement.
+        @type self: WindowedMonitor
+        @rtype: None
+        """
+        self.close()
+
+    def notify(self, timestamp, category, description, identifier, location):
+        """ Notify the monitor of the activity.
+        @type self: WindowedMonitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROP_OFF | MATCH
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+        """
+        if timestamp >= self._window_end:
+            self._advance(timestamp)
+        elif timestamp < self._window_end - self._window:
+            raise ValueError("Activities must be notified in time order")
+        self._count_busy(timestamp)
+        if category == DRIVER:
+            busy = self._busy.get(identifier)
+            if description == MATCH and not busy:
+                self._busy[identifier] = True
+                self._busy_count += 1
+            elif description == REQUEST:
+                if busy:
+                    self._busy_count -= 1
+                self._busy[identifier] = False
+        waited, wait_time = self._waited, self._wait_time
+        total, ride = self._total_distance, self._ride_distance
+        super().notify(timestamp, category, description, identifier,
+                       location)
+        rows, row = self._rows, self._row
+        column = _COUNTED_COLUMNS.get((category, description))
+        if column is not None:
+            rows[column][row] += 1
+        rows[6][row] += self._waited - waited
+        rows[7][row] += self._wait_time - wait_time
+        rows[8][row] += self._total_distance - total
+        rows[9][row] += self._ride_distance - ride
+
+    def close(self):
+        """ Write the windows not yet written, up to the window of the last
+        activity, and close the file, unless <self> is already closed.
+        @type self: WindowedMonitor
+        @rtype: None
+        >>> import os, tempfile
+        >>> filename = os.path.join(tempfile.mkdtemp(), "windows.csv")
+        >>> a = WindowedMonitor(10, filename)
+        >>> a.notify(0, RIDER, REQUEST, "Jorge", Location(2,2))
+        >>> a.notify(0, DRIVER, REQUEST, "Tom", Location(2,2))
+        >>> a.notify(2, DRIVER, MATCH, "Tom", Location(2,2))
+        >>> a.notify(3, DRIVER, PICKUP, "Tom", Location(2,2))
+        >>> a.notify(3, RIDER, PICKUP, "Jorge", Location(2,2))
+        >>> a.notify(25, DRIVER, DROPOFF, "Tom", Location(4,4))
+        >>> a.close()
+        >>> a.close()
+        >>> print(open(filename).read().replace(",", " "))
+        window_start rider_requests driver_requests cancellations pickups \
+dropoffs riders_waited rider_wait_time driver_total_distance \
+driver_ride_distance driver_utilisation
+        0 1 1 0 1 0 1 3.0 0 0 0.8
+        10 0 0 0 0 0 0  0 0 1.0
+        20 0 0 0 0 1 0  4 4 1.0
+        <BLANKLINE>
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._write_rows(self._row + 1)
+        if self._csv:
+            self._file.close()
+            return
+        columns = {}
+        for i, name in enumerate(WINDOW_COLUMNS):
+            columns[name] = np.concatenate(
+                [np.frombuffer(block[i], dtype=np.int64)
+                 for block in self._blocks])
+        driver_time = np.concatenate(
+            [np.frombuffer(block[-1], dtype=np.int64)
+             for block in self._blocks])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            columns["rider_wait_time"] = \
+                columns["rider_wait_time"] / columns["riders_waited"]
+            columns["driver_utilisation"] = \
+                columns["driver_utilisation"] / driver_time
+        np.savez(self._filename, **columns)
+
+    def _advance(self, timestamp):
+        """ Move on to the window <timestamp> is in, with a row for every
+        window passed on the way.
+        @type self: WindowedMonitor
+        @type timestamp: int
+        @rtype: None
+        """
+        while timestamp >= self._window_end:
+            self._count_busy(self._window_end)
+            self._row += 1
+            if self._row == len(self._rows[0]):
+                self._write_rows(self._row)
+                self._row = 0
+            self._rows[0][self._row] = self._window_end
+            self._window_end += self._window
+
+    def _count_busy(self, timestamp):
+        """ Add the time drivers were busy, and had requested, since the
+        time counted up to, to the current window, and count up to
+        <timestamp>, which is in that window or at its end.
+        @type self: WindowedMonitor
+        @type timestamp: int
+        @rtype: None
+        """
+        elapsed = timestamp - self._since
+        if elapsed:
+            self._rows[10][self._row] += elapsed * self._busy_count
+            self._rows[11][self._row] += elapsed * len(self._busy)
+            self._since = timestamp
+
+    def _write_rows(self, count):
+        """ Write out the first <count> rows of _rows, for a CSV file, or
+        copy them aside, for an NPZ file, and clear them.
+        @type self: WindowedMonitor
+        @type count: int
+        @rtype: None
+        """
+        if self._csv:
+            writer = csv.writer(self._file)
+            for row in zip(*(column[:count] for column in self._rows)):
+                # The wait time and utilisation are written as averages
+                row = list(row)
+                row[7] = row[7] / row[6] if row[6] else ""
+                row[10] = row[10] / row[11] if row[11] else ""
+                writer.writerow(row[:-1])
+            self._file.flush()
+        else:
+            self._blocks.append([column[:count] for column in self._rows])
+        for column in self._rows:
+            column[:count] = array("q", bytes(8 * count))
@@ -0,0 +1,184 @@
+"""
+The profiler module records where the time of a simulation goes.
+
+A Simulation given a Profiler does every event through it. The profiler
+counts the events of each type and times their do() calls, samples the
+length of the event queue, and times every call the events make to the
+dispatcher's and the monitor's methods, which it hands to them wrapped in
+timing proxies. Calls that drivers make to their dispatcher, and calls to
+objects the dispatcher holds, such as its rider_list, do not go through
+the proxy, and are only counted in the time of the event that made them.
+
+Times are wall-clock seconds. The time of a dispatcher or monitor call is
+also part of the time of the event that made it, as is the time taken to
+add the events it spawns to the queue.
+
+Without a profiler, a simulation does each event directly, after a single
+check.
+"""
+import time
+from array import array
+
+
+class Profiler:
+    """ A record of the time spent doing the events of a simulation.
+    === Attributes ===
+    @type sample_every: int
+        The queue length is sampled once every <sample_every> events.
+    === Private Attributes ===
+    @type _events: dict[str, list]
+        The number of events, their total time and their longest time,
+        keyed by the name of the event type.
+    @type _calls: dict[str, dict[str, list]]
+        The number of calls and their total time, keyed by "dispatcher" or
+        "monitor" and then by the name of the method called.
+    @type _done: int
+        The number of events done.
+    @type _sample_times: array
+        The timestamp of each sample of the queue length.
+    @type _sample_lengths: array
+        The queue length of each sample.
+    """
+
+    def __init__(self, sample_every=1024):
+        """ Initialize an empty Profiler.
+        @type self: Profiler
+        @type sample_every: int
+        @rtype: None
+        """
+        self.sample_every = sample_every
+        self._events = {}
+        self._calls = {"dispatcher": {}, "monitor": {}}
+        self._done = 0
+        self._sample_times = array("q")
+        self._sample_lengths = array("q")
+
+    def wrap(self, dispatcher, monitor):
+        """ Return <dispatcher> and <monitor> wrapped so that their calls
+        are timed.
+        @type self: Profiler
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @rtype: (_TimedProxy, _TimedProxy)
+        """
+        return (_TimedProxy(dispatcher, self._calls["dispatcher"]),
+                _TimedProxy(monitor, self._calls["monitor"]))
+
+    def do(self, event, dispatcher, monitor, queued):
+        """ Do <event>, scheduling the events it spawns into <queued>, and
+        record how long it took.
+        @type self: Profiler
+        @type event: Event
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @type queued: PriorityQueue
+            The event queue of the simulation.
+        @rtype: None
+        """
+        if self._done % self.sample_every == 0:
+            self._sample_times.append(event.timestamp)
+            self._sample_lengths.append(len(queued))
+        self._done += 1
+        start = time.perf_counter()
+        event.do(dispatcher, monitor, queued.add)
+        elapsed = time.perf_counter() - start
+        name = type(event).__name__
+        record = self._events.get(name)
+        if record is None:
+            self._events[name] = [1, elapsed, elapsed]
+        else:
+            record[0] += 1
+            record[1] += elapsed
+            if elapsed > record[2]:
+                record[2] = elapsed
+
+    def report(self):
+        """ Return a report of the time spent so far.
+        @type self: Profiler
+        @rtype: dict[str, object]
+            "events": for each event type, its "count", "total_seconds"
+                and "max_seconds",
+            "dispatcher" and "monitor": for each method called, its "count"
+                and "total_seconds",
+            "queue_length": (timestamp, queue length) samples, in order.
+        >>> from dispatcher import Dispatcher
+        >>> from event import create_event_list
+        >>> from eventlog import NullLog
+        >>> from simulation import Simulation
+        >>> profiler = Profiler(sample_every=4)
+        >>> simulation = Simulation(event_log=NullLog(), profiler=profiler)
+        >>> report = simulation.run(create_event_list("events_small.txt"))
+        >>> profile = profiler.report()
+        >>> sorted((name, record["count"])
+        ...        for name, record in profile["events"].items())
+        [('Cancellation', 1), ('DriverRequest', 2), ('Dropoff', 1), \
+('Pickup', 1), ('RiderRequest', 1)]
+        >>> profile["dispatcher"]["request_driver"]["count"]
+        1
+        >>> profile["monitor"]["notify"]["count"]
+        8
+        >>> profile["queue_length"]
+        [(1, 1), (17, 0)]
+        """
+        return {
+            "events": {name: {"count": count, "total_seconds": total,
+                              "max_seconds": longest}
+                       for name, (count, total, longest)
+                       in self._events.items()},
+            "dispatcher": _call_report(self._calls["dispatcher"]),
+            "monitor": _call_report(self._calls["monitor"]),
+            "queue_length": list(zip(self._sample_times,
+                                     self._sample_lengths))}
+
+
+class _TimedProxy:
+    """ Stands in for an object, timing the calls made to its methods.
+    Other attributes are read from the object itself.
+    === Private Attributes ===
+    @type _target: object
+        The object stood in for.
+    @type _calls: dict[str, list]
+        The number of calls and their total time, keyed by method name.
+    """
+
+    def __init__(self, target, calls):
+        """ Initialize a _TimedProxy for <target>, recording into <calls>.
+        @type self: _TimedProxy
+        @type target: object
+        @type calls: dict[str, list]
+        @rtype: None
+        """
+        self._target = target
+        self._calls = calls
+
+    def __getattr__(self, name):
+        """ Return the attribute <name> of the target, timing its calls if
+        it is a method.
+        @type self: _TimedProxy
+        @type name: str
+        @rtype: object
+        """
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+        record = self._calls.setdefault(name, [0, 0.0])
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                record[0] += 1
+                record[1] += time.perf_counter() - start
+        # Keep the timed method, so the next call finds it directly
+        self.__dict__[name] = timed
+        return timed
+
+
+def _call_report(calls):
+    """ Return the report of the calls in <calls>.
+    @type calls: dict[str, list]
+    @rtype: dict[str, dict[str, object]]
+    """
+    return {name: {"count": count, "total_seconds": total}
+            for name, (count, total) in calls.items()}
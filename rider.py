@@ -1,6 +1,7 @@
 """
-The rider module contains the Rider class. It also contains
-constants that represent the status of the rider.
+The rider module contains the Rider class, and BaseRider, the behaviour
+it shares with riders kept elsewhere, such as StoredRider. It also
+contains constants that represent the status of the rider.
 === Constants ===
 @type WAITING: str
     A constant used for the waiting rider status.
@@ -14,34 +15,28 @@ WAITING = "waiting"
 CANCELLED = "cancelled"
 SATISFIED = "satisfied"
 
+# Each status, keyed by an equal string
+_STATUSES = {WAITING: WAITING, CANCELLED: CANCELLED, SATISFIED: SATISFIED}
 
-class Rider:
-    """ A rider with these attributes:
+
+class BaseRider:
+    """ A rider. This class has no slots, so that a subclass decides how
+    the attributes are kept: Rider keeps them on the object.
+    A rider has these attributes:
     @type id: str -- unique identifier for the rider.
     @type origin: Location -- the origin of the rider.
     @type destination: Location -- the Rider's desired destination.
     @type status: str -- the rider's current status.
     @type patience: int -- the number of minutes the driver is willing to wait
                            to be picked up before they cancel their ride.
+    @type initial: int | None -- the time of the rider's request.
     """
-    def __init__(self, unique_id, _origin, _destination, patience):
-        """ Initialize new rider with a unique identifier,
-        origin, destination, and status.
-        @type self: Rider
-        @type unique_id: str
-        @type _origin: Location
-        @type _destination: Location
-        @type patience: int
-        @rtype: None
-        """
-        self.id, self.origin, self.destination, self.status, self.patience = \
-            unique_id, _origin, _destination, WAITING, patience
-        self.initial = None
+    __slots__ = ()
 
     def __lt__(self, other):
         """ Return True iff this Rider is less than <other>.
-        @type self: Rider
-        @type other: Rider
+        @type self: BaseRider
+        @type other: BaseRider
         @rtype: bool
         >>> first = Rider("Jorge", (1,1), (1,2), 14)
         >>> second = Rider("James", (2,3), (4,4), 5)
@@ -54,10 +49,48 @@ class Rider:
 
     def __str__(self):
         """ Return a string representation.
-        @type self: Rider
+        @type self: BaseRider
         @rtype: str
         >>> a = Rider("Jorge", (1,1), (1,2), 14)
         >>> print(a)
         Jorge
         """
         return self.id
+
+
+class Rider(BaseRider):
+    """ A rider whose attributes are kept on the object.
+    """
+    __slots__ = ("id", "origin", "destination", "status", "patience",
+                 "initial")
+
+    def __init__(self, unique_id, _origin, _destination, patience):
+        """ Initialize new rider with a unique identifier,
+        origin, destination, and status.
+        @type self: Rider
+        @type unique_id: str
+        @type _origin: Location
+        @type _destination: Location
+        @type patience: int
+        @rtype: None
+        """
+        self.id, self.origin, self.destination, self.status, self.patience = \
+            unique_id, _origin, _destination, WAITING, patience
+        self.initial = None
+
+    def __setstate__(self, state):
+        """ Restore <self> from the pickled <state>.
+        Statuses are compared by identity, so the status is set back to the
+        matching constant rather than the unpickled copy of the string.
+        @type self: Rider
+        @type state: (None, dict[str, object])
+        @rtype: None
+        >>> import pickle
+        >>> rider = Rider("Jorge", (1,1), (1,2), 14)
+        >>> pickle.loads(pickle.dumps(rider)).status is WAITING
+        True
+        """
+        for name, value in state[1].items():
+            setattr(self, name, value)
+        if "status" in state[1]:
+            self.status = _STATUSES[state[1]["status"]]
@@ -0,0 +1,616 @@
+"""
+The roads module measures travel along a road network instead of the open
+grid, for cities with one-way streets and closed roads.
+
+A road network is read from an edge list: a text file with one road per
+line, "row,col row,col [length]", from the first intersection to the
+second. Roads are one-way, so a two-way street is listed in both
+directions. A road's length can be left out when it is the Manhattan
+distance between its ends, as it is for a road of one block. No road is
+shorter than that distance, so the Manhattan distance stays a lower bound
+on travel, which the dispatcher's spatial index relies on. Blank lines and
+lines starting with "#" are skipped.
+
+Shortest routes are found with A* search guided by landmarks (ALT). A few
+intersections, spread far apart, are chosen as landmarks, and the route
+lengths to and from each of them are computed once, ahead of time. By the
+triangle inequality, they bound from below how far any intersection is
+from any other. That bound steers the search, so it only explores the
+intersections near the shortest route. The Manhattan distance is used as
+a bound as well. Distances found are cached.
+
+The dispatcher asks for the distances from many drivers to the same
+rider, nearest first. When a destination is asked for twice in a row, the
+network grows a Dijkstra search backwards from it instead, one
+intersection at a time, until it reaches each origin asked for. That one
+search answers every later question about the same destination.
+
+The precomputation is the slow part for a big city, so a RoadNetwork can
+be saved with save_roads and read back with load_roads. The file is
+little-endian on every machine (see columns): a header of the magic bytes
+b"RSROADS1" and the number of intersections, roads and landmarks as
+8-byte integers, followed by:
+    intersection rows and columns (int32),
+    road offsets (int64, one more than the number of intersections), road
+    heads (int32) and road lengths (int64), where the roads from
+    intersection v are those from offset v up to offset v + 1,
+    the same three columns for the roads reversed,
+    landmark intersections (int32),
+    route lengths from each landmark to every intersection, then from
+    every intersection to each landmark (float64, inf where there is no
+    route).
+Every column is padded to a multiple of 8 bytes.
+
+A simulation measures travel along a road network when it is given one
+(see Simulation), or after set_road_network in the location module.
+"""
+import random
+import struct
+import sys
+from array import array
+from heapq import heappop, heappush
+
+from columns import column_bytes, read_column
+from location import Location
+
+_MAGIC = b"RSROADS1"
+_HEADER = struct.Struct("<8sqqq")
+_INFINITY = float("inf")
+
+
+class RoadNetwork:
+    """ The roads of a city, with the landmark route lengths that speed up
+    finding shortest routes.
+    === Attributes ===
+    @type active: int
+        The number of landmarks that guide each search: the ones that
+        bound its distance the most at its start.
+    @type cache_size: int
+        The number of distances cached before the cache is cleared.
+    === Private Attributes ===
+    @type _rows: array
+        The row of each intersection, by intersection number.
+    @type _cols: array
+        The column of each intersection.
+    @type _offsets: array
+        The roads from intersection v are numbered _offsets[v] up to
+        _offsets[v + 1].
+    @type _heads: array
+        The intersection each road leads to.
+    @type _lengths: array
+        The length of each road.
+    @type _reverse_offsets: array
+        As _offsets, for the roads reversed.
+    @type _tails: array
+        The intersection each road comes from, for the roads reversed.
+    @type _reverse_lengths: array
+        The length of each road, for the roads reversed.
+    @type _landmarks: array
+        The landmark intersections.
+    @type _from_landmarks: list[array]
+        The route lengths from each landmark to every intersection.
+    @type _to_landmarks: list[array]
+        The route lengths from every intersection to each landmark.
+    @type _ids: dict[tuple[int, int], int]
+        Maps the (row, column) of each intersection to its number.
+    @type _cache: dict[int, int]
+        Distances found so far, keyed by origin * len(self) + destination.
+    @type _last: int | None
+        The destination of the last distance asked for.
+    @type _tree: list | None
+        The search growing backwards from a destination asked for twice in
+        a row: [destination, the route lengths from the intersections it
+        has reached, the route lengths found so far to the intersections
+        it has seen, its heap of (route length, intersection)].
+    """
+
+    def __init__(self, roads, landmarks=8, active=4, cache_size=1 << 16):
+        """ Initialize a RoadNetwork of <roads>, and choose its landmarks.
+        @type self: RoadNetwork
+        @type roads: iterable
+            (origin, destination, length) for each road, where origin and
+            destination are (row, column) pairs, and length is an int, or
+            None for the Manhattan distance between them.
+        @type landmarks: int
+        @type active: int
+        @type cache_size: int
+        @rtype: None
+        >>> network = RoadNetwork([((0, 0), (0, 1), None),
+        ...                        ((0, 1), (0, 0), 3)])
+        >>> len(network), network.road_count()
+        (2, 2)
+        >>> RoadNetwork([((0, 0), (2, 2), 3)])
+        Traceback (most recent call last):
+        ...
+        ValueError: The road from (0, 0) to (2, 2) is shorter than the \
+grid distance
+        """
+        self.active = active
+        self.cache_size = cache_size
+        ids = {}
+        tails, heads, lengths = array("i"), array("i"), array("q")
+        for origin, destination, length in roads:
+            origin, destination = tuple(origin), tuple(destination)
+            shortest = abs(origin[0] - destination[0]) + \
+                abs(origin[1] - destination[1])
+            if length is None:
+                length = shortest
+            elif length < shortest:
+                raise ValueError("The road from {} to {} is shorter than "
+                                 "the grid distance".format(origin,
+                                                            destination))
+            tails.append(ids.setdefault(origin, len(ids)))
+            heads.append(ids.setdefault(destination, len(ids)))
+            lengths.append(length)
+        self._rows = array("i", [row for row, _ in ids])
+        self._cols = array("i", [col for _, col in ids])
+        self._offsets, self._heads, self._lengths = _adjacency(
+            len(ids), tails, heads, lengths)
+        self._reverse_offsets, self._tails, self._reverse_lengths = \
+            _adjacency(len(ids), heads, tails, lengths)
+        self._ids = ids
+        self._cache = {}
+        self._last = None
+        self._tree = None
+        self._choose_landmarks(landmarks)
+
+    def __len__(self):
+        """ Return the number of intersections in <self>.
+        @type self: RoadNetwork
+        @rtype: int
+        """
+        return len(self._rows)
+
+    def __getstate__(self):
+        """ Return the state of <self> to pickle, without the tables that
+        are rebuilt from its columns.
+        @type self: RoadNetwork
+        @rtype: dict[str, object]
+        >>> import pickle
+        >>> network = RoadNetwork(grid_roads(5, 5, one_way=True))
+        >>> copy = pickle.loads(pickle.dumps(network))
+        >>> copy.distance(Location(1, 1), Location(1, 2))
+        3
+        """
+        state = self.__dict__.copy()
+        for name in ("_ids", "_cache", "_last", "_tree"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        """ Restore <self> from the pickled <state>.
+        @type self: RoadNetwork
+        @type state: dict[str, object]
+        @rtype: None
+        """
+        self.__dict__.update(state)
+        self._index()
+
+    def road_count(self):
+        """ Return the number of roads in <self>.
+        @type self: RoadNetwork
+        @rtype: int
+        """
+        return len(self._heads)
+
+    def contains(self, location):
+        """ Return True iff <location> is an intersection of <self>.
+        @type self: RoadNetwork
+        @type location: Location
+        @rtype: bool
+        >>> network = RoadNetwork(grid_roads(3, 3))
+        >>> network.contains(Location(2, 2)), network.contains(Location(3, 3))
+        (True, False)
+        """
+        return location.location in self._ids
+
+    def distance(self, origin, destination):
+        """ Return the length of the shortest route from <origin> to
+        <destination>.
+        @type self: RoadNetwork
+        @type origin: Location
+        @type destination: Location
+        @rtype: int
+        >>> network = RoadNetwork(grid_roads(5, 5, one_way=True))
+        >>> network.distance(Location(1, 2), Location(1, 1))
+        1
+        >>> network.distance(Location(1, 1), Location(1, 2))
+        3
+        >>> network.distance(Location(0, 0), Location(5, 5))
+        Traceback (most recent call last):
+        ...
+        ValueError: (5,5) is not on the road network
+        """
+        source = self._ids.get(origin.location)
+        target = self._ids.get(destination.location)
+        if source is None or target is None:
+            missing = origin if source is None else destination
+            raise ValueError("{} is not on the road network".format(missing))
+        if source == target:
+            return 0
+        key = source * len(self._rows) + target
+        distance = self._cache.get(key)
+        if distance is None:
+            tree = self._tree
+            if tree is None or tree[0] != target:
+                if target == self._last:
+                    tree = self._tree = [target, {}, {target: 0},
+                                         [(0, target)]]
+                else:
+                    tree = None
+            self._last = target
+            if tree is None:
+                distance = self._search(source, target)
+            else:
+                distance = self._grow(tree, source)
+            if distance is None:
+                raise ValueError("There is no route from {} to {}".format(
+                    origin, destination))
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[key] = distance
+        return distance
+
+    def _search(self, source, target):
+        """ Return the length of the shortest route from intersection
+        <source> to intersection <target>, or None if there is none.
+        @type self: RoadNetwork
+        @type source: int
+        @type target: int
+        @rtype: int | None
+        """
+        guides = self._guides(source, target)
+        rows, cols = self._rows, self._cols
+        target_row, target_col = rows[target], cols[target]
+        offsets, heads, lengths = self._offsets, self._heads, self._lengths
+        best = {source: 0}
+        # Ties go to the intersection furthest along, so that the search
+        # does not spread over every intersection as close to the target
+        heap = [(0, 0, source)]
+        while heap:
+            _, distance, node = heappop(heap)
+            distance = -distance
+            if node == target:
+                return distance
+            if distance > best[node]:
+                continue
+            for road in range(offsets[node], offsets[node + 1]):
+                head = heads[road]
+                through = distance + lengths[road]
+                if through < best.get(head, _INFINITY):
+                    best[head] = through
+                    # A lower bound on the rest of the route; inf means
+                    # the target cannot be reached from head. A bound of
+                    # inf - inf is nan, which never raises the bound.
+                    bound = abs(rows[head] - target_row) + \
+                        abs(cols[head] - target_col)
+                    for from_landmark, landmark_to_target, to_landmark, \
+                            target_to_landmark in guides:
+                        ahead = landmark_to_target - from_landmark[head]
+                        if ahead > bound:
+                            bound = ahead
+                        behind = to_landmark[head] - target_to_landmark
+                        if behind > bound:
+                            bound = behind
+                    if bound != _INFINITY:
+                        heappush(heap, (through + bound, -through, head))
+        return None
+
+    def _grow(self, tree, source):
+        """ Grow the backward search <tree> until it reaches intersection
+        <source>, and return the length of the route from <source> to its
+        destination, or None if there is none.
+        @type self: RoadNetwork
+        @type tree: list
+        @type source: int
+        @rtype: int | None
+        """
+        _, reached, seen, heap = tree
+        distance = reached.get(source)
+        if distance is not None:
+            return distance
+        offsets, tails, lengths = self._reverse_offsets, self._tails, \
+            self._reverse_lengths
+        while heap:
+            distance, node = heappop(heap)
+            if node in reached:
+                continue
+            reached[node] = distance
+            for road in range(offsets[node], offsets[node + 1]):
+                tail = tails[road]
+                through = distance + lengths[road]
+                if through < seen.get(tail, _INFINITY):
+                    seen[tail] = through
+                    heappush(heap, (through, tail))
+            if node == source:
+                return distance
+        return None
+
+    def _guides(self, source, target):
+        """ Return the active landmarks that bound the distance from
+        <source> to <target> the most, each as (route lengths from the
+        landmark, route length from the landmark to <target>, route lengths
+        to the landmark, route length from <target> to the landmark).
+        @type self: RoadNetwork
+        @type source: int
+        @type target: int
+        @rtype: list[tuple]
+        """
+        ranked = []
+        for i, (from_landmark, to_landmark) in enumerate(
+                zip(self._from_landmarks, self._to_landmarks)):
+            guide = (from_landmark, from_landmark[target], to_landmark,
+                     to_landmark[target])
+            bound = max(guide[1] - from_landmark[source],
+                        to_landmark[source] - guide[3])
+            # nan bounds nothing
+            ranked.append((bound if bound == bound else 0, -i, guide))
+        ranked.sort(key=lambda entry: entry[:2], reverse=True)
+        return [guide for _, _, guide in ranked[:self.active]]
+
+    def _choose_landmarks(self, count):
+        """ Choose <count> landmarks spread far apart, and compute the
+        route lengths to and from each of them.
+        Each landmark is the intersection with the longest round trip to
+        the nearest landmark chosen before it, so intersections that no
+        landmark reaches come first.
+        @type self: RoadNetwork
+        @type count: int
+        @rtype: None
+        """
+        size = len(self._rows)
+        self._landmarks = array("i")
+        self._from_landmarks = []
+        self._to_landmarks = []
+        if size == 0:
+            return
+        # Start as far as possible from an arbitrary intersection
+        start = _dijkstra(self._offsets, self._heads, self._lengths, 0)
+        candidate = max(range(size),
+                        key=lambda v: (start[v] != _INFINITY, start[v]))
+        nearest = [_INFINITY] * size
+        while len(self._landmarks) < count and nearest[candidate] > 0:
+            forward = _dijkstra(self._offsets, self._heads, self._lengths,
+                                candidate)
+            backward = _dijkstra(self._reverse_offsets, self._tails,
+                                 self._reverse_lengths, candidate)
+            self._landmarks.append(candidate)
+            self._from_landmarks.append(forward)
+            self._to_landmarks.append(backward)
+            for v in range(size):
+                round_trip = forward[v] + backward[v]
+                if round_trip < nearest[v]:
+                    nearest[v] = round_trip
+            candidate = max(range(size), key=nearest.__getitem__)
+
+    def _index(self):
+        """ Rebuild the tables that are not saved with <self>.
+        @type self: RoadNetwork
+        @rtype: None
+        """
+        self._ids = {(row, col): v for v, (row, col)
+                     in enumerate(zip(self._rows, self._cols))}
+        self._cache = {}
+        self._last = None
+        self._tree = None
+
+
+def grid_roads(rows, columns, one_way=False, closed=0.0, seed=0):
+    """ Return the roads of a city laid out as a grid of <rows> x <columns>
+    intersections, one block apart.
+    @type rows: int
+    @type columns: int
+    @type one_way: bool
+        If True, streets alternate in direction, as avenues do, and only
+        the streets around the edge of the city are two-way.
+    @type closed: float
+        The share of the blocks that are closed, in both directions, chosen
+        at random. Closing blocks can leave intersections with no route
+        between them.
+    @type seed: int
+    @rtype: list[tuple]
+    >>> sorted(grid_roads(1, 3))
+    [((0, 0), (0, 1), None), ((0, 1), (0, 0), None), ((0, 1), (0, 2), None), \
+((0, 2), (0, 1), None)]
+    >>> len(grid_roads(4, 4)), len(grid_roads(4, 4, one_way=True))
+    (48, 36)
+    """
+    rng = random.Random(seed)
+    roads = []
+    for row in range(rows):
+        for col in range(columns):
+            for other, street, edge in (
+                    ((row, col + 1), row, row in (0, rows - 1)),
+                    ((row + 1, col), col, col in (0, columns - 1))):
+                if other[0] >= rows or other[1] >= columns:
+                    continue
+                if closed and rng.random() < closed:
+                    continue
+                here = (row, col)
+                if not one_way or edge or street % 2 == 0:
+                    roads.append((here, other, None))
+                if not one_way or edge or street % 2 == 1:
+                    roads.append((other, here, None))
+    return roads
+
+
+def parse_roads(filename, landmarks=8):
+    """ Return the RoadNetwork of the edge list in <filename>.
+    @type filename: str
+    @type landmarks: int
+    @rtype: RoadNetwork
+    >>> import os, tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), "roads.txt")
+    >>> with open(filename, "w") as file:
+    ...     _ = file.write("# A one-way loop\\n0,0 0,1\\n0,1 1,1\\n"
+    ...                    "1,1 0,0 5\\n")
+    >>> network = parse_roads(filename)
+    >>> network.distance(Location(0, 1), Location(0, 0))
+    6
+    """
+    with open(filename) as file:
+        return RoadNetwork(_read_roads(file), landmarks)
+
+
+def save_roads(network, filename):
+    """ Save <network>, with its landmarks, to <filename>.
+    @type network: RoadNetwork
+    @type filename: str
+    @rtype: None
+    >>> import os, tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), "roads.bin")
+    >>> save_roads(RoadNetwork(grid_roads(5, 5, one_way=True)), filename)
+    >>> network = load_roads(filename)
+    >>> len(network), network.road_count()
+    (25, 56)
+    >>> network.distance(Location(1, 1), Location(1, 2))
+    3
+    """
+    with open(filename, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, len(network), network.road_count(),
+                                len(network._landmarks)))
+        for column in _columns(network):
+            data = column_bytes(column)
+            file.write(data)
+            file.write(bytes(-len(data) % 8))
+
+
+def load_roads(filename, active=4, cache_size=1 << 16):
+    """ Return the RoadNetwork saved in <filename> by save_roads.
+    @type filename: str
+    @type active: int
+    @type cache_size: int
+    @rtype: RoadNetwork
+    """
+    with open(filename, "rb") as file:
+        magic, size, roads, landmarks = _HEADER.unpack(
+            file.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError("{} is not a saved road network".format(
+                filename))
+        network = RoadNetwork.__new__(RoadNetwork)
+        network.active = active
+        network.cache_size = cache_size
+
+        def read(typecode, count):
+            data = file.read(count * array(typecode).itemsize)
+            file.read(-len(data) % 8)
+            return read_column(data, typecode)
+        network._rows = read("i", size)
+        network._cols = read("i", size)
+        network._offsets = read("q", size + 1)
+        network._heads = read("i", roads)
+        network._lengths = read("q", roads)
+        network._reverse_offsets = read("q", size + 1)
+        network._tails = read("i", roads)
+        network._reverse_lengths = read("q", roads)
+        network._landmarks = read("i", landmarks)
+        network._from_landmarks = [read("d", size) for _ in range(landmarks)]
+        network._to_landmarks = [read("d", size) for _ in range(landmarks)]
+    network._index()
+    return network
+
+
+def open_roads(filename, landmarks=8):
+    """ Return the RoadNetwork in <filename>, which is either saved by
+    save_roads or an edge list.
+    @type filename: str
+    @type landmarks: int
+        The number of landmarks to choose for an edge list.
+    @rtype: RoadNetwork
+    """
+    with open(filename, "rb") as file:
+        saved = file.read(len(_MAGIC)) == _MAGIC
+    return load_roads(filename) if saved else parse_roads(filename, landmarks)
+
+
+def _read_roads(lines):
+    """ Yield (origin, destination, length) for each road in the edge list
+    <lines>.
+    @type lines: iterable[str]
+    @rtype: generator
+    >>> list(_read_roads(["0,0 0,1", "", "# closed", "0,1 0,0 4"]))
+    [((0, 0), (0, 1), None), ((0, 1), (0, 0), 4)]
+    """
+    for line in lines:
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        origin = tuple(int(value) for value in fields[0].split(","))
+        destination = tuple(int(value) for value in fields[1].split(","))
+        length = int(fields[2]) if len(fields) > 2 else None
+        yield origin, destination, length
+
+
+def _adjacency(size, tails, heads, lengths):
+    """ Return the offsets, heads and lengths of the roads from <tails> to
+    <heads>, grouped by tail.
+    @type size: int
+        The number of intersections.
+    @type tails: array
+    @type heads: array
+    @type lengths: array
+    @rtype: (array, array, array)
+    >>> offsets, heads, lengths = _adjacency(
+    ...     3, array("i", [2, 0, 2]), array("i", [0, 1, 1]),
+    ...     array("q", [5, 6, 7]))
+    >>> list(offsets), list(heads), list(lengths)
+    ([0, 1, 1, 3], [1, 0, 1], [6, 5, 7])
+    """
+    offsets = array("q", bytes(8 * (size + 1)))
+    for tail in tails:
+        offsets[tail + 1] += 1
+    for v in range(size):
+        offsets[v + 1] += offsets[v]
+    order = sorted(range(len(tails)), key=tails.__getitem__)
+    return (offsets, array("i", [heads[road] for road in order]),
+            array("q", [lengths[road] for road in order]))
+
+
+def _dijkstra(offsets, heads, lengths, source):
+    """ Return the route lengths from <source> to every intersection, inf
+    where there is no route.
+    @type offsets: array
+    @type heads: array
+    @type lengths: array
+    @type source: int
+    @rtype: array
+    """
+    distances = array("d", [_INFINITY]) * (len(offsets) - 1)
+    distances[source] = 0
+    heap = [(0, source)]
+    while heap:
+        distance, node = heappop(heap)
+        if distance > distances[node]:
+            continue
+        for road in range(offsets[node], offsets[node + 1]):
+            head = heads[road]
+            through = distance + lengths[road]
+            if through < distances[head]:
+                distances[head] = through
+                heappush(heap, (through, head))
+    return distances
+
+
+def _columns(network):
+    """ Return the columns of <network> in the order they are saved.
+    @type network: RoadNetwork
+    @rtype: list[array]
+    """
+    return ([network._rows, network._cols, network._offsets,
+             network._heads, network._lengths, network._reverse_offsets,
+             network._tails, network._reverse_lengths, network._landmarks] +
+            network._from_landmarks + network._to_landmarks)
+
+
+if __name__ == "__main__":
+    # python roads.py EDGES OUTPUT [LANDMARKS]   (precompute and save)
+    if len(sys.argv) in (3, 4):
+        network = parse_roads(sys.argv[1], *(int(value)
+                                             for value in sys.argv[3:]))
+        save_roads(network, sys.argv[2])
+        print("{}: {} intersections, {} roads, {} landmarks".format(
+            sys.argv[2], len(network), network.road_count(),
+            len(network._landmarks)))
+    else:
+        print("usage: python roads.py EDGES OUTPUT [LANDMARKS]")
@@ -0,0 +1,609 @@
+"""
+The sharding module runs one simulation split into regions. Each region has
+its own dispatcher, event queue and RunningMonitor, in a worker process of
+its own, and the regions' reports are merged at the end.
+
+The grid is split into strips of columns at the columns in <boundaries>:
+region 0 holds the columns before boundaries[0], region i the columns from
+boundaries[i - 1] up to boundaries[i], and the last region the rest. A
+rider belongs to the region of their origin, and a driver to the region it
+is in. A driver that drops a rider off in another region is handed off to
+that region, and requests its next rider there.
+
+The regions are kept in step by conservative synchronisation. Time is cut
+into windows of <lookahead> units. Every region simulates a window without
+hearing from the others, then they all exchange messages, which take effect
+at the start of the next window:
+- Hand-offs. A driver's hand-off is sent when the trip that crosses the
+  boundary starts, so it arrives in time as long as the trip lasts at
+  least <lookahead>. That is why the lookahead is the shortest travel time
+  across a boundary. Travel times are whole numbers, so a lookahead of 1
+  is always safe, except for trips rounded down to 0. Those are the only
+  hand-offs that arrive late, and they are delivered at the start of the
+  next window.
+- Cross-region matches. Riders that are still waiting at the end of a
+  window are offered the closest idle driver in another region, in the
+  order the dispatcher serves riders. The driver leaves its region and
+  starts driving to the rider at the start of the next window.
+Messages are exchanged in a fixed order, so the results do not depend on
+the number of processes or how they are scheduled.
+
+The results are close to those of a single simulation, but not the same:
+- a rider is only matched within their region at the time of their
+  request, even if a driver in another region is closer,
+- a driver that becomes idle only takes riders waiting in its own region,
+  so riders are served in the dispatcher's order region by region,
+- a match across regions waits for the end of the window.
+With a single region, the report is exactly that of Simulation.run.
+Otherwise, how close it comes depends on how busy the fleet is. This was
+measured on uniform Workload traces on a 100 by 100 grid over 2000 units
+of time, with 4,000 to 20,000 rider requests, split by
+balanced_boundaries into 2 or 4 regions, with 4 seeds each:
+- With at least 200 drivers for each rider request per unit of time, so
+  that riders rarely wait for a driver to become free, the merged
+  distance averages came within DISTANCE_TOLERANCE of a single
+  simulation's, and the average wait time within WAIT_TOLERANCE,
+  relative to the single simulation's values. The example of run_sharded
+  checks this on such a trace.
+- A smaller fleet is busy most of the time, and the regions drift much
+  further. A driver that becomes free takes a waiting rider of its own
+  region, close by, where a single dispatcher sends it to the first
+  waiting rider anywhere on the grid, so more rides are finished. With
+  50 drivers per rider request per unit of time, the average ride
+  distance was up to 13% off and the wait time up to 11%. With 20, the
+  average ride distance was up to 61% off.
+=== Constants ===
+@type DISTANCE_TOLERANCE: float
+    The largest relative difference measured in the average distances of
+    a fleet that is not kept busy, rounded up.
+@type WAIT_TOLERANCE: float
+    The largest relative difference measured in the average wait time of
+    a fleet that is not kept busy, rounded up.
+"""
+import multiprocessing
+from bisect import bisect_right
+from collections import deque
+
+from container import PriorityQueue
+from dispatcher import Dispatcher
+from driver import Driver
+from event import RiderRequest, DriverRequest, Pickup, Dropoff
+from location import intern_location
+from monitor import RunningMonitor, DRIVER, MATCH
+from rider import Rider
+from spatial import DriverGrid
+
+DISTANCE_TOLERANCE = 0.01
+WAIT_TOLERANCE = 0.15
+
+
+def region_of(boundaries, location):
+    """ Return the region of <location>, for regions split at the columns
+    in <boundaries>.
+    @type boundaries: list[int]
+    @type location: Location
+    @rtype: int
+    >>> from location import Location
+    >>> [region_of([10, 20], Location(0, c)) for c in (0, 10, 19, 25)]
+    [0, 1, 1, 2]
+    """
+    return bisect_right(boundaries, location.location[1])
+
+
+def balanced_boundaries(events, regions):
+    """ Return boundaries that split the columns into <regions> regions with
+    about as many requests in each.
+    @type events: iterable
+        The RiderRequests and DriverRequests of a simulation.
+    @type regions: int
+    @rtype: list[int]
+    >>> from event import create_event_list
+    >>> balanced_boundaries(create_event_list("events.txt"), 2)
+    [2]
+    """
+    columns = []
+    for event in events:
+        if isinstance(event, RiderRequest):
+            columns.append(event.rider.origin.location[1])
+        else:
+            columns.append(event.driver.location.location[1])
+    columns.sort()
+    boundaries = []
+    for i in range(1, regions):
+        column = columns[i * len(columns) // regions]
+        if not boundaries or column > boundaries[-1]:
+            boundaries.append(column)
+    return boundaries
+
+
+def run_sharded(events, boundaries, lookahead=1, processes=True,
+                percentiles=False):
+    """ Simulate the requests in <events> split into regions at the columns
+    in <boundaries>, and return the merged report.
+    @type events: iterable
+        RiderRequests and DriverRequests sorted by timestamp, such as
+        iter_events(filename).
+    @type boundaries: list[int]
+        The columns the regions start at, in increasing order.
+    @type lookahead: int
+        The length of a synchronisation window.
+    @type processes: bool
+        Whether to simulate each region in a worker process of its own. The
+        results are the same either way.
+    @type percentiles: bool
+        Whether to report percentiles as well as averages.
+    @rtype: dict[str, object]
+    >>> from event import iter_events
+    >>> from simulation import Simulation
+    >>> from eventlog import NullLog
+    >>> single = Simulation(event_log=NullLog()).run(
+    ...     sorted(iter_events("events.txt")))
+    >>> single == run_sharded(sorted(iter_events("events.txt")), [],
+    ...                       processes=False)
+    True
+    >>> run_sharded(sorted(iter_events("events.txt")), [3]) == \\
+    ...     run_sharded(sorted(iter_events("events.txt")), [3],
+    ...                 processes=False)
+    True
+    >>> import os, tempfile
+    >>> from workload import Workload, write_text
+    >>> filename = os.path.join(tempfile.mkdtemp(), "uniform.txt")
+    >>> write_text(Workload(fleet_size=400, rate=2.0), 2000, filename)
+    3822
+    >>> single = Simulation(event_log=NullLog()).run(iter_events(filename),
+    ...                                              stream=True)
+    >>> for regions in (2, 4):
+    ...     sharded = run_sharded(
+    ...         iter_events(filename),
+    ...         balanced_boundaries(iter_events(filename), regions))
+    ...     off = {key: abs(sharded[key] - value) / value
+    ...            for key, value in single.items()}
+    ...     print(off["rider_wait_time"] <= WAIT_TOLERANCE,
+    ...           off["driver_total_distance"] <= DISTANCE_TOLERANCE,
+    ...           off["driver_ride_distance"] <= DISTANCE_TOLERANCE)
+    True True True
+    True True True
+    """
+    if lookahead < 1:
+        raise ValueError("The lookahead must be at least 1")
+    regions = len(boundaries) + 1
+    if processes:
+        shards = [_RemoteShard(i, boundaries, percentiles)
+                  for i in range(regions)]
+    else:
+        shards = [_LocalShard(i, boundaries, percentiles)
+                  for i in range(regions)]
+    try:
+        return _run(shards, iter(events), boundaries, lookahead)
+    finally:
+        for shard in shards:
+            shard.close()
+
+
+def _run(shards, source, boundaries, lookahead):
+    """ Run the simulation of <source> on <shards> and return the merged
+    report.
+    @type shards: list[_LocalShard | _RemoteShard]
+    @type source: iterator
+    @type boundaries: list[int]
+    @type lookahead: int
+    @rtype: dict[str, object]
+    """
+    regions = len(shards)
+    arrivals, departures, matches = _no_messages(regions)
+    next_input = next(source, None)
+    start = None if next_input is None else next_input.timestamp
+    while start is not None:
+        end = start + lookahead
+        inputs = [[] for _ in range(regions)]
+        while next_input is not None and next_input.timestamp < end:
+            if next_input.timestamp < start:
+                raise ValueError("Events must be sorted by timestamp")
+            region, request = _request(boundaries, next_input)
+            inputs[region].append(request)
+            next_input = next(source, None)
+        for i, shard in enumerate(shards):
+            shard.send(("advance", start, end, inputs[i], arrivals[i],
+                        departures[i], matches[i]))
+        results = [shard.receive() for shard in shards]
+
+        arrivals, departures, matches = _no_messages(regions)
+        for handoffs, _, _, _ in results:
+            for region, handoff in handoffs:
+                arrivals[region].append(handoff)
+        waiting = [result[1] for result in results]
+        idle = [i for i, result in enumerate(results) if result[2] > 0]
+        # Only ask for idle drivers when some could be matched
+        if any(waiting[i] and idle != [i] for i in range(regions)) and idle:
+            for i in idle:
+                shards[i].send(("idle",))
+            drivers = {i: shards[i].receive() for i in idle}
+            _match_across(waiting, drivers, departures, matches)
+
+        times = [result[3] for result in results if result[3] is not None]
+        if next_input is not None:
+            times.append(next_input.timestamp)
+        if any(arrivals) or any(matches):
+            times.append(end)
+        start = min(times) if times else None
+
+    for shard in shards:
+        shard.send(("monitor",))
+    monitors = [shard.receive() for shard in shards]
+    for monitor in monitors[1:]:
+        monitors[0].merge(monitor)
+    return monitors[0].report()
+
+
+def _no_messages(regions):
+    """ Return empty lists of arrivals, departures and matches for each of
+    <regions> regions.
+    @type regions: int
+    @rtype: tuple[list[list], list[list], list[list]]
+    """
+    return ([[] for _ in range(regions)], [[] for _ in range(regions)],
+            [[] for _ in range(regions)])
+
+
+def _request(boundaries, event):
+    """ Return the region of the request <event> and the request as plain
+    values to send to it.
+    @type boundaries: list[int]
+    @type event: RiderRequest | DriverRequest
+    @rtype: tuple[int, tuple]
+    """
+    if isinstance(event, RiderRequest):
+        rider = event.rider
+        return region_of(boundaries, rider.origin), (
+            event.timestamp, rider.id, rider.origin.location,
+            rider.destination.location, rider.patience)
+    driver = event.driver
+    return region_of(boundaries, driver.location), (
+        event.timestamp, driver.id, driver.location.location, driver.speed)
+
+
+def _match_across(waiting, drivers, departures, matches):
+    """ Offer each waiting rider the closest idle driver in another region,
+    riders in the order the dispatcher serves them, and record the
+    resulting departures and matches by region.
+    @type waiting: list[list[tuple]]
+        The waiting riders of each region, as returned by _Shard.advance.
+    @type drivers: dict[int, list[tuple]]
+        The idle drivers of each region that has any, as returned by
+        _Shard.idle_drivers.
+    @type departures: list[list[str]]
+    @type matches: list[list[tuple]]
+    @rtype: None
+    """
+    grids = {}
+    found = {}
+    for region in sorted(drivers):
+        grids[region] = DriverGrid()
+        for identifier, (row, column), speed, state in drivers[region]:
+            driver = Driver(identifier, intern_location(row, column), speed)
+            grids[region].add(driver)
+            found[id(driver)] = state
+    riders = sorted((patience, initial, region, identifier, origin)
+                    for region, riders in enumerate(waiting)
+                    for patience, initial, identifier, origin in riders)
+    for _, _, region, identifier, origin in riders:
+        origin = intern_location(*origin)
+        best = None
+        for other, grid in grids.items():
+            driver = grid.nearest(origin) if other != region else None
+            if driver is not None:
+                time = driver.get_travel_time(origin)
+                if best is None or time < best[0]:
+                    best = (time, other, driver)
+        if best is None:
+            continue
+        _, other, driver = best
+        grids[other].remove(driver)
+        departures[other].append(driver.id)
+        matches[region].append((identifier, (
+            driver.id, driver.location.location, driver.speed,
+            found[id(driver)])))
+
+
+class _Shard:
+    """ The simulation of one region.
+    === Private Attributes ===
+    @type _region: int
+        The number of the region.
+    @type _boundaries: list[int]
+        The columns the regions start at.
+    @type _dispatcher: Dispatcher
+        The dispatcher of the region.
+    @type _monitor: RunningMonitor
+        The monitor of the region.
+    @type _events: PriorityQueue[Event]
+        The events waiting to be done in the region.
+    @type _drivers: dict[str, Driver]
+        The drivers in the region, by identifier.
+    @type _leaving: dict[str, int]
+        The region each driver on a trip out of the region is going to, by
+        identifier.
+    @type _waiting: dict[str, Rider]
+        The riders reported waiting at the end of the last window, by
+        identifier.
+    """
+
+    def __init__(self, region, boundaries, percentiles):
+        """ Initialize the simulation of region <region>.
+        @type self: _Shard
+        @type region: int
+        @type boundaries: list[int]
+        @type percentiles: bool
+        @rtype: None
+        """
+        self._region = region
+        self._boundaries = boundaries
+        self._dispatcher = Dispatcher()
+        self._monitor = RunningMonitor(percentiles)
+        self._events = PriorityQueue()
+        self._drivers = {}
+        self._leaving = {}
+        self._waiting = {}
+
+    def advance(self, start, end, inputs, arrivals, departures, matches):
+        """ Apply the messages from the last synchronisation at <start>,
+        then simulate the region up to <end>.
+        Return the hand-offs to other regions, the riders still waiting,
+        the number of idle drivers and the time of the next event.
+        @type self: _Shard
+        @type start: int
+        @type end: int
+        @type inputs: list[tuple]
+            The requests made in the region from <start> up to <end>.
+        @type arrivals: list[tuple]
+            The drivers handed off to the region.
+        @type departures: list[str]
+            The idle drivers matched to riders in other regions.
+        @type matches: list[tuple]
+            Waiting riders matched to drivers from other regions.
+        @rtype: tuple[list[tuple], list[tuple], int, int | None]
+        """
+        for identifier in departures:
+            driver = self._drivers.pop(identifier)
+            self._dispatcher.release_driver(driver)
+            self._monitor.forget_driver(identifier)
+        for identifier, (driver_id, location, speed, state) in matches:
+            rider = self._waiting[identifier]
+            driver = self._add_driver(driver_id, location, speed)
+            self._dispatcher.add_driver(driver)
+            self._dispatcher.cancel_ride(rider)
+            self._monitor.restore_driver(driver_id, state)
+            self._monitor.notify(start, DRIVER, MATCH, driver_id, location)
+            travel_time = driver.start_drive(rider.origin)
+            self._events.add(Pickup(start + travel_time, rider, driver))
+        for timestamp, driver_id, location, speed in arrivals:
+            driver = self._add_driver(driver_id, location, speed)
+            # A late hand-off is done as soon as it can be
+            self._events.add(DriverRequest(max(timestamp, start), driver))
+
+        handoffs = []
+        pending = deque(self._input_event(request) for request in inputs)
+        events = self._events
+        while True:
+            # An input event goes before spawned events at the same time,
+            # just as in Simulation.run
+            if pending and (events.is_empty() or pending[0].timestamp <=
+                            events.first_element().timestamp):
+                event = pending.popleft()
+            elif not events.is_empty() and \
+                    events.first_element().timestamp < end:
+                event = events.remove()
+            else:
+                break
+            for new_event in self._follow(event, handoffs):
+                events.add(new_event)
+
+        riders = self._dispatcher.rider_list.items
+        self._waiting = {rider.id: rider for rider in riders}
+        waiting = [(rider.patience, rider.initial, rider.id,
+                    rider.origin.location) for rider in riders]
+        next_time = None if events.is_empty() else \
+            events.first_element().timestamp
+        return handoffs, waiting, self._dispatcher.idle_count(), next_time
+
+    def idle_drivers(self):
+        """ Return the idle drivers of the region, in registration order.
+        @type self: _Shard
+        @rtype: list[tuple]
+        """
+        return [(driver.id, driver.location.location, driver.speed,
+                 self._monitor.driver_state(driver.id))
+                for driver in self._dispatcher.idle_drivers()]
+
+    def monitor(self):
+        """ Return the monitor of the region.
+        @type self: _Shard
+        @rtype: RunningMonitor
+        """
+        return self._monitor
+
+    def _add_driver(self, identifier, location, speed):
+        """ Return a new driver in the region.
+        @type self: _Shard
+        @type identifier: str
+        @type location: tuple[int, int]
+        @type speed: int
+        @rtype: Driver
+        """
+        driver = Driver(identifier, intern_location(*location), speed)
+        self._drivers[identifier] = driver
+        return driver
+
+    def _input_event(self, request):
+        """ Return the event for a request sent by _request.
+        @type self: _Shard
+        @type request: tuple
+        @rtype: RiderRequest | DriverRequest
+        """
+        if len(request) == 5:
+            timestamp, identifier, origin, destination, patience = request
+            return RiderRequest(timestamp, Rider(
+                identifier, intern_location(*origin),
+                intern_location(*destination), patience))
+        timestamp, identifier, location, speed = request
+        return DriverRequest(timestamp,
+                             self._add_driver(identifier, location, speed))
+
+    def _follow(self, event, handoffs):
+        """ Do <event> and return the events it spawns in the region.
+        Drivers leaving the region are added to <handoffs>.
+        @type self: _Shard
+        @type event: Event
+        @type handoffs: list[tuple]
+        @rtype: list[Event]
+        """
+        new_events = event.do(self._dispatcher, self._monitor) or []
+        if isinstance(event, Pickup):
+            for new_event in new_events:
+                if isinstance(new_event, Dropoff):
+                    region = region_of(self._boundaries,
+                                       new_event.rider.destination)
+                    if region != self._region:
+                        driver = new_event.driver
+                        self._leaving[driver.id] = region
+                        handoffs.append((region, (
+                            new_event.timestamp, driver.id,
+                            new_event.rider.destination.location,
+                            driver.speed)))
+        elif isinstance(event, Dropoff) and event.driver.id in self._leaving:
+            # The driver's next request is made in the region it went to
+            driver = event.driver
+            del self._leaving[driver.id]
+            del self._drivers[driver.id]
+            self._dispatcher.release_driver(driver)
+            self._monitor.forget_driver(driver.id)
+            new_events = [new_event for new_event in new_events
+                          if not isinstance(new_event, DriverRequest)]
+        return new_events
+
+
+def _handle(shard, message):
+    """ Carry out <message> on <shard> and return the answer.
+    @type shard: _Shard
+    @type message: tuple
+    @rtype: object
+    """
+    if message[0] == "advance":
+        return shard.advance(*message[1:])
+    if message[0] == "idle":
+        return shard.idle_drivers()
+    return shard.monitor()
+
+
+def _serve(connection, region, boundaries, percentiles):
+    """ Simulate region <region> in a worker process, answering messages
+    from <connection> until asked for the monitor.
+    @type connection: Connection
+    @type region: int
+    @type boundaries: list[int]
+    @type percentiles: bool
+    @rtype: None
+    """
+    shard = _Shard(region, boundaries, percentiles)
+    while True:
+        message = connection.recv()
+        connection.send(_handle(shard, message))
+        if message[0] == "monitor":
+            return
+
+
+class _LocalShard:
+    """ A region simulated in this process.
+    === Private Attributes ===
+    @type _shard: _Shard
+        The simulation of the region.
+    @type _answer: object
+        The answer to the last message.
+    """
+
+    def __init__(self, region, boundaries, percentiles):
+        """ Initialize the simulation of region <region>.
+        @type self: _LocalShard
+        @type region: int
+        @type boundaries: list[int]
+        @type percentiles: bool
+        @rtype: None
+        """
+        self._shard = _Shard(region, boundaries, percentiles)
+        self._answer = None
+
+    def send(self, message):
+        """ Carry out <message>.
+        @type self: _LocalShard
+        @type message: tuple
+        @rtype: None
+        """
+        self._answer = _handle(self._shard, message)
+
+    def receive(self):
+        """ Return the answer to the last message.
+        @type self: _LocalShard
+        @rtype: object
+        """
+        return self._answer
+
+    def close(self):
+        """ Stop simulating the region.
+        @type self: _LocalShard
+        @rtype: None
+        """
+        pass
+
+
+class _RemoteShard:
+    """ A region simulated in a worker process.
+    === Private Attributes ===
+    @type _connection: Connection
+        The connection to the worker.
+    @type _process: Process
+        The worker.
+    """
+
+    def __init__(self, region, boundaries, percentiles):
+        """ Start a worker simulating region <region>.
+        @type self: _RemoteShard
+        @type region: int
+        @type boundaries: list[int]
+        @type percentiles: bool
+        @rtype: None
+        """
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context()
+        self._connection, theirs = context.Pipe()
+        self._process = context.Process(
+            target=_serve, args=(theirs, region, boundaries, percentiles),
+            daemon=True)
+        self._process.start()
+        theirs.close()
+
+    def send(self, message):
+        """ Send <message> to the worker.
+        @type self: _RemoteShard
+        @type message: tuple
+        @rtype: None
+        """
+        self._connection.send(message)
+
+    def receive(self):
+        """ Return the worker's answer to the last message.
+        @type self: _RemoteShard
+        @rtype: object
+        """
+        return self._connection.recv()
+
+    def close(self):
+        """ Stop the worker.
+        @type self: _RemoteShard
+        @rtype: None
+        """
+        self._connection.close()
+        self._process.join(timeout=1)
+        if self._process.is_alive():
+            self._process.terminate()
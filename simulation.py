@@ -1,6 +1,11 @@
+from itertools import islice
+
+from compact import run_compact
 from container import PriorityQueue
 from dispatcher import Dispatcher
-from event import create_event_list
+from event import create_event_list, iter_events
+from eventlog import PrintLog
+from location import set_road_network
 from monitor import Monitor
 
 
@@ -17,29 +22,115 @@ class Simulation:
     auto-testing purposes. This makes it ESSENTIAL that you do not change the
     interface in any way!
     === Private Attributes ===
-    @type _events: PriorityQueue[Event]
+    @type _events: PriorityQueue[Event] | BucketQueue[Event] | TimerQueue
         A sequence of events arranged in priority determined by the event
         sorting order.
     @type _dispatcher: Dispatcher
         The dispatcher associated with the simulation.
+    @type _monitor: Monitor
+        The monitor that keeps the statistics of the simulation.
+    @type _event_log: EventLog
+        Where every event is recorded once it has been done.
+    @type _profiler: Profiler | None
+        What every event is done through, to time it, if anything.
+    @type _checkpoints: Checkpointer | None
+        What is told after every event, to save checkpoints, if anything.
+    @type _consumed: int
+        The number of input events taken so far. A simulation resumed from
+        a checkpoint skips that many input events.
+    @type _compact: bool
+        True if events are queued as tuples by run_compact.
+    @type _road_network: RoadNetwork | None
+        The road network travel is measured along while the simulation
+        runs, if any.
     """
 
-    def __init__(self):
+    def __init__(self, batch_window=None, event_log=None, monitor=None,
+                 profiler=None, checkpoints=None, compact=False,
+                 event_queue=None, road_network=None):
         """ Initialize a Simulation.
         @type self: Simulation
+        @type batch_window: int | None
+            If given, the dispatcher matches riders and drivers in batches
+            every <batch_window> units of time instead of one request at a
+            time.
+        @type event_log: EventLog | None
+            Where to record the events done, such as a NullLog to record
+            nothing or a BufferedFileLog to write them to a file. Events are
+            printed if no log is given.
+        @type monitor: Monitor | None
+            The monitor to keep the statistics with, such as a
+            RunningMonitor for long simulations. A Monitor is used if none
+            is given.
+        @type profiler: Profiler | None
+            If given, the events are done through <profiler>, which times
+            them and the calls they make to the dispatcher and monitor.
+        @type checkpoints: Checkpointer | None
+            If given, <checkpoints> saves checkpoints of the simulation as
+            it runs.
+        @type compact: bool
+            If True, run is given a Trace, and the events are queued as
+            plain tuples instead of Event objects (see run_compact). Such a
+            simulation cannot be profiled or checkpointed, or be given an
+            event queue.
+        @type event_queue: Container | None
+            The empty container to queue the events in, such as a
+            BucketQueue, or a TimerQueue, which drops the Cancellations of
+            riders who have been picked up. A PriorityQueue is used if none
+            is given.
+        @type road_network: RoadNetwork | None
+            If given, travel times and distances are measured along its
+            roads while the simulation runs, instead of on the open grid.
+            Every location in the simulation must be one of its
+            intersections.
         @rtype: None
         """
-        self._events = PriorityQueue()
-        self._dispatcher = Dispatcher()
-        self._monitor = Monitor()
+        if compact and (profiler is not None or checkpoints is not None):
+            raise ValueError("A compact simulation cannot be profiled or "
+                             "checkpointed")
+        if compact and event_queue is not None:
+            raise ValueError("A compact simulation queues its events itself")
+        self._events = PriorityQueue() if event_queue is None else \
+            event_queue
+        self._dispatcher = Dispatcher(batch_window=batch_window)
+        self._monitor = Monitor() if monitor is None else monitor
+        self._event_log = PrintLog() if event_log is None else event_log
+        self._profiler = profiler
+        self._checkpoints = checkpoints
+        self._consumed = 0
+        self._compact = compact
+        self._road_network = road_network
+
+    def __getstate__(self):
+        """ Return the state of <self> to pickle, without the event log,
+        profiler and checkpointer, which are given again on resuming.
+        @type self: Simulation
+        @rtype: dict[str, object]
+        """
+        state = self.__dict__.copy()
+        for name in ("_event_log", "_profiler", "_checkpoints"):
+            del state[name]
+        return state
 
-    def run(self, initial_events):
+    def run(self, initial_events, stream=False):
         """ Run the simulation on the list of events in <initial_events>.
         Return a dictionary containing statistics of the simulation,
         according to the specifications in the assignment handout.
+
+        If <stream> is True, <initial_events> can be any iterable of events
+        sorted by timestamp, such as iter_events(filename). Events are then
+        pulled from it only when the simulation reaches their time, instead
+        of all being queued up front, so only the events that have not
+        happened yet are held in memory. Events are done in the same order
+        either way.
+
+        A simulation resumed from a checkpoint is run on the same
+        <initial_events> as the original, and carries on where the
+        checkpoint was saved.
         @type self: Simulation
-        @type initial_events: list[Event]
+        @type initial_events: list[Event] | iterable
             An initial list of events.
+        @type stream: bool
         @rtype: dict[str, object]
         >>> a = Simulation()
         >>> a.run(create_event_list("events_small.txt"))
@@ -52,17 +143,69 @@ class Simulation:
         {'driver_total_distance': 14.0, 'rider_wait_time': \
 11.0, 'driver_ride_distance': 10.0}
         """
-        # Load all the initial events
-        for event in initial_events:
-            self._events.add(event)
-        # Continue running until there are no more events in the queue
-        while not self._events.is_empty():
-            curr_event = self._events.remove()
-            new_event = curr_event.do(self._dispatcher, self._monitor)
-            if new_event is not None and new_event != []:
-                for i in new_event:
-                    self._events.add(i)
-            print(curr_event)
+        if self._road_network is None:
+            return self._run(initial_events, stream)
+        previous = set_road_network(self._road_network)
+        try:
+            return self._run(initial_events, stream)
+        finally:
+            set_road_network(previous)
+
+    def _run(self, initial_events, stream):
+        """ Run the simulation on <initial_events>, as run does.
+        @type self: Simulation
+        @type initial_events: list[Event] | iterable
+        @type stream: bool
+        @rtype: dict[str, object]
+        """
+        # Skip the call altogether when the log discards events
+        log = self._event_log.log if self._event_log.enabled else None
+        if self._compact:
+            run_compact(initial_events, self._dispatcher, self._monitor, log,
+                        stream)
+            self._event_log.flush()
+            return self._monitor.report()
+        # Skip the input events a resumed simulation has already taken
+        source = islice(initial_events, self._consumed, None)
+        if not stream:
+            # Load all the initial events
+            for event in source:
+                self._events.add(event)
+                self._consumed += 1
+        profiler = self._profiler
+        checkpoints = self._checkpoints
+        dispatcher, monitor = self._dispatcher, self._monitor
+        # Events schedule the events they spawn straight into the queue
+        schedule = self._events.add
+        if profiler is not None:
+            dispatcher, monitor = profiler.wrap(dispatcher, monitor)
+        next_input = next(source, None)
+        # Continue running until there are no more events in the queue or
+        # still to come from the source
+        while next_input is not None or not self._events.is_empty():
+            # An input event goes before spawned events at the same time,
+            # just as if it had been queued up front
+            if next_input is not None and (
+                    self._events.is_empty() or next_input.timestamp <=
+                    self._events.first_element().timestamp):
+                curr_event = next_input
+                self._consumed += 1
+                next_input = next(source, None)
+                if next_input is not None and \
+                        next_input.timestamp < curr_event.timestamp:
+                    raise ValueError("Streamed events must be sorted by "
+                                     "timestamp")
+            else:
+                curr_event = self._events.remove()
+            if profiler is None:
+                curr_event.do(dispatcher, monitor, schedule)
+            else:
+                profiler.do(curr_event, dispatcher, monitor, self._events)
+            if log is not None:
+                log(curr_event)
+            if checkpoints is not None:
+                checkpoints.event_done(self, curr_event.timestamp)
+        self._event_log.flush()
         return self._monitor.report()
 
 
@@ -0,0 +1,141 @@
+"""
+The sketch module contains the LogHistogram class, a compact summary of a
+stream of non-negative integers that can answer quantile queries, such as
+the 95th percentile wait time, without keeping the values themselves.
+
+Values below EXACT_LIMIT are counted exactly. Larger values are counted in
+buckets that split every power of two into SUB_BUCKETS equal parts, so a
+reported quantile is within 1 / SUB_BUCKETS of the true value, and a
+histogram never has more than a few hundred buckets. Two histograms are
+merged by adding up their counts, so statistics from separate runs can be
+combined cheaply.
+=== Constants ===
+@type SUB_BUCKETS: int
+    The number of buckets each power of two is split into.
+@type EXACT_LIMIT: int
+    The values below this are counted exactly.
+"""
+
+from math import ceil
+
+SUB_BUCKETS = 64
+EXACT_LIMIT = 2 * SUB_BUCKETS
+
+# The number of bits of a value kept by its bucket
+_KEPT_BITS = EXACT_LIMIT.bit_length() - 1
+
+
+def _bucket(value):
+    """ Return the bucket <value> is counted in.
+    Buckets are numbered in increasing order of the values they hold.
+    @type value: int
+    @rtype: int
+    >>> [_bucket(value) for value in (0, 127, 128, 129, 130, 255, 256)]
+    [0, 127, 128, 128, 129, 191, 192]
+    """
+    if value < EXACT_LIMIT:
+        return value
+    shift = value.bit_length() - _KEPT_BITS
+    return shift * SUB_BUCKETS + (value >> shift)
+
+
+def _bucket_value(bucket):
+    """ Return the value reported for the values counted in <bucket>, the
+    middle of the values it holds.
+    @type bucket: int
+    @rtype: float
+    >>> [_bucket_value(bucket) for bucket in (0, 127, 128, 191, 192)]
+    [0, 127, 128.5, 254.5, 257.5]
+    """
+    if bucket < EXACT_LIMIT:
+        return bucket
+    shift = bucket // SUB_BUCKETS - 1
+    low = (bucket - shift * SUB_BUCKETS) << shift
+    return low + ((1 << shift) - 1) / 2
+
+
+class LogHistogram:
+    """ A histogram of non-negative integers with logarithmic buckets.
+    === Attributes ===
+    @type count: int
+        The number of values added.
+    === Private Attributes ===
+    @type _counts: dict[int, int]
+        The number of values counted in each non-empty bucket.
+    """
+
+    def __init__(self):
+        """ Initialize an empty LogHistogram.
+        @type self: LogHistogram
+        @rtype: None
+        """
+        self.count = 0
+        self._counts = {}
+
+    def __str__(self):
+        """ Return a string representation.
+        @type self: LogHistogram
+        @rtype: str
+        >>> print(LogHistogram())
+        LogHistogram (0 values, 0 buckets)
+        """
+        return "LogHistogram ({} values, {} buckets)".format(
+            self.count, len(self._counts))
+
+    def add(self, value):
+        """ Count <value>.
+        @type self: LogHistogram
+        @type value: int
+        @rtype: None
+        """
+        if value < 0:
+            raise ValueError("LogHistogram only counts non-negative values")
+        bucket = _bucket(value)
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self.count += 1
+
+    def merge(self, other):
+        """ Count every value counted by <other> as well.
+        @type self: LogHistogram
+        @type other: LogHistogram
+        @rtype: None
+        >>> a, b = LogHistogram(), LogHistogram()
+        >>> for value in range(50):
+        ...     a.add(value)
+        ...     b.add(value + 50)
+        >>> a.merge(b)
+        >>> a.count, a.quantile(0.5)
+        (100, 49)
+        """
+        for bucket, count in other._counts.items():
+            self._counts[bucket] = self._counts.get(bucket, 0) + count
+        self.count += other.count
+
+    def quantile(self, q):
+        """ Return the <q> quantile of the values counted: the smallest value
+        such that a fraction <q> of the values are no greater than it.
+        Return None if no values have been counted.
+        @type self: LogHistogram
+        @type q: float
+            Between 0 and 1.
+        @rtype: float | None
+        >>> a = LogHistogram()
+        >>> for value in range(1, 101):
+        ...     a.add(value)
+        >>> a.quantile(0.5), a.quantile(0.95), a.quantile(1)
+        (50, 95, 100)
+        >>> a.add(1000)
+        >>> a.quantile(1)
+        1003.5
+        """
+        if self.count == 0:
+            return None
+        # The rank, counting from 1, of the value wanted. The small nudge
+        # keeps rounding error in q * count from pushing it up by one.
+        rank = max(1, ceil(q * self.count - 1e-9))
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= rank:
+                return _bucket_value(bucket)
+        return _bucket_value(max(self._counts))
@@ -0,0 +1,403 @@
+"""
+The spatial module contains the DriverGrid class, a bucketed spatial index
+over the city grid used by the dispatcher to find the driver who can reach
+a location the fastest without looking at every driver.
+"""
+
+from location import BATCH_THRESHOLD, manhattan_distance, \
+    manhattan_distances, road_network
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class DriverGrid:
+    """ A spatial index of drivers on the city grid.
+
+    The grid is cut into square cells of <cell_size> x <cell_size>
+    intersections, and drivers are bucketed by speed and then by cell.
+    A nearest-driver query searches each speed class outward from the
+    target's cell, ring by ring. Every location in ring r is at least
+    (r - 1) * cell_size + 1 blocks away, so the search of a class stops as
+    soon as that lower bound, divided by the class speed, is worse than the
+    best travel time found so far. Faster classes are searched first since
+    they tighten the bound the most.
+
+    Ties on travel time go to the driver with the lowest rank, which by
+    default is the driver that was added to the grid first.
+
+    With a road network, travel times are measured along its roads. Roads
+    are never shorter than the Manhattan distance, so the ring bound still
+    holds, and the search returns the same driver as checking every one.
+    Within a cell, drivers are then checked in order of their Manhattan
+    travel time, and those that cannot beat the best found are skipped,
+    since measuring along the roads costs far more.
+    === Private Attributes ===
+    @type _cell_size: int
+        The side length of a cell, in blocks.
+    @type _classes: dict[int, dict[tuple, dict[int, Driver]]]
+        Maps a speed to that speed class's cells, and each cell to the
+        drivers in it, keyed by id(driver).
+    @type _bounds: dict[int, list[int]]
+        Maps a speed to the [min_row, max_row, min_col, max_col] cell
+        bounds of every cell ever occupied in that speed class.
+    @type _speeds: list[int]
+        The speed classes, fastest first.
+    @type _entries: dict[int, list]
+        Maps id(driver) to [rank, speed, cell] for each driver.
+    @type _counter: int
+        The default rank given to the next added driver.
+    """
+
+    def __init__(self, cell_size=8):
+        """ Initialize an empty DriverGrid.
+        @type self: DriverGrid
+        @type cell_size: int
+            Precondition: cell_size > 0
+        @rtype: None
+        """
+        self._cell_size = cell_size
+        self._classes = {}
+        self._bounds = {}
+        self._speeds = []
+        self._entries = {}
+        self._counter = 0
+
+    def __len__(self):
+        """ Return the number of drivers in <self>.
+        @type self: DriverGrid
+        @rtype: int
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> grid = DriverGrid()
+        >>> grid.add(Driver("Tom", Location(1, 1), 1))
+        >>> len(grid)
+        1
+        """
+        return len(self._entries)
+
+    def __getstate__(self):
+        """ Return the state of <self> to pickle, with the drivers listed
+        instead of keyed by id, which does not survive pickling.
+        @type self: DriverGrid
+        @rtype: dict[str, object]
+        >>> import pickle
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> grid = DriverGrid()
+        >>> grid.add(Driver("Tom", Location(1, 1), 1))
+        >>> copy = pickle.loads(pickle.dumps(grid))
+        >>> tom = copy.nearest(Location(5, 5))
+        >>> print(tom)
+        Tom
+        >>> copy.contains(tom)
+        True
+        """
+        state = self.__dict__.copy()
+        drivers = {}
+        classes = {}
+        for speed, cells in self._classes.items():
+            classes[speed] = {}
+            for cell, bucket in cells.items():
+                classes[speed][cell] = list(bucket.values())
+                drivers.update(bucket)
+        state["_classes"] = classes
+        state["_entries"] = [(drivers[key], entry)
+                             for key, entry in self._entries.items()]
+        return state
+
+    def __setstate__(self, state):
+        """ Restore <self> from the pickled <state>.
+        @type self: DriverGrid
+        @type state: dict[str, object]
+        @rtype: None
+        """
+        self.__dict__.update(state)
+        self._classes = {
+            speed: {cell: {id(driver): driver for driver in bucket}
+                    for cell, bucket in cells.items()}
+            for speed, cells in state["_classes"].items()}
+        self._entries = {id(driver): entry
+                         for driver, entry in state["_entries"]}
+
+    def contains(self, driver):
+        """ Return True iff <driver> is in <self>.
+        @type self: DriverGrid
+        @type driver: Driver
+        @rtype: bool
+        """
+        return id(driver) in self._entries
+
+    def drivers(self):
+        """ Return the drivers in <self>, lowest rank first.
+        @type self: DriverGrid
+        @rtype: list[Driver]
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> grid = DriverGrid()
+        >>> grid.add(Driver("Tom", Location(1, 1), 1), 5)
+        >>> grid.add(Driver("Carl", Location(90, 90), 1), 2)
+        >>> [str(driver) for driver in grid.drivers()]
+        ['Carl', 'Tom']
+        """
+        ranked = []
+        for cells in self._classes.values():
+            for bucket in cells.values():
+                for key, driver in bucket.items():
+                    ranked.append((self._entries[key][0], driver))
+        ranked.sort(key=lambda pair: pair[0])
+        return [driver for _, driver in ranked]
+
+    def add(self, driver, rank=None):
+        """ Add <driver> to <self> at its current location.
+        Ties between drivers are broken by <rank>, lowest first. If no rank
+        is given, the driver ranks after every driver added before it.
+        Precondition: <driver> is not already in <self>.
+        @type self: DriverGrid
+        @type driver: Driver
+        @type rank: int | None
+        @rtype: None
+        """
+        speed = driver.speed
+        if speed not in self._classes:
+            self._classes[speed] = {}
+            self._speeds.append(speed)
+            self._speeds.sort(reverse=True)
+        cell = self._cell_of(driver.location)
+        if rank is None:
+            rank = self._counter
+            self._counter += 1
+        self._entries[id(driver)] = [rank, speed, cell]
+        self._insert(driver, speed, cell)
+
+    def remove(self, driver):
+        """ Remove <driver> from <self>, if it is there.
+        @type self: DriverGrid
+        @type driver: Driver
+        @rtype: None
+        """
+        entry = self._entries.pop(id(driver), None)
+        if entry is not None:
+            self._discard(driver, entry[1], entry[2])
+
+    def move(self, driver, location):
+        """ Record that <driver>, which is in <self>, is now at <location>.
+        The driver keeps its place in the tie-breaking order.
+        @type self: DriverGrid
+        @type driver: Driver
+        @type location: Location
+        @rtype: None
+        """
+        entry = self._entries[id(driver)]
+        cell = self._cell_of(location)
+        if cell != entry[2]:
+            self._discard(driver, entry[1], entry[2])
+            entry[2] = cell
+            self._insert(driver, entry[1], cell)
+
+    def nearest(self, location):
+        """ Return the driver who can get to <location> the fastest, or None
+        if <self> is empty.
+        @type self: DriverGrid
+        @type location: Location
+        @rtype: Driver | None
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> grid = DriverGrid(cell_size=2)
+        >>> grid.add(Driver("Slow", Location(1, 1), 1))
+        >>> grid.add(Driver("Fast", Location(9, 9), 8))
+        >>> grid.add(Driver("Near", Location(2, 2), 1))
+        >>> print(grid.nearest(Location(2, 1)))
+        Slow
+        >>> print(grid.nearest(Location(8, 8)))
+        Fast
+        """
+        if not self._entries:
+            return None
+        row, col = location.location
+        center = (row // self._cell_size, col // self._cell_size)
+        # best is (travel time, rank, driver)
+        best = None
+        for speed in self._speeds:
+            cells = self._classes[speed]
+            if cells:
+                best = self._search_class(location, center, speed, cells,
+                                          best)
+        return None if best is None else best[2]
+
+    def _search_class(self, location, center, speed, cells, best):
+        """ Search one speed class outward from <center> and return the
+        better of <best> and the best driver found in the class.
+        @type self: DriverGrid
+        @type location: Location
+        @type center: tuple[int, int]
+        @type speed: int
+        @type cells: dict[tuple, dict[int, Driver]]
+        @type best: tuple | None
+        @rtype: tuple | None
+        """
+        min_row, max_row, min_col, max_col = self._bounds[speed]
+        last_ring = max(abs(center[0] - min_row), abs(center[0] - max_row),
+                        abs(center[1] - min_col), abs(center[1] - max_col))
+        ring = 0
+        while ring <= last_ring:
+            if ring > 0 and best is not None:
+                bound = (ring - 1) * self._cell_size + 1
+                if round(bound / speed) > best[0]:
+                    break
+            if 8 * ring > len(cells):
+                # The ring has more cells than the class has occupied, so
+                # it is cheaper to look at what is left directly
+                for cell, bucket in cells.items():
+                    if max(abs(cell[0] - center[0]),
+                           abs(cell[1] - center[1])) >= ring:
+                        best = self._best_in(bucket, location, best)
+                break
+            for cell in self._ring(center, ring, min_row, max_row, min_col,
+                                   max_col):
+                bucket = cells.get(cell)
+                if bucket:
+                    best = self._best_in(bucket, location, best)
+            ring += 1
+        return best
+
+    def _best_in(self, bucket, location, best):
+        """ Return the better of <best> and the best driver in <bucket>.
+        @type self: DriverGrid
+        @type bucket: dict[int, Driver]
+        @type location: Location
+        @type best: tuple | None
+        @rtype: tuple | None
+        """
+        if road_network() is not None:
+            return self._best_in_roads(bucket, location, best)
+        if np is not None and len(bucket) >= BATCH_THRESHOLD:
+            return self._best_in_batch(bucket, location, best)
+        for key, driver in bucket.items():
+            travel_time = driver.get_travel_time(location)
+            if best is None or travel_time < best[0] or (
+                    travel_time == best[0] and
+                    self._entries[key][0] < best[1]):
+                best = (travel_time, self._entries[key][0], driver)
+        return best
+
+    def _best_in_roads(self, bucket, location, best):
+        """ Return the better of <best> and the best driver in <bucket>,
+        measuring along the roads only for drivers whose Manhattan travel
+        time, a lower bound, could beat <best>.
+        @type self: DriverGrid
+        @type bucket: dict[int, Driver]
+        @type location: Location
+        @type best: tuple | None
+        @rtype: tuple | None
+        """
+        bounded = sorted(
+            ((round(manhattan_distance(driver.location, location) /
+                    driver.speed), self._entries[key][0], driver)
+             for key, driver in bucket.items()),
+            key=lambda candidate: candidate[:2])
+        for bound, rank, driver in bounded:
+            if best is not None and bound > best[0]:
+                break
+            travel_time = driver.get_travel_time(location)
+            if best is None or travel_time < best[0] or (
+                    travel_time == best[0] and rank < best[1]):
+                best = (travel_time, rank, driver)
+        return best
+
+    def _best_in_batch(self, bucket, location, best):
+        """ Return the better of <best> and the best driver in <bucket>,
+        computing every travel time in one vectorised pass.
+        Precondition: NumPy is installed.
+        @type self: DriverGrid
+        @type bucket: dict[int, Driver]
+        @type location: Location
+        @type best: tuple | None
+        @rtype: tuple | None
+        """
+        keys = list(bucket)
+        drivers = list(bucket.values())
+        # Every driver in a bucket has the same speed
+        distances = manhattan_distances(
+            location, [driver.location for driver in drivers])
+        travel_times = np.rint(distances / drivers[0].speed)
+        travel_time = int(travel_times.min())
+        if best is not None and travel_time > best[0]:
+            return best
+        for index in np.flatnonzero(travel_times == travel_time):
+            rank = self._entries[keys[index]][0]
+            if best is None or travel_time < best[0] or rank < best[1]:
+                best = (travel_time, rank, drivers[index])
+        return best
+
+    @staticmethod
+    def _ring(center, ring, min_row, max_row, min_col, max_col):
+        """ Yield the cells exactly <ring> cells away from <center> that lie
+        within the given cell bounds.
+        @type center: tuple[int, int]
+        @type ring: int
+        @type min_row: int
+        @type max_row: int
+        @type min_col: int
+        @type max_col: int
+        @rtype: generator
+        >>> sorted(DriverGrid._ring((0, 0), 1, -1, 0, 0, 5))
+        [(-1, 0), (-1, 1), (0, 1)]
+        """
+        row, col = center
+        low_col = max(col - ring, min_col)
+        high_col = min(col + ring, max_col)
+        for r in range(max(row - ring, min_row), min(row + ring, max_row) + 1):
+            if abs(r - row) == ring:
+                for c in range(low_col, high_col + 1):
+                    yield (r, c)
+            else:
+                if low_col == col - ring:
+                    yield (r, low_col)
+                if high_col == col + ring:
+                    yield (r, high_col)
+
+    def _cell_of(self, location):
+        """ Return the cell containing <location>.
+        @type self: DriverGrid
+        @type location: Location
+        @rtype: tuple[int, int]
+        """
+        return (location.location[0] // self._cell_size,
+                location.location[1] // self._cell_size)
+
+    def _insert(self, driver, speed, cell):
+        """ Put <driver> in the bucket for <speed> and <cell>.
+        @type self: DriverGrid
+        @type driver: Driver
+        @type speed: int
+        @type cell: tuple[int, int]
+        @rtype: None
+        """
+        cells = self._classes[speed]
+        if cell not in cells:
+            cells[cell] = {}
+        cells[cell][id(driver)] = driver
+        bounds = self._bounds.get(speed)
+        if bounds is None:
+            self._bounds[speed] = [cell[0], cell[0], cell[1], cell[1]]
+        else:
+            bounds[0] = min(bounds[0], cell[0])
+            bounds[1] = max(bounds[1], cell[0])
+            bounds[2] = min(bounds[2], cell[1])
+            bounds[3] = max(bounds[3], cell[1])
+
+    def _discard(self, driver, speed, cell):
+        """ Take <driver> out of the bucket for <speed> and <cell>.
+        @type self: DriverGrid
+        @type driver: Driver
+        @type speed: int
+        @type cell: tuple[int, int]
+        @rtype: None
+        """
+        cells = self._classes[speed]
+        del cells[cell][id(driver)]
+        if not cells[cell]:
+            del cells[cell]
@@ -0,0 +1,210 @@
+"""
+The sweep module runs "what if" parameter sweeps: the same trace simulated
+once for every combination of parameter values in a grid, with the runs
+spread over several processes.
+
+The trace is read once, by the parent process. Where processes can be
+forked, the workers inherit it, and a binary trace's memory-mapped columns
+are shared with them outright; elsewhere, each worker reads the trace once
+when it starts. Every run then simulates a fresh copy of the trace's
+riders and drivers, so runs do not affect each other.
+
+The results are gathered into a table: one row per run, holding its
+parameters and its report.
+=== Constants ===
+@type PARAMETERS: tuple[str]
+    The parameters that can be swept:
+    fleet_size: only the drivers making the first fleet_size driver
+        requests of the trace take part,
+    speed: every driver has this speed,
+    patience: every rider has this patience,
+    batch_window: the batch window of the simulation's dispatcher.
+"""
+import csv
+import multiprocessing
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+from eventlog import NullLog
+from monitor import RunningMonitor
+from simulation import Simulation
+from traces import Trace, open_trace, DRIVER_REQUEST
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PARAMETERS = ("fleet_size", "speed", "patience", "batch_window")
+
+# The trace the runs of a sweep are made from, in each worker process
+_shared_trace = None
+
+
+def sweep_points(grid):
+    """ Return every combination of the parameter values in <grid>, in
+    order, as a list of dictionaries.
+    @type grid: dict[str, list]
+    @rtype: list[dict[str, object]]
+    >>> sweep_points({"speed": [1, 2], "patience": [5]})
+    [{'speed': 1, 'patience': 5}, {'speed': 2, 'patience': 5}]
+    """
+    for name in grid:
+        if name not in PARAMETERS:
+            raise ValueError("Unknown sweep parameter: {}".format(name))
+    names = list(grid)
+    return [dict(zip(names, values))
+            for values in product(*(grid[name] for name in names))]
+
+
+def run_point(trace, point):
+    """ Simulate <trace> with the parameters in <point> and return the
+    report. <trace> itself is left as it was.
+    Precondition: no simulation has run on <trace>.
+    @type trace: Trace
+    @type point: dict[str, object]
+    @rtype: dict[str, object]
+    >>> from traces import parse_trace
+    >>> trace = parse_trace("events.txt")
+    >>> report = run_point(trace, {"fleet_size": 3, "speed": 2})
+    >>> report["rider_wait_time"], report["driver_total_distance"]
+    (1.0, 12.333333333333334)
+    >>> run_point(trace, {}) == run_point(trace, {})
+    True
+    """
+    trace = _prepare(trace, point)
+    # Stream the trace if it is in time order, instead of queuing it all
+    stream = all(trace.timestamps[i] <= trace.timestamps[i + 1]
+                 for i in range(len(trace) - 1))
+    simulation = Simulation(batch_window=point.get("batch_window"),
+                            event_log=NullLog(), monitor=RunningMonitor())
+    return simulation.run(trace, stream=stream)
+
+
+def sweep(filename, grid, max_workers=None):
+    """ Simulate the trace in <filename> once for every combination of the
+    parameter values in <grid>, in parallel, and return the table of
+    results: for each combination, in the order of sweep_points, its
+    parameters together with its report.
+    @type filename: str
+        A text or binary trace.
+    @type grid: dict[str, list]
+        The values to try for each parameter in PARAMETERS. Parameters that
+        are left out keep the values in the trace.
+    @type max_workers: int | None
+        The number of processes to run, or None for one per processor.
+    @rtype: list[dict[str, object]]
+    >>> table = sweep("events.txt", {"speed": [1, 2]}, max_workers=2)
+    >>> [(row["speed"], row["driver_total_distance"]) for row in table]
+    [(1, 4.5), (2, 5.0)]
+    """
+    global _shared_trace
+    points = sweep_points(grid)
+    if "fork" in multiprocessing.get_all_start_methods():
+        # Workers are forked from here, so they inherit the trace
+        _shared_trace = open_trace(filename)
+        context = multiprocessing.get_context("fork")
+        initargs = (None,)
+    else:
+        context = None
+        initargs = (filename,)
+    try:
+        with ProcessPoolExecutor(max_workers, mp_context=context,
+                                 initializer=_start_worker,
+                                 initargs=initargs) as executor:
+            reports = list(executor.map(_run_shared, points))
+    finally:
+        _shared_trace = None
+    return [dict(point, **report) for point, report in zip(points, reports)]
+
+
+def write_table(table, filename):
+    """ Write the rows of <table> to the CSV file <filename>.
+    @type table: list[dict[str, object]]
+    @type filename: str
+    @rtype: None
+    """
+    columns = []
+    for row in table:
+        columns.extend(name for name in row if name not in columns)
+    with open(filename, "w", newline="") as file:
+        writer = csv.DictWriter(file, columns)
+        writer.writeheader()
+        writer.writerows(table)
+
+
+def _start_worker(filename):
+    """ Read the trace in <filename> for the runs of this worker, unless it
+    was inherited.
+    @type filename: str | None
+    @rtype: None
+    """
+    global _shared_trace
+    if filename is not None:
+        _shared_trace = open_trace(filename)
+
+
+def _run_shared(point):
+    """ Simulate the shared trace with the parameters in <point> and return
+    the report.
+    @type point: dict[str, object]
+    @rtype: dict[str, object]
+    """
+    return run_point(_shared_trace, point)
+
+
+def _prepare(trace, point):
+    """ Return a fresh copy of <trace> with the parameters in <point>
+    applied to its riders and drivers.
+    @type trace: Trace
+    @type point: dict[str, object]
+    @rtype: Trace
+    """
+    rider_ids, _, _, driver_ids, _, _ = trace.store.columns()
+    patience = speeds = None
+    if "patience" in point:
+        patience = array("i", [point["patience"]]) * len(rider_ids)
+    if "speed" in point:
+        speeds = array("i", [point["speed"]]) * len(driver_ids)
+    copy = trace.fresh(patience, speeds)
+    if "fleet_size" in point:
+        _drop_drivers(copy, point["fleet_size"])
+    return copy
+
+
+def _drop_drivers(trace, fleet_size):
+    """ Remove from <trace> the requests of every driver but the first
+    <fleet_size>.
+    @type trace: Trace
+    @type fleet_size: int
+    @rtype: None
+    """
+    if np is not None:
+        kinds = np.frombuffer(trace.kinds, dtype=np.int8)
+        actors = np.frombuffer(trace.actors, dtype=np.int32)
+        keep = (kinds != DRIVER_REQUEST) | (actors < fleet_size)
+        trace.timestamps = array(
+            "q", np.frombuffer(trace.timestamps, dtype=np.int64)[keep]
+            .tobytes())
+        trace.kinds = array("b", kinds[keep].tobytes())
+        trace.actors = array("i", actors[keep].tobytes())
+        return
+    keep = [i for i in range(len(trace))
+            if trace.kinds[i] != DRIVER_REQUEST
+            or trace.actors[i] < fleet_size]
+    trace.timestamps = array("q", [trace.timestamps[i] for i in keep])
+    trace.kinds = array("b", [trace.kinds[i] for i in keep])
+    trace.actors = array("i", [trace.actors[i] for i in keep])
+
+
+if __name__ == "__main__":
+    # python sweep.py TRACE OUTPUT.csv NAME=VALUE,VALUE... ...
+    values = {}
+    for argument in sys.argv[3:]:
+        name, _, listed = argument.partition("=")
+        values[name] = [int(value) for value in listed.split(",")]
+    results = sweep(sys.argv[1], values)
+    write_table(results, sys.argv[2])
+    print("{}: {} runs".format(sys.argv[2], len(results)))
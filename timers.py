@@ -0,0 +1,421 @@
+"""
+The timers module keeps riders' Cancellation deadlines out of the event
+queue.
+
+Every rider request schedules a Cancellation for when the rider's patience
+runs out, but most riders are picked up well before then. A TimerQueue
+keeps those Cancellations in a TimerWheel, where they can be descheduled
+in O(1), and deschedules a rider's Cancellations as soon as the rider is
+picked up, which is when the Dropoff of their ride is scheduled. The
+Cancellations of riders who were picked up are then never done, so they
+are neither reported to the monitor nor logged; the monitor's report is
+the same, since only the first activity after a rider's request counts.
+
+Everything else is done in exactly the same order as with a
+PriorityQueue: each timer takes its place in the queue's FIFO order when
+it is scheduled, and timers and queued events are interleaved by
+timestamp and then by that order.
+"""
+from container import PriorityQueue
+from event import Cancellation, Dropoff
+
+
+class TimerWheel:
+    """ Timers with integer deadlines, in a hierarchical timing wheel.
+
+    The wheel has <levels> levels of <slots> slots. A slot of level k
+    spans slots ** k time units: level 0 holds the timers due in the
+    current block of <slots> time units, one slot per unit, and level k
+    holds the timers due in the current block of slots ** (k + 1) units
+    that are not in level k - 1. Timers due even later wait in an
+    overflow table. As the wheel's time moves into a new block, the timers
+    of the matching slot of the level above are moved down.
+
+    Adding and cancelling a timer are O(1). Finding the next timer looks
+    at the slots of the current blocks, and at the timers of the first
+    occupied slot when that slot is above level 0.
+
+    Timers are ordered by deadline and then by a sequence number given
+    when they are added. Each timer has a key, and every timer with a
+    given key can be cancelled at once.
+    === Private Attributes ===
+    @type _slots: int
+        The number of slots per level.
+    @type _wheels: list[list[dict[int, list]]]
+        The slots of each level. A slot maps the sequence number of each
+        of its timers to the timer, [deadline, sequence number, item, key].
+    @type _overflow: dict[int, list]
+        The timers due after the last block of the top level.
+    @type _now: int
+        The wheel's time. No timer is due before it.
+    @type _where: dict[int, dict[int, list]]
+        Maps the sequence number of each timer to the slot it is in.
+    @type _keys: dict[int, list[int]]
+        Maps id(key) to the sequence numbers of the timers with that key.
+    @type _next: list | None
+        The next timer, if known.
+    """
+
+    def __init__(self, slots=64, levels=4):
+        """ Initialize an empty TimerWheel.
+        @type self: TimerWheel
+        @type slots: int
+            Precondition: slots > 1
+        @type levels: int
+            Precondition: levels > 0
+        @rtype: None
+        """
+        self._slots = slots
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._overflow = {}
+        self._now = 0
+        self._where = {}
+        self._keys = {}
+        self._next = None
+
+    def __len__(self):
+        """ Return the number of timers in <self>.
+        @type self: TimerWheel
+        @rtype: int
+        """
+        return len(self._where)
+
+    def add(self, deadline, seq, item, key):
+        """ Add a timer for <item> due at <deadline>.
+        Precondition: unless <self> is empty, <deadline> is not before the
+        wheel's time, and <seq> is not the sequence number of another timer.
+        @type self: TimerWheel
+        @type deadline: int
+        @type seq: int
+            Orders the timers due at the same time, lowest first.
+        @type item: object
+        @type key: object
+            What the timer can be cancelled by.
+        @rtype: None
+        >>> wheel = TimerWheel(slots=4, levels=2)
+        >>> wheel.add(100, 0, "a", "Jorge")
+        >>> wheel.pop()
+        'a'
+        >>> wheel.add(5, 1, "b", "Tom")
+        >>> wheel.first()
+        (5, 1)
+        """
+        if deadline < self._now and not self._where:
+            # An empty wheel can start again at any time
+            self._now = deadline
+        timer = [deadline, seq, item, key]
+        self._place(timer)
+        self._keys.setdefault(id(key), []).append(seq)
+        following = self._next
+        if following is not None and \
+                (deadline, seq) < (following[0], following[1]):
+            self._next = timer
+
+    def cancel(self, key):
+        """ Remove every timer with <key>.
+        @type self: TimerWheel
+        @type key: object
+        @rtype: None
+        >>> wheel = TimerWheel(slots=4, levels=2)
+        >>> wheel.add(3, 0, "a", "Jorge")
+        >>> wheel.add(9, 1, "b", "Tom")
+        >>> wheel.add(40, 2, "c", "Jorge")
+        >>> wheel.cancel("Jorge")
+        >>> len(wheel), wheel.pop()
+        (1, 'b')
+        """
+        for seq in self._keys.pop(id(key), ()):
+            del self._where.pop(seq)[seq]
+            if self._next is not None and self._next[1] == seq:
+                self._next = None
+
+    def first(self):
+        """ Return the deadline and sequence number of the next timer, or
+        None if <self> is empty.
+        @type self: TimerWheel
+        @rtype: (int, int) | None
+        """
+        if self._next is None:
+            if not self._where:
+                return None
+            self._next = self._find_next()
+        return self._next[0], self._next[1]
+
+    def first_item(self):
+        """ Return the item of the next timer.
+        Precondition: <self> is not empty.
+        @type self: TimerWheel
+        @rtype: object
+        """
+        self.first()
+        return self._next[2]
+
+    def pop(self):
+        """ Remove the next timer and return its item. The wheel's time
+        moves on to the timer's deadline.
+        Precondition: <self> is not empty.
+        @type self: TimerWheel
+        @rtype: object
+        >>> wheel = TimerWheel(slots=4, levels=2)
+        >>> for seq, deadline in enumerate([70, 5, 17, 5, 2]):
+        ...     wheel.add(deadline, seq, (deadline, seq), seq % 2)
+        >>> [wheel.pop() for _ in range(3)]
+        [(2, 4), (5, 1), (5, 3)]
+        >>> wheel.add(6, 5, (6, 5), 0)
+        >>> [wheel.pop() for _ in range(len(wheel))]
+        [(6, 5), (17, 2), (70, 0)]
+        """
+        self.first()
+        deadline, seq, item, key = self._next
+        self._next = None
+        self.advance(deadline)
+        del self._where.pop(seq)[seq]
+        seqs = self._keys[id(key)]
+        seqs.remove(seq)
+        if not seqs:
+            del self._keys[id(key)]
+        return item
+
+    def __getstate__(self):
+        """ Return the state of <self> to pickle, without the tables keyed
+        by id, which are rebuilt from the timers.
+        @type self: TimerWheel
+        @rtype: dict[str, object]
+        >>> import pickle
+        >>> wheel = TimerWheel()
+        >>> wheel.add(3, 0, "a", ["Jorge"])
+        >>> copy = pickle.loads(pickle.dumps(wheel))
+        >>> copy.first(), copy.pop()
+        ((3, 0), 'a')
+        """
+        state = self.__dict__.copy()
+        for name in ("_where", "_keys", "_next"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        """ Restore <self> from the pickled <state>.
+        @type self: TimerWheel
+        @type state: dict[str, object]
+        @rtype: None
+        """
+        self.__dict__.update(state)
+        self._where = {}
+        self._keys = {}
+        self._next = None
+        timers = []
+        for slot in self._all_slots():
+            for seq, timer in slot.items():
+                self._where[seq] = slot
+                timers.append(timer)
+        # Keys list their timers in the order they were added
+        timers.sort(key=lambda timer: timer[1])
+        for timer in timers:
+            self._keys.setdefault(id(timer[3]), []).append(timer[1])
+
+    def _all_slots(self):
+        """ Return every slot of <self>, and the overflow table.
+        @type self: TimerWheel
+        @rtype: list[dict[int, list]]
+        """
+        return [slot for wheel in self._wheels for slot in wheel] + \
+            [self._overflow]
+
+    def _place(self, timer):
+        """ Put <timer> in the slot for its deadline.
+        @type self: TimerWheel
+        @type timer: list
+        @rtype: None
+        """
+        deadline, seq = timer[0], timer[1]
+        slots, now = self._slots, self._now
+        span = 1
+        slot = self._overflow
+        for wheel in self._wheels:
+            # The timer is in this level if it is due in the same block of
+            # the level above as the wheel's time
+            if deadline // (span * slots) == now // (span * slots):
+                slot = wheel[(deadline // span) % slots]
+                break
+            span *= slots
+        slot[seq] = timer
+        self._where[seq] = slot
+
+    def _find_next(self):
+        """ Return the next timer.
+        Precondition: <self> is not empty.
+        @type self: TimerWheel
+        @rtype: list
+        """
+        slots, now = self._slots, self._now
+        span = 1
+        for level, wheel in enumerate(self._wheels):
+            # Level 0 starts at the current time; above it, the current
+            # block's own slot is always empty
+            start = (now // span) % slots + (level > 0)
+            for index in range(start, slots):
+                slot = wheel[index]
+                if slot:
+                    if level == 0:
+                        # The timers of a level 0 slot are all due at once
+                        return slot[min(slot)]
+                    return min(slot.values(),
+                               key=lambda timer: (timer[0], timer[1]))
+            span *= slots
+        return min(self._overflow.values(),
+                   key=lambda timer: (timer[0], timer[1]))
+
+    def advance(self, time):
+        """ Move the wheel's time on to <time>, moving down the timers of
+        the blocks it enters. Keeping the wheel's time close to the times
+        of the timers keeps them in the lower levels, where the next one is
+        found quickly.
+        Precondition: no timer is due before <time>.
+        @type self: TimerWheel
+        @type time: int
+        @rtype: None
+        """
+        old = self._now
+        if time <= old:
+            return
+        self._now = time
+        slots = self._slots
+        top = slots ** len(self._wheels)
+        if time // top != old // top and self._overflow:
+            timers = list(self._overflow.values())
+            self._overflow.clear()
+            for timer in timers:
+                self._place(timer)
+        for level in range(len(self._wheels) - 1, 0, -1):
+            span = slots ** level
+            if time // span != old // span:
+                slot = self._wheels[level][(time // span) % slots]
+                if slot:
+                    timers = list(slot.values())
+                    slot.clear()
+                    for timer in timers:
+                        self._place(timer)
+
+
+class TimerQueue(PriorityQueue):
+    """ A PriorityQueue of events that keeps Cancellations in a TimerWheel,
+    and drops a rider's Cancellations when the Dropoff of their ride is
+    added.
+    Cancellations in the wheel are not seen by contains, remove_particular
+    or items.
+    === Private Attributes ===
+    @type _timers: TimerWheel
+        The Cancellations not yet done.
+    @type _due: (int, int) | None
+        The deadline and sequence number of the next Cancellation in
+        _timers, or None if there is none.
+    """
+
+    def __init__(self, compact_ratio=0.5, slots=64, levels=4):
+        """ Initialize an empty TimerQueue.
+        @type self: TimerQueue
+        @type compact_ratio: float
+        @type slots: int
+        @type levels: int
+        @rtype: None
+        """
+        super().__init__(compact_ratio)
+        self._timers = TimerWheel(slots, levels)
+        self._due = None
+
+    def __len__(self):
+        """ Return the number of events in <self>.
+        @type self: TimerQueue
+        @rtype: int
+        """
+        return super().__len__() + len(self._timers)
+
+    def is_empty(self):
+        """ Return True iff <self> is empty.
+        @type self: TimerQueue
+        @rtype: bool
+        """
+        return not self._heap and self._due is None
+
+    def add(self, item):
+        """ Add the event <item> to <self>.
+        @type self: TimerQueue
+        @type item: Event
+        @rtype: None
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> from rider import Rider
+        >>> jorge = Rider("Jorge", Location(1, 1), Location(2, 2), 5)
+        >>> tom = Driver("Tom", Location(1, 1), 1)
+        >>> tq = TimerQueue()
+        >>> tq.add(Cancellation(5, jorge))
+        >>> tq.add(Dropoff(3, jorge, tom))
+        >>> [str(tq.remove()) for _ in range(len(tq))]
+        ['3 -- Tom: Drop off Jorge']
+        """
+        kind = type(item)
+        if kind is Cancellation:
+            # The timer takes the place in the FIFO order that the event
+            # would have taken
+            seq = self._counter
+            self._counter += 1
+            self._timers.add(item.timestamp, seq, item, item.rider)
+            due = self._due
+            if due is None or (item.timestamp, seq) < due:
+                self._due = (item.timestamp, seq)
+            return
+        if kind is Dropoff and self._due is not None:
+            # The rider has been picked up, so they will not cancel
+            self._timers.cancel(item.rider)
+            self._due = self._timers.first()
+        PriorityQueue.add(self, item)
+
+    def first_element(self):
+        """ Return the next event of <self>, without removing it.
+        Precondition: <self> is not empty.
+        @type self: TimerQueue
+        @rtype: Event
+        """
+        if self._due is not None and self._timer_first():
+            return self._timers.first_item()
+        return self._heap[0].item
+
+    def remove(self):
+        """ Remove and return the next event of <self>.
+        Precondition: <self> is not empty.
+        @type self: TimerQueue
+        @rtype: Event
+        >>> from event import Event
+        >>> from rider import Rider
+        >>> jorge = Rider("Jorge", (1, 1), (2, 2), 5)
+        >>> tq = TimerQueue()
+        >>> tq.add(Event(5))
+        >>> tq.add(Cancellation(5, jorge))
+        >>> tq.add(Event(5))
+        >>> tq.add(Event(2))
+        >>> [type(tq.remove()).__name__ for _ in range(len(tq))]
+        ['Event', 'Event', 'Cancellation', 'Event']
+        """
+        if self._due is not None:
+            if self._timer_first():
+                item = self._timers.pop()
+                self._due = self._timers.first()
+                return item
+            # The wheel keeps up with the time of the events done
+            self._timers.advance(self._heap[0].item.timestamp)
+        return PriorityQueue.remove(self)
+
+    def _timer_first(self):
+        """ Return True iff the next event of <self> is in the wheel.
+        Precondition: the wheel is not empty.
+        @type self: TimerQueue
+        @rtype: bool
+        """
+        heap = self._heap
+        if not heap:
+            return True
+        deadline, seq = self._due
+        top = heap[0]
+        timestamp = top.item.timestamp
+        return deadline < timestamp or \
+            (deadline == timestamp and seq < top.seq)
@@ -0,0 +1,675 @@
+"""
+The traces module reads event traces in bulk into a Trace: a columnar
+record of every request in the file, with the riders and drivers kept in
+an ActorStore. Events are only made when the trace is iterated, so a Trace
+can be streamed into Simulation.run.
+
+parse_trace reads the text format understood by create_event_list in
+large chunks and converts the numeric fields of a whole chunk at once,
+with NumPy when it is installed.
+
+A Trace can also be saved in a binary columnar format with save_trace,
+converted from text with convert_trace or written a request at a time
+with a TraceWriter, and read back with load_trace, which memory-maps the
+file and uses its columns in place. The format is little-endian, with
+columns byte-swapped on big-endian machines (see columns). It has a
+header of the magic bytes b"RSTRACE1" and the number of requests, riders
+and drivers as 8-byte integers, followed by these columns, each padded to
+a multiple of 8 bytes:
+    request timestamps (int64), request actor numbers (int32),
+    request kinds (int8),
+    rider origin and destination coordinates (4 x int32 per rider),
+    rider patience (int32),
+    driver coordinates (2 x int32 per driver), driver speeds (int32),
+    rider id offsets and driver id offsets (int64, one more than the
+    number of actors), and the UTF-8 rider ids and driver ids.
+Actor i's id is the bytes from offset i to offset i + 1 of its id column.
+=== Constants ===
+@type RIDER_REQUEST: int
+    The kind code of a RiderRequest in a Trace.
+@type DRIVER_REQUEST: int
+    The kind code of a DriverRequest in a Trace.
+"""
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+from actors import ActorStore, StoredRider, StoredDriver, extend_column
+from columns import column_bytes, view_column
+from event import RiderRequest, DriverRequest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RIDER_REQUEST = 0
+DRIVER_REQUEST = 1
+
+# The number of bytes parse_trace reads at a time
+_CHUNK_SIZE = 1 << 24
+
+# The header of a binary trace: magic bytes, then the number of requests,
+# riders and drivers
+_MAGIC = b"RSTRACE1"
+_HEADER = struct.Struct("<8sqqq")
+
+
+class Trace:
+    """ The requests of a trace, in file order, in columnar form.
+    Entry i of the trace is a request of kind kinds[i] at timestamps[i] by
+    the rider or driver numbered actors[i] in store.
+    === Attributes ===
+    @type store: ActorStore
+        The riders and drivers making the requests.
+    @type timestamps: array
+        The time of each request.
+    @type kinds: array
+        The kind of each request, RIDER_REQUEST or DRIVER_REQUEST.
+    @type actors: array
+        The number of the rider or driver making each request.
+    @type lines: int
+        The number of lines that were read to build the trace.
+    @type parse_seconds: float
+        The time it took to build the trace, in seconds.
+    """
+
+    def __init__(self, store):
+        """ Initialize an empty Trace whose actors are kept in <store>.
+        @type self: Trace
+        @type store: ActorStore
+        @rtype: None
+        """
+        self.store = store
+        self.timestamps = array("q")
+        self.kinds = array("b")
+        self.actors = array("i")
+        self.lines = 0
+        self.parse_seconds = 0.0
+
+    def __len__(self):
+        """ Return the number of requests in <self>.
+        @type self: Trace
+        @rtype: int
+        >>> len(parse_trace("events.txt"))
+        12
+        """
+        return len(self.timestamps)
+
+    def __iter__(self):
+        """ Yield the events of <self> in order, making each one only when
+        it is asked for.
+        @type self: Trace
+        @rtype: generator
+        >>> [str(event) for event in parse_trace("events_small.txt")]
+        ['1 -- Dan: Request a driver', '10 -- Arnold: Request a rider']
+        """
+        store = self.store
+        for timestamp, kind, actor in zip(self.timestamps, self.kinds,
+                                          self.actors):
+            if kind == RIDER_REQUEST:
+                yield RiderRequest(timestamp, StoredRider(store, actor))
+            else:
+                yield DriverRequest(timestamp, StoredDriver(store, actor))
+
+    def slice(self, start, stop):
+        """ Return the Trace of requests <start> up to <stop> of <self>,
+        sharing its store. The columns of a trace from load_trace are
+        sliced without copying.
+        @type self: Trace
+        @type start: int
+        @type stop: int
+        @rtype: Trace
+        >>> [str(event) for event in parse_trace("events.txt").slice(6, 8)]
+        ['0 -- Almond: Request a driver', '5 -- Bisque: Request a driver']
+        """
+        part = Trace(self.store)
+        part.timestamps = self.timestamps[start:stop]
+        part.kinds = self.kinds[start:stop]
+        part.actors = self.actors[start:stop]
+        return part
+
+    def fresh(self, patience=None, speeds=None):
+        """ Return a Trace of the same requests, sharing the columns of
+        <self>, whose riders and drivers are in a store of their own, in
+        the state the trace started them in.
+        This lets one trace be simulated many times.
+        Precondition: no simulation has run on <self>.
+        @type self: Trace
+        @type patience: array | None
+            The patience of each rider, if it is to differ from the trace.
+        @type speeds: array | None
+            The speed of each driver, if it is to differ from the trace.
+        @rtype: Trace
+        >>> trace = parse_trace("events_small.txt")
+        >>> copy = trace.fresh()
+        >>> copy.timestamps is trace.timestamps
+        True
+        >>> copy.store is trace.store
+        False
+        """
+        columns = list(self.store.columns())
+        if patience is not None:
+            columns[2] = patience
+        if speeds is not None:
+            columns[5] = speeds
+        copy = Trace(ActorStore.from_columns(*columns))
+        copy.timestamps, copy.kinds, copy.actors = \
+            self.timestamps, self.kinds, self.actors
+        return copy
+
+    def throughput(self):
+        """ Return the number of lines read per second while building
+        <self>.
+        @type self: Trace
+        @rtype: float
+        """
+        if self.parse_seconds == 0:
+            return 0.0
+        return self.lines / self.parse_seconds
+
+
+def parse_trace(filename, store=None, chunk_size=_CHUNK_SIZE):
+    """ Return the Trace of the events in <filename>.
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout.
+    @type filename: str
+    @type store: ActorStore | None
+        The store to add the riders and drivers to. A new one is made if
+        none is given.
+    @type chunk_size: int
+        The number of bytes to read at a time.
+    @rtype: Trace
+    """
+    start = time.perf_counter()
+    trace = Trace(ActorStore() if store is None else store)
+    leftover = b""
+    with open(filename, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            # Only parse whole lines; the rest waits for the next chunk
+            end = chunk.rfind(b"\n") + 1
+            if end == 0:
+                leftover += chunk
+                continue
+            _parse_chunk(leftover + chunk[:end], trace)
+            leftover = chunk[end:]
+    if leftover:
+        _parse_chunk(leftover, trace)
+    trace.parse_seconds = time.perf_counter() - start
+    return trace
+
+
+def open_trace(filename):
+    """ Return the Trace in <filename>, which is either a binary trace or
+    a text trace.
+    @type filename: str
+    @rtype: Trace
+    >>> len(open_trace("events.txt"))
+    12
+    """
+    with open(filename, "rb") as file:
+        binary = file.read(len(_MAGIC)) == _MAGIC
+    return load_trace(filename) if binary else parse_trace(filename)
+
+
+def _parse_chunk(chunk, trace):
+    """ Add the requests in the whole lines of <chunk> to <trace>.
+    @type chunk: bytes
+    @type trace: Trace
+    @rtype: None
+    """
+    lines = chunk.decode().splitlines()
+    trace.lines += len(lines)
+    kinds = []
+    timestamps = []
+    rider_ids, rider_fields = [], []
+    driver_ids, driver_fields = [], []
+    for line in lines:
+        tokens = line.split()
+        if not tokens or tokens[0].startswith("#"):
+            # Skip lines that are blank or start with #.
+            continue
+        timestamps.append(tokens[0])
+        # Keep the numeric fields as text; they are converted together
+        if tokens[1] == "RiderRequest":
+            kinds.append(RIDER_REQUEST)
+            rider_ids.append(tokens[2])
+            rider_fields.append("{},{},{}".format(tokens[3], tokens[4],
+                                                  tokens[5]))
+        elif tokens[1] == "DriverRequest":
+            kinds.append(DRIVER_REQUEST)
+            driver_ids.append(tokens[2])
+            driver_fields.append("{},{}".format(tokens[3], tokens[4]))
+        else:
+            raise ValueError("Unknown event type: {}".format(tokens[1]))
+    if not kinds:
+        return
+
+    riders = _to_ints(rider_fields, 5)
+    drivers = _to_ints(driver_fields, 3)
+    first_rider = trace.store.add_riders(
+        rider_ids, _columns(riders, 5, 0, 4), _columns(riders, 5, 4, 5))
+    first_driver = trace.store.add_drivers(
+        driver_ids, _columns(drivers, 3, 0, 2), _columns(drivers, 3, 2, 3))
+
+    extend_column(trace.timestamps, _to_ints(timestamps, 1))
+    trace.kinds.extend(kinds)
+    # Riders and drivers are numbered in the order they appear
+    if np is None:
+        next_rider, next_driver = first_rider, first_driver
+        for kind in kinds:
+            if kind == RIDER_REQUEST:
+                trace.actors.append(next_rider)
+                next_rider += 1
+            else:
+                trace.actors.append(next_driver)
+                next_driver += 1
+    else:
+        is_rider = np.array(kinds) == RIDER_REQUEST
+        extend_column(trace.actors, np.where(
+            is_rider, first_rider + np.cumsum(is_rider) - 1,
+            first_driver + np.cumsum(~is_rider) - 1))
+
+
+def _to_ints(fields, width):
+    """ Return the integers in the comma-separated <fields>, each of which
+    holds <width> integers, as one flat sequence.
+    @type fields: list[str]
+    @type width: int
+    @rtype: list[int] | numpy.ndarray
+    >>> [int(value) for value in _to_ints(["1,2", "3,4"], 2)]
+    [1, 2, 3, 4]
+    """
+    if not fields:
+        return []
+    text = ",".join(fields)
+    if np is None:
+        values = [int(value) for value in text.split(",")]
+    else:
+        values = np.fromstring(text, dtype=np.int64, sep=",")
+    if len(values) != width * len(fields):
+        raise ValueError("Malformed numeric field in trace")
+    return values
+
+
+def _columns(values, width, start, stop):
+    """ Return columns <start> up to <stop> of the rows of <width> values
+    in the flat sequence <values>, flattened row by row.
+    @type values: list[int] | numpy.ndarray
+    @type width: int
+    @type start: int
+    @type stop: int
+    @rtype: list[int] | numpy.ndarray
+    >>> _columns([1, 2, 3, 4, 5, 6], 3, 0, 2)
+    [1, 2, 4, 5]
+    """
+    if np is not None and isinstance(values, np.ndarray):
+        return values.reshape(-1, width)[:, start:stop].ravel()
+    return [values[row + column] for row in range(0, len(values), width)
+            for column in range(start, stop)]
+
+
+def save_trace(trace, filename):
+    """ Write <trace> to <filename> in the binary trace format.
+    Precondition: no simulation has run on <trace>, so its drivers are
+    still where the trace put them.
+    @type trace: Trace
+    @type filename: str
+    @rtype: None
+    """
+    rider_ids, rider_coordinates, patience, driver_ids, \
+        driver_coordinates, speeds = trace.store.columns()
+    rider_offsets, rider_blob = _encode_ids(rider_ids)
+    driver_offsets, driver_blob = _encode_ids(driver_ids)
+    with open(filename, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, len(trace), len(rider_ids),
+                                len(driver_ids)))
+        for column in (trace.timestamps, trace.actors, trace.kinds,
+                       rider_coordinates, patience, driver_coordinates,
+                       speeds, rider_offsets, driver_offsets):
+            _write_padded(file, column_bytes(column))
+        _write_padded(file, rider_blob)
+        _write_padded(file, driver_blob)
+
+
+def convert_trace(text_filename, binary_filename):
+    """ Convert the text trace <text_filename> to the binary trace
+    <binary_filename>, and return the number of requests in it.
+    @type text_filename: str
+    @type binary_filename: str
+    @rtype: int
+    """
+    trace = parse_trace(text_filename)
+    save_trace(trace, binary_filename)
+    return len(trace)
+
+
+class TraceWriter:
+    """ Writes a binary trace one request at a time, so traces far larger
+    than memory can be written. Each column is buffered, then spooled to a
+    temporary file next to the trace, and the columns are joined into the
+    trace when the writer is closed. The result is the same as save_trace.
+    === Private Attributes ===
+    @type _filename: str
+        The trace written.
+    @type _columns: list[array | bytearray]
+        The buffered values of each column, in file order.
+    @type _spools: list[file]
+        The temporary file each column is spooled to.
+    @type _sizes: list[int]
+        The number of bytes spooled for each column.
+    @type _counts: list[int]
+        The number of requests, riders and drivers written.
+    @type _offsets: list[int]
+        The number of bytes of rider ids and of driver ids written.
+    @type _batch: int
+        The number of requests buffered before they are spooled.
+    """
+
+    def __init__(self, filename, batch=1 << 16):
+        """ Initialize a TraceWriter writing to <filename>.
+        @type self: TraceWriter
+        @type filename: str
+        @type batch: int
+        @rtype: None
+        """
+        self._filename = filename
+        self._columns = [array(typecode) for typecode in "qibiiiiqq"]
+        self._columns += [bytearray(), bytearray()]
+        directory = os.path.dirname(os.path.abspath(filename))
+        self._spools = [tempfile.TemporaryFile(dir=directory)
+                        for _ in self._columns]
+        self._sizes = [0] * len(self._columns)
+        self._counts = [0, 0, 0]
+        self._batch = batch
+        # Id offsets start at 0
+        self._columns[7].append(0)
+        self._columns[8].append(0)
+        self._offsets = [0, 0]
+
+    def add_rider(self, timestamp, identifier, origin, destination,
+                  patience):
+        """ Write a RiderRequest.
+        @type self: TraceWriter
+        @type timestamp: int
+        @type identifier: str
+        @type origin: tuple[int, int]
+        @type destination: tuple[int, int]
+        @type patience: int
+        @rtype: None
+        """
+        columns = self._columns
+        columns[0].append(timestamp)
+        columns[1].append(self._counts[1])
+        columns[2].append(RIDER_REQUEST)
+        columns[3].extend(origin)
+        columns[3].extend(destination)
+        columns[4].append(patience)
+        self._add_id(0, identifier)
+        self._counts[1] += 1
+        self._added()
+
+    def add_driver(self, timestamp, identifier, location, speed):
+        """ Write a DriverRequest.
+        @type self: TraceWriter
+        @type timestamp: int
+        @type identifier: str
+        @type location: tuple[int, int]
+        @type speed: int
+        @rtype: None
+        """
+        columns = self._columns
+        columns[0].append(timestamp)
+        columns[1].append(self._counts[2])
+        columns[2].append(DRIVER_REQUEST)
+        columns[5].extend(location)
+        columns[6].append(speed)
+        self._add_id(1, identifier)
+        self._counts[2] += 1
+        self._added()
+
+    def close(self):
+        """ Join the columns into the trace.
+        @type self: TraceWriter
+        @rtype: None
+        >>> import os, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> convert_trace("events.txt", os.path.join(directory, "a.bin"))
+        12
+        >>> writer = TraceWriter(os.path.join(directory, "b.bin"), batch=5)
+        >>> for event in parse_trace("events.txt"):
+        ...     if hasattr(event, "rider"):
+        ...         rider = event.rider
+        ...         writer.add_rider(event.timestamp, rider.id,
+        ...                          rider.origin.location,
+        ...                          rider.destination.location,
+        ...                          rider.patience)
+        ...     else:
+        ...         driver = event.driver
+        ...         writer.add_driver(event.timestamp, driver.id,
+        ...                           driver.location.location, driver.speed)
+        >>> writer.close()
+        >>> def read(name):
+        ...     with open(os.path.join(directory, name), "rb") as file:
+        ...         return file.read()
+        >>> read("a.bin") == read("b.bin")
+        True
+        """
+        self._spool()
+        with open(self._filename, "wb") as file:
+            file.write(_HEADER.pack(_MAGIC, *self._counts))
+            for spool, size in zip(self._spools, self._sizes):
+                spool.seek(0)
+                shutil.copyfileobj(spool, file)
+                file.write(bytes(_padded(size) - size))
+                spool.close()
+
+    def _add_id(self, which, identifier):
+        """ Write the id of a rider, if <which> is 0, or of a driver.
+        @type self: TraceWriter
+        @type which: int
+        @type identifier: str
+        @rtype: None
+        """
+        encoded = identifier.encode("utf-8")
+        self._columns[9 + which] += encoded
+        self._offsets[which] += len(encoded)
+        self._columns[7 + which].append(self._offsets[which])
+
+    def _added(self):
+        """ Record that a request was written, spooling the columns if
+        enough are buffered.
+        @type self: TraceWriter
+        @rtype: None
+        """
+        self._counts[0] += 1
+        if len(self._columns[0]) >= self._batch:
+            self._spool()
+
+    def _spool(self):
+        """ Move the buffered values of every column to its spool.
+        @type self: TraceWriter
+        @rtype: None
+        """
+        for i, column in enumerate(self._columns):
+            data = column_bytes(column)
+            self._spools[i].write(data)
+            self._sizes[i] += len(data)
+            del column[:]
+
+
+def load_trace(filename):
+    """ Return the Trace in the binary trace <filename>.
+    The file is memory-mapped, and the columns that do not change during
+    a simulation are read from it in place, so loading does not depend on
+    the size of the trace.
+    @type filename: str
+    @rtype: Trace
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "events.bin")
+    >>> convert_trace("events.txt", path)
+    12
+    >>> trace = load_trace(path)
+    >>> [str(event) for event in trace.slice(10, 12)]
+    ['20 -- Eggshell: Request a driver', '25 -- Fallow: Request a driver']
+    >>> print(trace.store)
+    ActorStore (6 drivers, 6 riders)
+    """
+    start = time.perf_counter()
+    with open(filename, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    buffer = memoryview(mapped)
+    magic, requests, riders, drivers = _HEADER.unpack_from(buffer)
+    if magic != _MAGIC:
+        raise ValueError("{} is not a binary trace".format(filename))
+    reader = _ColumnReader(buffer, _HEADER.size)
+    timestamps = reader.take("q", requests)
+    actors = reader.take("i", requests)
+    kinds = reader.take("b", requests)
+    rider_coordinates = reader.take("i", 4 * riders)
+    patience = reader.take("i", riders)
+    driver_coordinates = reader.take("i", 2 * drivers)
+    speeds = reader.take("i", drivers)
+    rider_offsets = reader.take("q", riders + 1)
+    driver_offsets = reader.take("q", drivers + 1)
+    rider_ids = _IdColumn(reader.take("B", rider_offsets[-1]), rider_offsets)
+    driver_ids = _IdColumn(reader.take("B", driver_offsets[-1]),
+                           driver_offsets)
+
+    trace = Trace(ActorStore.from_columns(rider_ids, rider_coordinates,
+                                          patience, driver_ids,
+                                          driver_coordinates, speeds))
+    trace.timestamps, trace.kinds, trace.actors = timestamps, kinds, actors
+    trace.parse_seconds = time.perf_counter() - start
+    return trace
+
+
+class _ColumnReader:
+    """ Reads consecutive padded columns out of a binary trace.
+    === Private Attributes ===
+    @type _buffer: memoryview
+        The whole trace file.
+    @type _offset: int
+        Where the next column starts.
+    """
+
+    def __init__(self, buffer, offset):
+        """ Initialize a reader of <buffer> starting at <offset>.
+        @type self: _ColumnReader
+        @type buffer: memoryview
+        @type offset: int
+        @rtype: None
+        """
+        self._buffer, self._offset = buffer, offset
+
+    def take(self, typecode, count):
+        """ Return the next column, of <count> items of type <typecode>, as
+        a view into the buffer where the byte order allows.
+        @type self: _ColumnReader
+        @type typecode: str
+        @type count: int
+        @rtype: memoryview | array
+        """
+        size = struct.calcsize(typecode) * count
+        column = view_column(self._buffer[self._offset:self._offset + size],
+                             typecode)
+        self._offset += _padded(size)
+        return column
+
+
+class _IdColumn:
+    """ A read-only sequence of actor ids decoded on demand from a binary
+    trace.
+    === Private Attributes ===
+    @type _blob: memoryview
+        The UTF-8 ids, one after the other.
+    @type _offsets: memoryview
+        Where each id starts in _blob, plus where the last one ends.
+    """
+
+    def __init__(self, blob, offsets):
+        """ Initialize an _IdColumn.
+        @type self: _IdColumn
+        @type blob: memoryview
+        @type offsets: memoryview
+        @rtype: None
+        """
+        self._blob, self._offsets = blob, offsets
+
+    def __len__(self):
+        """ Return the number of ids.
+        @type self: _IdColumn
+        @rtype: int
+        """
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        """ Return id number <index>.
+        @type self: _IdColumn
+        @type index: int
+        @rtype: str
+        """
+        return str(self._blob[self._offsets[index]:self._offsets[index + 1]],
+                   "utf-8")
+
+
+def _encode_ids(identifiers):
+    """ Return the id offsets and the UTF-8 id blob for <identifiers>.
+    @type identifiers: list[str]
+    @rtype: tuple[array, bytes]
+    >>> _encode_ids(["Tom", "Al"])
+    (array('q', [0, 3, 5]), b'TomAl')
+    """
+    encoded = [identifier.encode("utf-8") for identifier in identifiers]
+    offsets = array("q", [0])
+    for identifier in encoded:
+        offsets.append(offsets[-1] + len(identifier))
+    return offsets, b"".join(encoded)
+
+
+def _padded(size):
+    """ Return <size> rounded up to a multiple of 8.
+    @type size: int
+    @rtype: int
+    >>> _padded(9)
+    16
+    """
+    return (size + 7) // 8 * 8
+
+
+def _write_padded(file, data):
+    """ Write <data> to <file>, padded with zeros to a multiple of 8 bytes.
+    @type file: file
+    @type data: bytes
+    @rtype: None
+    """
+    file.write(data)
+    file.write(bytes(_padded(len(data)) - len(data)))
+
+
+if __name__ == "__main__":
+    # python traces.py convert TEXT BINARY
+    # python traces.py TRACE...    (report parse throughput)
+    if len(sys.argv) == 4 and sys.argv[1] == "convert":
+        print("{}: {} requests".format(sys.argv[3],
+                                       convert_trace(sys.argv[2],
+                                                     sys.argv[3])))
+    else:
+        for path in sys.argv[1:]:
+            loaded = open_trace(path)
+            if loaded.lines == 0:
+                print("{}: {} requests mapped in {:.3f}s".format(
+                    path, len(loaded), loaded.parse_seconds))
+            else:
+                print("{}: {} requests from {} lines in {:.3f}s "
+                      "({:,.0f} lines/s)".format(
+                          path, len(loaded), loaded.lines,
+                          loaded.parse_seconds, loaded.throughput()))
@@ -0,0 +1,332 @@
+"""
+The workload module generates synthetic event traces, so the simulation
+can be run on traces of any size.
+
+A Workload describes a city and its demand. Every driver of the fleet
+requests a rider at time 0, from a random intersection. Riders then
+request drivers at the times of a Poisson process whose rate follows a
+time-of-day profile: the profile is cut into equal slices of a period of
+time, and the rate during a slice is the workload's rate times the
+slice's value. Riders' origins are drawn around hotspots, or anywhere on
+the grid, and their destinations anywhere on the grid.
+
+Requests are generated in time order and written as they are generated,
+in the text format read by create_event_list or in the binary format of
+the traces module, so a trace never has to fit in memory.
+
+Speeds and patiences are drawn from distributions, which are either a
+sequence of values, one of which is chosen at random (a value listed
+twice is twice as likely), or a function that is given the workload's
+random.Random and returns a value.
+
+Everything is drawn from a random.Random seeded with the workload's seed,
+so a workload always generates the same trace.
+=== Constants ===
+@type DEFAULT_PROFILE: tuple[float]
+    Hourly demand of a day, with a morning and an evening peak.
+"""
+import random
+import sys
+from itertools import accumulate
+from math import exp
+
+from traces import TraceWriter
+
+DEFAULT_PROFILE = (0.3, 0.2, 0.15, 0.15, 0.2, 0.4, 0.8, 1.5, 1.8, 1.2, 1.0,
+                   1.0, 1.1, 1.0, 1.0, 1.1, 1.3, 1.7, 1.9, 1.5, 1.2, 1.0,
+                   0.8, 0.5)
+
+# The number of text lines written at once
+_LINES_PER_WRITE = 1 << 14
+
+
+class Workload:
+    """ A synthetic workload.
+    === Attributes ===
+    @type rows: int
+        The number of rows of the grid. Rows are numbered from 1.
+    @type columns: int
+        The number of columns of the grid. Columns are numbered from 1.
+    @type fleet_size: int
+        The number of drivers.
+    @type rate: float
+        The average number of rider requests per time unit, when the
+        profile's value is 1.
+    @type profile: tuple[float]
+        The relative demand in each slice of the period.
+    @type period: int
+        The length of the profile, in time units. The profile repeats after
+        each period.
+    @type hotspots: list[(int, int, float, float)]
+        The row, column, spread and weight of each hotspot. An origin drawn
+        around a hotspot is normally distributed around its intersection,
+        with a standard deviation of its spread, and each hotspot is picked
+        in proportion to its weight.
+    @type hotspot_share: float
+        The probability that a rider's origin is drawn around a hotspot
+        rather than anywhere on the grid.
+    @type speeds: list[int] | range | (random.Random) -> int
+        The distribution of driver speeds.
+    @type patience: list[int] | range | (random.Random) -> int
+        The distribution of rider patience.
+    @type seed: int
+        The seed of the random numbers.
+    === Private Attributes ===
+    @type _cumulative_weights: list[float]
+        The running totals of the hotspots' weights.
+    """
+
+    def __init__(self, rows=100, columns=100, fleet_size=100, rate=1.0,
+                 profile=DEFAULT_PROFILE, period=1440, hotspots=(),
+                 hotspot_share=0.5, speeds=range(1, 4),
+                 patience=range(5, 31), seed=0):
+        """ Initialize a Workload.
+        @type self: Workload
+        @type rows: int
+        @type columns: int
+        @type fleet_size: int
+        @type rate: float
+        @type profile: tuple[float]
+        @type period: int
+        @type hotspots: list[(int, int, float, float)]
+        @type hotspot_share: float
+        @type speeds: list[int] | range | (random.Random) -> int
+        @type patience: list[int] | range | (random.Random) -> int
+        @type seed: int
+        @rtype: None
+        """
+        if rate < 0 or min(profile) < 0:
+            raise ValueError("Demand rates must not be negative")
+        self.rows = rows
+        self.columns = columns
+        self.fleet_size = fleet_size
+        self.rate = rate
+        self.profile = tuple(profile)
+        self.period = period
+        self.hotspots = list(hotspots)
+        self.hotspot_share = hotspot_share if self.hotspots else 0.0
+        self._cumulative_weights = list(
+            accumulate(spot[3] for spot in self.hotspots))
+        self.speeds = speeds
+        self.patience = patience
+        self.seed = seed
+
+    def requests(self, duration):
+        """ Yield the requests made before time <duration>, in time order.
+        A DriverRequest is yielded as the tuple
+        ("DriverRequest", timestamp, id, location, speed), and a
+        RiderRequest as the tuple
+        ("RiderRequest", timestamp, id, origin, destination, patience).
+        @type self: Workload
+        @type duration: int
+        @rtype: generator
+        >>> workload = Workload(rows=5, columns=5, fleet_size=1, rate=0.5,
+        ...                     profile=(1.0,))
+        >>> for request in workload.requests(10):
+        ...     print(request)
+        ('DriverRequest', 0, 'D1', (4, 4), 1)
+        ('RiderRequest', 6, 'R1', (3, 4), (3, 5), 28)
+        ('RiderRequest', 7, 'R2', (1, 5), (3, 5), 30)
+        >>> requests = list(Workload(rate=2.0).requests(1440))
+        >>> all(requests[i][1] <= requests[i + 1][1]
+        ...     for i in range(len(requests) - 1))
+        True
+        """
+        rng = random.Random(self.seed)
+        speed = _sampler(self.speeds, rng)
+        patience = _sampler(self.patience, rng)
+        location = self._uniform_location
+        for number in range(1, self.fleet_size + 1):
+            yield ("DriverRequest", 0, "D{}".format(number), location(rng),
+                   speed())
+        if self.rate == 0 or max(self.profile) == 0:
+            return
+        # A Poisson process of the highest rate, thinned to the rate of
+        # the slice of the profile each arrival falls in
+        slices = len(self.profile)
+        peak = self.rate * max(self.profile)
+        acceptance = [value / max(self.profile) for value in self.profile]
+        slice_length = self.period / slices
+        origin = self._origin
+        number = 0
+        time = rng.expovariate(peak)
+        while time < duration:
+            if rng.random() < acceptance[int(time / slice_length) % slices]:
+                number += 1
+                yield ("RiderRequest", int(time), "R{}".format(number),
+                       origin(rng), location(rng), patience())
+            time += rng.expovariate(peak)
+
+    def expected_riders(self, duration):
+        """ Return the expected number of rider requests made before time
+        <duration>.
+        @type self: Workload
+        @type duration: int
+        @rtype: float
+        >>> Workload(rate=2.0, profile=(1.0, 0.0), period=10) \\
+        ...     .expected_riders(25)
+        30.0
+        """
+        slices = len(self.profile)
+        slice_length = self.period / slices
+        total = 0.0
+        start = 0.0
+        index = 0
+        while start < duration:
+            end = min(start + slice_length, duration)
+            total += self.profile[index % slices] * (end - start)
+            start += slice_length
+            index += 1
+        return total * self.rate
+
+    def _uniform_location(self, rng):
+        """ Return an intersection anywhere on the grid.
+        @type self: Workload
+        @type rng: random.Random
+        @rtype: (int, int)
+        """
+        return rng.randint(1, self.rows), rng.randint(1, self.columns)
+
+    def _origin(self, rng):
+        """ Return the origin of a rider.
+        @type self: Workload
+        @type rng: random.Random
+        @rtype: (int, int)
+        """
+        if rng.random() >= self.hotspot_share:
+            return self._uniform_location(rng)
+        row, column, spread, _ = rng.choices(
+            self.hotspots, cum_weights=self._cumulative_weights)[0]
+        row = min(max(round(rng.gauss(row, spread)), 1), self.rows)
+        column = min(max(round(rng.gauss(column, spread)), 1), self.columns)
+        return row, column
+
+
+def write_text(workload, duration, filename):
+    """ Write the requests of <workload> made before time <duration> to the
+    text trace <filename>, and return the number of requests written.
+    @type workload: Workload
+    @type duration: int
+    @type filename: str
+    @rtype: int
+    >>> import os, tempfile
+    >>> from event import create_event_list
+    >>> filename = os.path.join(tempfile.mkdtemp(), "workload.txt")
+    >>> workload = Workload(rows=5, columns=5, fleet_size=1, rate=0.5,
+    ...                     profile=(1.0,))
+    >>> write_text(workload, 10, filename)
+    3
+    >>> [str(event) for event in create_event_list(filename)]
+    ['0 -- D1: Request a rider', '6 -- R1: Request a driver', \
+'7 -- R2: Request a driver']
+    """
+    count = 0
+    lines = []
+    with open(filename, "w") as file:
+        for request in workload.requests(duration):
+            if request[0] == "RiderRequest":
+                _, timestamp, identifier, origin, destination, patience = \
+                    request
+                lines.append("{} RiderRequest {} {},{} {},{} {}\n".format(
+                    timestamp, identifier, origin[0], origin[1],
+                    destination[0], destination[1], patience))
+            else:
+                _, timestamp, identifier, location, speed = request
+                lines.append("{} DriverRequest {} {},{} {}\n".format(
+                    timestamp, identifier, location[0], location[1], speed))
+            if len(lines) == _LINES_PER_WRITE:
+                file.writelines(lines)
+                count += len(lines)
+                lines = []
+        file.writelines(lines)
+    return count + len(lines)
+
+
+def write_binary(workload, duration, filename):
+    """ Write the requests of <workload> made before time <duration> to the
+    binary trace <filename>, and return the number of requests written.
+    @type workload: Workload
+    @type duration: int
+    @type filename: str
+    @rtype: int
+    >>> import os, tempfile
+    >>> from traces import convert_trace
+    >>> directory = tempfile.mkdtemp()
+    >>> workload = Workload(fleet_size=20, rate=0.5,
+    ...                     hotspots=[(20, 30, 3.0, 2.0), (70, 70, 5.0, 1.0)])
+    >>> write_text(workload, 1000, os.path.join(directory, "a.txt"))
+    445
+    >>> convert_trace(os.path.join(directory, "a.txt"),
+    ...               os.path.join(directory, "a.bin"))
+    445
+    >>> write_binary(workload, 1000, os.path.join(directory, "b.bin"))
+    445
+    >>> def read(name):
+    ...     with open(os.path.join(directory, name), "rb") as file:
+    ...         return file.read()
+    >>> read("a.bin") == read("b.bin")
+    True
+    """
+    count = 0
+    writer = TraceWriter(filename)
+    for request in workload.requests(duration):
+        if request[0] == "RiderRequest":
+            writer.add_rider(*request[1:])
+        else:
+            writer.add_driver(*request[1:])
+        count += 1
+    writer.close()
+    return count
+
+
+def _sampler(distribution, rng):
+    """ Return a function that draws a value from <distribution> with
+    <rng>.
+    @type distribution: list[int] | range | (random.Random) -> int
+    @type rng: random.Random
+    @rtype: () -> int
+    """
+    if callable(distribution):
+        return lambda: distribution(rng)
+    values = list(distribution)
+    return lambda: values[int(rng.random() * len(values))]
+
+
+def poisson(mean):
+    """ Return a distribution of the number of events of a Poisson process
+    with <mean> events, for use as a Workload's speeds or patience.
+    Zeros are drawn again, so every value is positive.
+    @type mean: float
+    @rtype: (random.Random) -> int
+    >>> draw = poisson(10)
+    >>> rng = random.Random(1)
+    >>> values = [draw(rng) for _ in range(1000)]
+    >>> min(values) > 0, 9.5 < sum(values) / len(values) < 10.5
+    (True, True)
+    """
+    limit = exp(-mean)
+
+    def draw(rng):
+        value = 0
+        while value == 0:
+            product = rng.random()
+            while product > limit:
+                value += 1
+                product *= rng.random()
+        return value
+    return draw
+
+
+if __name__ == "__main__":
+    # python workload.py OUTPUT DURATION [NAME=VALUE...]
+    # NAME is rows, columns, fleet_size, rate, period or seed; the trace is
+    # binary if OUTPUT ends in .bin
+    settings = {}
+    for argument in sys.argv[3:]:
+        name, _, value = argument.partition("=")
+        settings[name] = float(value) if name == "rate" else int(value)
+    output, length = sys.argv[1], int(sys.argv[2])
+    write = write_binary if output.endswith(".bin") else write_text
+    print("{}: {} requests".format(output,
+                                   write(Workload(**settings), length,
+                                         output)))